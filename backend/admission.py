@@ -0,0 +1,119 @@
+"""Per-route admission control.
+
+Each configured route prefix gets a concurrency limit and a bounded wait
+queue. Requests that cannot be admitted in time are rejected with 503, or,
+for degradable routes, passed through with ``request.state.admission_degraded``
+set so the endpoint can serve a cheap fallback instead.
+"""
+
+import asyncio
+import json
+from collections import deque
+from metrics import inc, register_gauge
+
+
+class AdmissionGate:
+    """Concurrency limit with a bounded FIFO wait queue (``max_queue=None``: unbounded).
+
+    A released slot is handed straight to the oldest waiter, whose future is
+    resolved in the same step, so a timeout can never strand a slot: a waiter
+    either was handed one (and keeps it) or was not. Waiter futures are
+    created on the running loop at acquire time, so a gate is not tied to the
+    event loop that first used it.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int | None, queue_timeout: float, degradable: bool = False):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.degradable = degradable
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            return True
+        if self.max_queue is not None and len(self._waiters) >= self.max_queue:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            # handed a slot just as the timeout fired: it is ours
+            return waiter.done() and not waiter.cancelled()
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # the slot passes to the waiter; in_flight is unchanged
+                return
+        self.in_flight -= 1
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, app, limits: dict[str, dict]):
+        self.app = app
+        self.gates = {prefix: AdmissionGate(**opts) for prefix, opts in limits.items()}
+        register_gauge("admission_in_flight", lambda: [({"route": p}, g.in_flight) for p, g in self.gates.items()],
+                       "Requests admitted and still running, per gated route")
+        register_gauge("admission_waiting", lambda: [({"route": p}, g.waiting) for p, g in self.gates.items()],
+                       "Requests queued for admission, per gated route")
+
+    def _match(self, path: str) -> tuple[str, AdmissionGate] | tuple[None, None]:
+        for prefix, gate in self.gates.items():
+            if path == prefix or path.startswith(prefix + "/"):
+                return prefix, gate
+        return None, None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        prefix, gate = self._match(scope["path"])
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await gate.acquire():
+            inc("admission_rejected_total", route=prefix)
+            if gate.degradable:
+                scope.setdefault("state", {})["admission_degraded"] = True
+                await self.app(scope, receive, send)
+            else:
+                await self._reject(send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
+
+    @staticmethod
+    async def _reject(send):
+        body = json.dumps({"detail": "Server busy, please retry"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"retry-after", b"1"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
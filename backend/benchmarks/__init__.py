@@ -0,0 +1 @@
+"""Benchmarks run against a synthetic, deterministic data set (see synthetic.py)."""
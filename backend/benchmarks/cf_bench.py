@@ -0,0 +1,150 @@
+"""
+Training throughput and ranking quality of the implicit ALS model.
+
+Generates a deterministic watched table with taste structure. Movies belong
+to --clusters clusters. Each user prefers three clusters and draws 70% of
+their watches from those; the rest are drawn by global popularity. Within
+any pool, popularity is long-tailed. One watch per user is held out, and the
+model is trained on the rest once per --workers value. The benchmark
+reports:
+
+  - seconds per ALS iteration and in total
+  - hit_rate: share of --eval-users whose held-out movie is in the top
+    --limit of their folded-in CF scores (movies they watched excluded),
+    against the same measure for a most-popular ranking
+  - serve_ms: median time to fold in a user and score every movie, i.e.
+    what hybrid recommend() adds per request
+
+Usage (from backend/):
+    python -m benchmarks.cf_bench --users 200000 --ratings-per-user 25 --workers 1,4
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+
+from benchmarks.engine_bench import _int_list
+from services.collaborative import CollaborativeModel, interaction_matrix, train_als
+
+
+def generate_watched(n_users, n_movies, per_user, n_clusters, seed):
+    """(user_ids, movie_ids, ratings) with unique (user, movie) pairs."""
+    rng = np.random.default_rng(seed)
+    n = n_users * per_user
+    users = np.repeat(np.arange(n_users), per_user)
+    tastes = rng.integers(0, n_clusters, (n_users, 3))
+    cluster = np.where(
+        rng.random(n) < 0.7,
+        tastes[users, rng.integers(0, 3, n)],
+        rng.integers(0, n_clusters, n),
+    )
+    # movie m is in cluster m % n_clusters; rank within a cluster is Zipf-like
+    per_cluster = n_movies // n_clusters
+    rank = np.minimum(rng.zipf(1.3, n) - 1, per_cluster - 1)
+    movies = cluster + n_clusters * rank
+    pairs = np.unique(users * n_movies + movies)
+    ratings = rng.integers(1, 11, len(pairs))
+    return pairs // n_movies, pairs % n_movies, ratings
+
+
+def hold_out(users, movies, ratings, seed):
+    """Split off one random watch per user with at least two."""
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(len(users)), users))
+    first = np.ones(len(users), dtype=bool)
+    first[1:] = users[order][1:] != users[order][:-1]
+    counts = np.bincount(users)
+    test = order[first & (counts[users[order]] > 1)]
+    train = np.ones(len(users), dtype=bool)
+    train[test] = False
+    return train, test
+
+
+def _hit(ranking, watched, target, limit) -> bool:
+    ranking = ranking.astype(np.float64)
+    ranking[watched] = -np.inf
+    return target in np.argpartition(-ranking, limit)[:limit]
+
+
+def evaluate(model, interactions, user_index, test_users, test_movies, limit):
+    popularity = np.diff(interactions.tocsc().indptr).astype(np.float64)
+    cf_hits, pop_hits, times = 0, 0, []
+    for user, movie in zip(test_users, test_movies):
+        row = interactions[user_index[user]]
+        ratings = (row.data - 1) / model.alpha * 10  # back from confidence
+        start = time.perf_counter()
+        scores = model.scores(row.indices, ratings)
+        times.append(time.perf_counter() - start)
+        target = model.item_index([movie])[0]  # -1 (a miss) if only watched by this user
+        cf_hits += _hit(scores, row.indices, target, limit)
+        pop_hits += _hit(popularity, row.indices, target, limit)
+    n = len(test_users)
+    return round(cf_hits / n, 4), round(pop_hits / n, 4), round(float(np.median(times)) * 1000, 3)
+
+
+def run(args):
+    users, movies, ratings = generate_watched(args.users, args.movies, args.ratings_per_user, args.clusters, args.seed)
+    train, test = hold_out(users, movies, ratings, args.seed + 1)
+    interactions, user_ids, movie_ids = interaction_matrix(users[train], movies[train], ratings[train], args.alpha)
+    print(f"{interactions.nnz:,} training ratings, {len(user_ids):,} users, {len(movie_ids):,} movies")
+
+    rng = np.random.default_rng(args.seed + 2)
+    sample = rng.choice(test, size=min(args.eval_users, len(test)), replace=False)
+    user_index = {int(u): i for i, u in enumerate(user_ids)}
+
+    results = []
+    for workers in args.workers:
+        times = []
+        start = time.perf_counter()
+        _, item_factors = train_als(
+            interactions, factors=args.factors, regularization=args.regularization,
+            iterations=args.iterations, cg_steps=args.cg_steps, workers=workers, seed=args.seed,
+            on_iteration=lambda i, seconds: times.append(seconds),
+        )
+        total = time.perf_counter() - start
+        model = CollaborativeModel(item_factors, movie_ids, args.regularization, args.alpha)
+        cf, pop, serve_ms = evaluate(model, interactions, user_index, users[sample], movies[sample], args.limit)
+        record = {
+            "workers": workers,
+            "ratings": int(interactions.nnz),
+            "factors": args.factors,
+            "iteration_s": round(float(np.median(times)), 3),
+            "total_s": round(total, 2),
+            f"hit_rate@{args.limit}": cf,
+            f"popular_hit_rate@{args.limit}": pop,
+            "serve_ms": serve_ms,
+        }
+        results.append(record)
+        print(f"  workers={workers}: {record['iteration_s']}s/iteration, {record['total_s']}s total, "
+              f"hit rate@{args.limit} {cf} (popular {pop}), serve {serve_ms} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--movies", type=int, default=20_000)
+    parser.add_argument("--ratings-per-user", type=int, default=20)
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--factors", type=int, default=64)
+    parser.add_argument("--iterations", type=int, default=15)
+    parser.add_argument("--cg-steps", type=int, default=3)
+    parser.add_argument("--regularization", type=float, default=0.05)
+    parser.add_argument("--alpha", type=float, default=20.0)
+    parser.add_argument("--workers", type=_int_list, default=[1], help="thread counts to compare")
+    parser.add_argument("--eval-users", type=int, default=2000, help="held-out users scored")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    report = {"config": {k: v for k, v in vars(args).items() if k != "output"}, "results": run(args)}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
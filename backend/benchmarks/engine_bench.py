@@ -0,0 +1,201 @@
+"""
+Micro-benchmark and memory profile of RecommendationEngine.
+
+Builds deterministic random feature matrices shaped like the real one
+(genre, keyword, language and decade blocks, each l2-normalized) directly in
+memory, so catalogs of a million rows need no pipeline run, then times
+``recommend`` and ``explain`` over a grid of catalog sizes, watched-history
+lengths, exclusion-set sizes and limits. Each case records median/p95/min
+wall time over --repeat calls and the tracemalloc peak of one extra call.
+
+Engine modes are compared on identical inputs: every mode in --shard-rows
+(0 = one unsharded matrix), --workers and --precision is run against the
+same matrix, histories and exclusions. The JSON written by --output is one flat record
+per case, easy to load into pandas and diff between commits.
+
+Usage (from backend/):
+    python -m benchmarks.engine_bench --catalog-sizes 50000,200000 \\
+        --history 1,100,10000 --shard-rows 0,50000 --output engine.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import time
+import tracemalloc
+import numpy as np
+from scipy.sparse import csr_matrix, hstack
+
+from benchmarks.synthetic import GENRES, LANGUAGES
+from services.recommendation_service import RecommendationEngine
+
+# (name, columns, non-zeros per row, default weight) like 03_build_features.py
+BLOCKS = [
+    ("genres", len(GENRES), 3, 3.0),
+    ("keywords", 5_000, 8, 2.0),
+    ("language", len(LANGUAGES), 1, 2.0),
+    ("decade", 11, 1, 1.5),
+]
+DECADES = [f"{1920 + 10 * i}s" for i in range(11)]
+
+
+def _int_list(text):
+    return [int(x) for x in text.split(",") if x]
+
+
+def _block(rng, n_rows, n_cols, per_row):
+    """Random l2-normalized CSR block with long-tailed column popularity."""
+    p = np.arange(1, n_cols + 1, dtype=np.float64) ** -1.1
+    cols = rng.choice(n_cols, size=n_rows * per_row, p=p / p.sum())
+    rows = np.repeat(np.arange(n_rows), per_row)
+    data = rng.random(n_rows * per_row) + 0.1
+    block = csr_matrix((data, (rows, cols)), shape=(n_rows, n_cols))
+    block.sum_duplicates()
+    norms = np.sqrt(np.asarray(block.multiply(block).sum(axis=1)).ravel())
+    block.data /= np.repeat(norms, np.diff(block.indptr))
+    return block
+
+
+def build_matrix(n_rows, seed):
+    rng = np.random.default_rng(seed)
+    matrix = hstack([_block(rng, n_rows, n_cols, per_row) for _, n_cols, per_row, _ in BLOCKS], format="csr")
+    movie_ids = rng.permutation(n_rows * 2)[:n_rows].astype(np.int64)
+    return matrix, movie_ids
+
+
+def build_engine(matrix, movie_ids, shard_rows, workers, precision="float64"):
+    if shard_rows:
+        shards = [matrix[i:i + shard_rows] for i in range(0, matrix.shape[0], shard_rows)]
+    else:
+        shards = [matrix]
+    block_columns = [(name, n_cols, weight) for name, n_cols, _, weight in BLOCKS]
+    return RecommendationEngine.from_arrays(shards, movie_ids, block_columns, workers, precision)
+
+
+def explain_inputs(rng, n_movies):
+    """Movie metadata strings and a user profile, as the router passes them."""
+    genres = np.array(GENRES, dtype=object)
+    movies = [
+        {
+            "movie_genres": ", ".join(rng.choice(genres, 3, replace=False)),
+            "movie_keywords": ", ".join(f"keyword {k}" for k in rng.integers(0, 500, 8)),
+            "movie_language": str(rng.choice(LANGUAGES)),
+            "movie_release_date": f"{rng.integers(1920, 2030)}-01-01",
+        }
+        for _ in range(n_movies)
+    ]
+    profile = {
+        "user_top_genres": list(rng.choice(genres, 5, replace=False)),
+        "user_top_keywords": [f"keyword {k}" for k in rng.integers(0, 500, 15)],
+        "user_languages": list(rng.choice(LANGUAGES, 2, replace=False)),
+        "user_decades": list(rng.choice(DECADES, 3, replace=False)),
+    }
+    return movies, profile
+
+
+def measure(fn, repeat):
+    """Wall-time stats over ``repeat`` calls plus the tracemalloc peak of one more."""
+    fn()  # warm caches and lazily built state
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    # traced separately: tracemalloc slows allocation-heavy code several-fold
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    ms = np.array(times) * 1000
+    return {
+        "median_ms": round(float(np.median(ms)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "min_ms": round(float(ms.min()), 4),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run(args):
+    results = []
+    for n_rows in args.catalog_sizes:
+        print(f"Building a {n_rows:,}-row catalog...")
+        matrix, movie_ids = build_matrix(n_rows, args.seed)
+        rng = np.random.default_rng(args.seed + 1)
+        histories = {h: rng.choice(movie_ids, size=min(h, n_rows), replace=False) for h in args.history}
+        ratings = {h: rng.integers(1, 11, len(ids)).tolist() for h, ids in histories.items()}
+        extra_excludes = {e: set(rng.choice(movie_ids, size=min(e, n_rows), replace=False).tolist())
+                          for e in args.exclude}
+
+        modes = [(s, w, p) for s in args.shard_rows for w in args.workers for p in args.precision
+                 # the pool only exists for multi-shard catalogs
+                 if w == 1 or (s and s < n_rows)]
+        for shard_rows, workers, precision in modes:
+            engine = build_engine(matrix, movie_ids, shard_rows, workers, precision)
+            mode = {"shard_rows": shard_rows, "n_shards": engine.n_shards, "workers": workers,
+                    "precision": precision, "engine_mib": round(engine.nbytes / 2**20, 1)}
+            for h, watched in histories.items():
+                watched_list = watched.tolist()
+                for e, extra in extra_excludes.items():
+                    # like the router: watched and watchlist movies are excluded
+                    exclude_ids = set(watched_list) | extra
+                    for limit in args.limits:
+                        stats = measure(
+                            lambda: engine.recommend(watched_list, ratings[h], exclude_ids, limit),
+                            args.repeat,
+                        )
+                        results.append({"op": "recommend", "catalog": n_rows, **mode, "history": h,
+                                        "exclude": len(exclude_ids), "limit": limit, **stats})
+                        print(f"  recommend shards={engine.n_shards} workers={workers} {precision} history={h} "
+                              f"exclude={len(exclude_ids)} limit={limit}: {stats['median_ms']} ms, "
+                              f"{stats['peak_kib']} KiB")
+            if engine._pool is not None:
+                engine._pool.shutdown()
+
+    # explain depends only on the result list, not on the catalog
+    engine = build_engine(*build_matrix(100, args.seed), 0, 1)
+    rng = np.random.default_rng(args.seed)
+    for limit in args.limits:
+        movies, profile = explain_inputs(rng, limit)
+        stats = measure(lambda: [engine.explain(**m, **profile) for m in movies], args.repeat)
+        results.append({"op": "explain", "limit": limit, **stats})
+        print(f"  explain limit={limit}: {stats['median_ms']} ms, {stats['peak_kib']} KiB")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--catalog-sizes", type=_int_list, default=[50_000, 200_000, 1_000_000])
+    parser.add_argument("--history", type=_int_list, default=[1, 10, 100, 1_000, 10_000],
+                        help="watched movies per profile")
+    parser.add_argument("--exclude", type=_int_list, default=[0, 1_000],
+                        help="excluded movies on top of the watched history")
+    parser.add_argument("--limits", type=_int_list, default=[20, 100])
+    parser.add_argument("--shard-rows", type=_int_list, default=[0, 100_000],
+                        help="engine modes to compare; 0 means one unsharded matrix")
+    parser.add_argument("--workers", type=_int_list, default=[1, 4], help="shard scoring threads")
+    parser.add_argument("--precision", type=lambda t: t.split(","), default=["float64"],
+                        help="feature storage precisions to compare (float64,float16,int8)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": run(args),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
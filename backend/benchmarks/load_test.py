@@ -0,0 +1,278 @@
+"""
+In-process load test of the API against the synthetic benchmark data set.
+
+Generates (or reuses) a deterministic catalog, feature matrix and user
+histories in --data-dir, then drives the FastAPI app in-process through
+httpx's ASGI transport with a seeded, concurrent mix of search, popular,
+movie detail, watched writes, recommendations and analytics requests.
+Writes throughput and p50/p95/p99 latency per endpoint as JSON, and with
+--baseline compares them against a previous run's JSON.
+
+Each run works on a fresh copy of the database, so watched writes from one
+run never leak into the next and repeated runs see identical data.
+
+Usage (from backend/):
+    python -m benchmarks.load_test --movies 20000 --users 200 --requests 5000 \\
+        --concurrency 32 --output bench.json --baseline baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+import numpy as np
+
+from benchmarks.synthetic import TITLE_WORDS, build_data_dir
+
+DEFAULT_DATA_DIR = Path(tempfile.gettempdir()) / "cinematch-benchmark"
+DEFAULT_MIX = {
+    "search": 20,
+    "popular": 10,
+    "movie_detail": 25,
+    "watched_write": 10,
+    "recommendations": 20,
+    "analytics": 15,
+}
+PERCENTILES = [50, 95, 99]
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    """Parse ``search=20,popular=10`` into endpoint weights."""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r}; choose from {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight)
+    return mix
+
+
+def load_user_lists(db_path) -> dict[int, set[int]]:
+    """Movie ids already on each user's watched list or watchlist."""
+    conn = sqlite3.connect(db_path)
+    lists = defaultdict(set)
+    for table in ["watched", "watchlist"]:
+        for user_id, movie_id in conn.execute(f"SELECT user_id, movie_id FROM {table}"):
+            lists[user_id].add(movie_id)
+    conn.close()
+    return lists
+
+
+def build_plan(rng, n_requests, mix, movie_ids, user_ids, user_lists):
+    """Seeded list of (endpoint, method, url, json body, user id)."""
+    names = list(mix)
+    weights = np.array([mix[name] for name in names], dtype=np.float64)
+    endpoints = rng.choice(names, size=n_requests, p=weights / weights.sum())
+    users = rng.choice(user_ids, size=n_requests)
+    # detail and write targets follow popularity rank, like real traffic
+    ranks = np.arange(1, len(movie_ids) + 1, dtype=np.float64) ** -0.9
+    popular_picks = rng.choice(movie_ids, size=n_requests, p=ranks / ranks.sum())
+
+    plan = []
+    for i, (endpoint, user_id) in enumerate(zip(endpoints, users)):
+        user_id = int(user_id)
+        if endpoint == "search":
+            q = str(rng.choice(TITLE_WORDS))
+            plan.append((endpoint, "GET", f"/api/movies/search?q={q}&limit=20", None, user_id))
+        elif endpoint == "popular":
+            plan.append((endpoint, "GET", f"/api/movies/popular?page={rng.integers(1, 6)}", None, user_id))
+        elif endpoint == "movie_detail":
+            plan.append((endpoint, "GET", f"/api/movies/{int(popular_picks[i])}", None, user_id))
+        elif endpoint == "watched_write":
+            # a movie this user has not listed yet, so the insert never conflicts
+            listed = user_lists[user_id]
+            movie_id = int(popular_picks[i])
+            while movie_id in listed:
+                movie_id = int(rng.choice(movie_ids))
+            listed.add(movie_id)
+            body = {"movie_id": movie_id, "rating": int(rng.integers(1, 11))}
+            plan.append((endpoint, "POST", "/api/watched", body, user_id))
+        elif endpoint == "recommendations":
+            plan.append((endpoint, "GET", "/api/recommendations", None, user_id))
+        elif endpoint == "analytics":
+            plan.append((endpoint, "GET", "/api/analytics/summary", None, user_id))
+    return plan
+
+
+def summarize(latencies, statuses, fallbacks, wall_seconds) -> dict:
+    endpoints = {}
+    for name, values in sorted(latencies.items()):
+        ms = np.array(values) * 1000
+        codes = statuses[name]
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": sum(1 for code in codes if code >= 400),
+            "throughput_rps": round(len(values) / wall_seconds, 2),
+            "mean_ms": round(float(ms.mean()), 3),
+            "max_ms": round(float(ms.max()), 3),
+            **{f"p{p}_ms": round(float(np.percentile(ms, p)), 3) for p in PERCENTILES},
+        }
+        if name == "recommendations":
+            endpoints[name]["fallbacks"] = fallbacks
+    all_ms = np.concatenate([np.array(v) for v in latencies.values()]) * 1000
+    overall = {
+        "requests": int(len(all_ms)),
+        "errors": sum(e["errors"] for e in endpoints.values()),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(all_ms) / wall_seconds, 2),
+        **{f"p{p}_ms": round(float(np.percentile(all_ms, p)), 3) for p in PERCENTILES},
+    }
+    return {"overall": overall, "endpoints": endpoints}
+
+
+def compare(results, baseline, tolerance) -> dict:
+    """Per-endpoint ratios against a baseline run; flags changes beyond ``tolerance``."""
+    comparison = {}
+    current = {"overall": results["overall"], **results["endpoints"]}
+    previous = {"overall": baseline["results"]["overall"], **baseline["results"]["endpoints"]}
+    for name in sorted(set(current) & set(previous)):
+        ratios = {}
+        regressions = []
+        for metric in [f"p{p}_ms" for p in PERCENTILES] + ["throughput_rps"]:
+            before, after = previous[name].get(metric), current[name].get(metric)
+            if not before or after is None:
+                continue
+            ratio = after / before
+            ratios[metric] = round(ratio, 3)
+            worse = ratio < 1 - tolerance if metric == "throughput_rps" else ratio > 1 + tolerance
+            if worse:
+                regressions.append(metric)
+        comparison[name] = {"ratios": ratios, "regressions": regressions}
+    return comparison
+
+
+async def run_load(plan, concurrency, user_ids, warmup):
+    # imported here so DATA_DIR/DATABASE_URL set by main() are picked up by config
+    import httpx
+    from auth import create_access_token
+    from main import app
+
+    headers = {
+        int(uid): {"Authorization": f"Bearer {create_access_token(int(uid), f'bench_{uid}')}"}
+        for uid in user_ids
+    }
+    latencies = defaultdict(list)
+    statuses = defaultdict(list)
+    fallbacks = 0
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            async def send(request):
+                _, method, url, body, user_id = request
+                return await client.request(method, url, json=body, headers=headers[user_id])
+
+            for request in plan[:warmup]:
+                await send(request)
+
+            pending = iter(plan[warmup:])
+
+            async def worker():
+                nonlocal fallbacks
+                for request in pending:
+                    start = time.perf_counter()
+                    response = await send(request)
+                    elapsed = time.perf_counter() - start
+                    latencies[request[0]].append(elapsed)
+                    statuses[request[0]].append(response.status_code)
+                    if request[0] == "recommendations" and response.status_code == 200:
+                        fallbacks += response.json().get("fallback", False)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            wall_seconds = time.perf_counter() - start
+
+    return summarize(latencies, statuses, fallbacks, wall_seconds)
+
+
+def print_report(report):
+    endpoints = {"overall": report["results"]["overall"], **report["results"]["endpoints"]}
+    print(f"\n{'endpoint':<16}{'reqs':>7}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in endpoints.items():
+        print(f"{name:<16}{stats['requests']:>7}{stats['errors']:>8}{stats['throughput_rps']:>10}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    for name, result in report.get("comparison", {}).items():
+        if result["regressions"]:
+            ratios = ", ".join(f"{m} x{result['ratios'][m]}" for m in result["regressions"])
+            print(f"REGRESSION {name}: {ratios}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR)
+    parser.add_argument("--movies", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--history", type=int, default=100, help="watched movies per user")
+    parser.add_argument("--feature-builder", choices=["tfidf", "hashed"], default="tfidf")
+    parser.add_argument("--requests", type=int, default=5_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=100, help="requests sent before timing starts")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="endpoint weights, e.g. search=20,recommendations=40")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the JSON report here")
+    parser.add_argument("--baseline", type=Path, help="previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative change beyond which a metric counts as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit 1 if any metric regressed")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # set before anything imports config
+        db_path = Path(tmp) / "app.db"
+        os.environ["DATA_DIR"] = str(args.data_dir)
+        os.environ["DATABASE_URL"] = str(db_path)
+
+        print(f"Preparing synthetic data in {args.data_dir}...")
+        spec = build_data_dir(args.data_dir, args.movies, args.users, args.history, args.seed, args.feature_builder)
+        shutil.copy(args.data_dir / "app.db", db_path)
+
+        rng = np.random.default_rng(args.seed)
+        conn = sqlite3.connect(db_path)
+        movie_ids = np.array([r[0] for r in conn.execute("SELECT id FROM movies ORDER BY popularity DESC")])
+        user_ids = np.array([r[0] for r in conn.execute("SELECT id FROM users ORDER BY id")])
+        conn.close()
+        plan = build_plan(rng, args.requests + args.warmup, args.mix, movie_ids, user_ids, load_user_lists(db_path))
+
+        print(f"Sending {args.requests} requests ({args.warmup} warmup) with concurrency {args.concurrency}...")
+        results = asyncio.run(run_load(plan, args.concurrency, user_ids, args.warmup))
+
+    report = {
+        "spec": spec,
+        "config": {
+            "requests": args.requests, "concurrency": args.concurrency,
+            "warmup": args.warmup, "mix": args.mix, "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("spec") != spec or baseline.get("config") != report["config"]:
+            print("Warning: baseline was recorded with a different data set or traffic config")
+        report["comparison"] = compare(results, baseline, args.tolerance)
+
+    print_report(report)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\nSaved {args.output}")
+
+    regressed = any(r["regressions"] for r in report.get("comparison", {}).values())
+    if regressed and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Memory and ranking agreement of quantized feature matrices.
+
+Builds one engine per precision (float64, float16, int8) from the same
+feature matrix — the synthetic one from engine_bench, or with --artifact the
+pipeline's feature_matrix.npz / feature_shards in DATA_DIR — and compares
+each against the float64 baseline:
+
+  - engine_mib / saved_pct: catalog memory and the share saved
+  - overlap_mean / overlap_min: |top-k ∩ baseline top-k| / k over --profiles
+    random watch histories per history length
+  - same_order: share of profiles whose top-k list is identical
+  - max_score_error: largest absolute difference in reported scores for
+    movies both lists contain
+  - median_ms: recommend() latency
+
+Usage (from backend/):
+    python -m benchmarks.quantization_report --catalog-size 200000 --output quant.json
+    python -m benchmarks.quantization_report --artifact
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+
+from benchmarks.engine_bench import BLOCKS, _int_list, build_matrix
+from config import FEATURE_MATRIX_PATH, FEATURE_SHARDS_DIR, MOVIE_IDS_PATH
+from services.features import has_shards, load_feature_matrix, load_shards
+from services.quantization import PRECISIONS
+from services.recommendation_service import RecommendationEngine, _block_layout
+
+
+def artifact_inputs():
+    """(matrix, movie_ids, block_columns) from the pipeline's full-precision artifacts."""
+    if FEATURE_MATRIX_PATH.exists():
+        matrix, movie_ids = load_feature_matrix(FEATURE_MATRIX_PATH, MOVIE_IDS_PATH)
+    elif has_shards(FEATURE_SHARDS_DIR):
+        shards, movie_ids = load_shards(FEATURE_SHARDS_DIR)
+        if any(not hasattr(s, "multiply") for s in shards):
+            raise SystemExit("feature_shards/ is already quantized; rebuild it at float64 to compare")
+        matrix = shards
+    else:
+        raise SystemExit("No feature artifacts in DATA_DIR; run the pipeline or drop --artifact")
+    n_features = matrix[0].shape[1] if isinstance(matrix, list) else matrix.shape[1]
+    names, counts, weights, scale = _block_layout(n_features)
+    # from_arrays takes unweighted blocks; baked-in weights are left as stored
+    block_columns = list(zip(names, counts, (weights / scale).tolist()))
+    return matrix, movie_ids, block_columns
+
+
+def compare(baseline, engine, profiles, limit):
+    overlaps, same, errors, times = [], 0, [0.0], []
+    for watched, ratings in profiles:
+        expected = baseline.recommend(watched, ratings, set(watched), limit)
+        start = time.perf_counter()
+        got = engine.recommend(watched, ratings, set(watched), limit)
+        times.append(time.perf_counter() - start)
+        expected_scores = {r["movie_id"]: r["score"] for r in expected}
+        got_ids = [r["movie_id"] for r in got]
+        if expected:
+            overlaps.append(len(expected_scores.keys() & set(got_ids)) / len(expected))
+        same += got_ids == list(expected_scores)
+        errors += [abs(r["score"] - expected_scores[r["movie_id"]]) for r in got if r["movie_id"] in expected_scores]
+    return {
+        "overlap_mean": round(float(np.mean(overlaps)), 4) if overlaps else None,
+        "overlap_min": round(float(np.min(overlaps)), 4) if overlaps else None,
+        "same_order": round(same / len(profiles), 4),
+        "max_score_error": round(max(errors), 4),
+        "median_ms": round(float(np.median(times)) * 1000, 4),
+    }
+
+
+def run(args):
+    if args.artifact:
+        matrix, movie_ids, block_columns = artifact_inputs()
+    else:
+        matrix, movie_ids = build_matrix(args.catalog_size, args.seed)
+        block_columns = [(name, n_cols, weight) for name, n_cols, _, weight in BLOCKS]
+
+    engines = {p: RecommendationEngine.from_arrays(matrix, movie_ids, block_columns, precision=p)
+               for p in PRECISIONS}
+    baseline = engines["float64"]
+    rng = np.random.default_rng(args.seed + 1)
+    n_rows = len(movie_ids)
+    print(f"{n_rows:,} movies, {baseline.shape[1]:,} features, float64 engine {baseline.nbytes / 2**20:.1f} MiB")
+
+    results = []
+    for h in args.history:
+        profiles = [
+            (rng.choice(movie_ids, size=min(h, n_rows), replace=False).tolist(),
+             rng.integers(1, 11, min(h, n_rows)).tolist())
+            for _ in range(args.profiles)
+        ]
+        for precision, engine in engines.items():
+            record = {
+                "precision": precision,
+                "history": h,
+                "limit": args.limit,
+                "engine_mib": round(engine.nbytes / 2**20, 1),
+                "saved_pct": round(100 * (1 - engine.nbytes / baseline.nbytes), 1),
+                **compare(baseline, engine, profiles, args.limit),
+            }
+            results.append(record)
+            print(f"  {precision:8} history={h}: {record['engine_mib']} MiB ({record['saved_pct']}% saved), "
+                  f"overlap@{args.limit} {record['overlap_mean']} (min {record['overlap_min']}), "
+                  f"same order {record['same_order']:.0%}, {record['median_ms']} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--artifact", action="store_true", help="use the feature artifacts in DATA_DIR")
+    parser.add_argument("--catalog-size", type=int, default=200_000, help="synthetic catalog rows")
+    parser.add_argument("--history", type=_int_list, default=[1, 20, 200], help="watched movies per profile")
+    parser.add_argument("--profiles", type=int, default=200, help="random profiles per history length")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    report = {"config": {k: v for k, v in vars(args).items() if k != "output"}, "results": run(args)}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Synthetic, deterministic data set for benchmarks.
+
+Generates a TMDB-shaped catalog (movies_clean.parquet) from a seed, runs the
+regular pipeline stages 02-04 on it in a separate DATA_DIR, then adds users
+with watched and watchlist histories. The same seed and sizes always produce
+the same data, so runs on different commits compare like with like.
+
+Only SQL and path constants are imported from the app, so this module can be
+used before DATA_DIR is pointed at the generated directory.
+"""
+
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SCRIPTS_DIR = BACKEND_DIR / "scripts"
+
+GENRES = [
+    "Action", "Adventure", "Animation", "Comedy", "Crime", "Documentary", "Drama",
+    "Family", "Fantasy", "History", "Horror", "Music", "Mystery", "Romance",
+    "Science Fiction", "TV Movie", "Thriller", "War", "Western",
+]
+LANGUAGES = ["en", "fr", "es", "ja", "de", "ko", "it", "zh", "hi", "ru", "pt", "sv"]
+TITLE_WORDS = [
+    "The", "Last", "Night", "Star", "Love", "War", "Dark", "City", "Ghost", "Blue",
+    "Return", "Man", "Girl", "House", "River", "Secret", "Summer", "King", "Road", "Dream",
+    "Café", "Amélie", "Über", "Storm", "Shadow", "Gold", "Wild", "Silent", "Red", "Iron",
+]
+PASSWORD = "benchmark"
+
+
+def _zipf_choice(rng, n_items, size, a=1.2):
+    """Indices in [0, n_items) with a long-tailed (Zipf-like) distribution."""
+    ranks = np.arange(1, n_items + 1, dtype=np.float64)
+    p = ranks ** -a
+    return rng.choice(n_items, size=size, p=p / p.sum())
+
+
+def _join_tags(rng, vocab, counts, a):
+    picks = _zipf_choice(rng, len(vocab), int(counts.sum()), a)
+    splits = np.split(picks, np.cumsum(counts)[:-1])
+    return [", ".join(dict.fromkeys(vocab[i] for i in part)) for part in splits]
+
+
+def generate_movies(n_movies: int, n_keywords: int = 20_000, seed: int = 0) -> pd.DataFrame:
+    """A catalog with the movies_clean.parquet columns, sorted by popularity."""
+    rng = np.random.default_rng(seed)
+    keywords = np.array([f"keyword {i}" for i in range(n_keywords)], dtype=object)
+    genres = np.array(GENRES, dtype=object)
+    words = np.array(TITLE_WORDS, dtype=object)
+
+    title_parts = rng.choice(words, size=(n_movies, 3))
+    title_len = rng.integers(1, 4, n_movies)
+    titles = [" ".join(parts[:k]) + f" {i}" for i, (parts, k) in enumerate(zip(title_parts, title_len))]
+    years = rng.integers(1920, 2025, n_movies)
+    months = rng.integers(1, 13, n_movies)
+    revenue = np.where(rng.random(n_movies) < 0.6, 0, rng.lognormal(17, 2, n_movies)).astype(np.int64)
+
+    df = pd.DataFrame({
+        "id": np.arange(1, n_movies + 1, dtype=np.int64),
+        "title": titles,
+        "vote_average": rng.uniform(1, 10, n_movies).round(1),
+        "vote_count": rng.zipf(1.6, n_movies).clip(1, 50_000).astype(np.int64),
+        "release_date": [f"{y}-{m:02d}-01" for y, m in zip(years, months)],
+        "revenue": revenue,
+        "runtime": rng.integers(60, 200, n_movies).astype(np.int64),
+        "backdrop_path": "/backdrop.jpg",
+        "budget": (revenue * rng.uniform(0.2, 0.8, n_movies)).astype(np.int64),
+        "imdb_id": [f"tt{i:07d}" for i in range(1, n_movies + 1)],
+        "original_language": rng.choice(LANGUAGES, n_movies, p=_language_weights()),
+        "original_title": titles,
+        "overview": "A synthetic movie for benchmarking.",
+        "popularity": rng.lognormal(1.5, 1.2, n_movies).round(3),
+        "poster_path": "/poster.jpg",
+        "tagline": "",
+        "genres": _join_tags(rng, genres, rng.integers(1, 4, n_movies), a=0.6),
+        "production_companies": "Synthetic Pictures",
+        "spoken_languages": "English",
+        "keywords": _join_tags(rng, keywords, rng.integers(0, 9, n_movies), a=1.05),
+    })
+    return df.sort_values("popularity", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def _language_weights():
+    w = np.array([40, 8, 8, 7, 6, 6, 5, 5, 5, 4, 3, 3], dtype=np.float64)
+    return w / w.sum()
+
+
+def _run_stage(script, data_dir, *args):
+    env = dict(os.environ, DATA_DIR=str(data_dir))
+    subprocess.run([sys.executable, str(SCRIPTS_DIR / script), *args], env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+def create_users(db_path, n_users: int, history: int, seed: int = 0):
+    """Insert users with ``history`` watched and ``history // 4`` watchlist movies each.
+
+    Movies are drawn by popularity rank, so popular titles dominate like in
+    real traffic. Aggregates are rebuilt once at the end instead of through
+    the per-row triggers.
+    """
+    # imported late so the caller's DATA_DIR is in effect for config
+    from auth import hash_password
+    from database import AGGREGATES_SQL, REBUILD_AGGREGATES_SQL, SCHEMA_SQL
+
+    rng = np.random.default_rng(seed + 1)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA_SQL)
+    movie_ids = np.array([row[0] for row in conn.execute("SELECT id FROM movies ORDER BY popularity DESC")])
+    n_history = min(history + history // 4, len(movie_ids))
+    hashed = hash_password(PASSWORD)
+
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (id, username, email, hashed_password) VALUES (?, ?, ?, ?)",
+            [(i, f"bench_{i}", f"bench_{i}@example.com", hashed) for i in range(1, n_users + 1)],
+        )
+        for user_id in range(1, n_users + 1):
+            picks = np.unique(_zipf_choice(rng, len(movie_ids), n_history * 2, a=0.8))[:n_history]
+            rng.shuffle(picks)
+            watched, watchlist = movie_ids[picks[:history]], movie_ids[picks[history:]]
+            ratings = rng.integers(1, 11, len(watched))
+            conn.executemany(
+                "INSERT INTO watched (user_id, movie_id, rating, created_at) "
+                "VALUES (?, ?, ?, datetime('2024-01-01', '+' || ? || ' minutes'))",
+                [(user_id, int(m), int(r), i) for i, (m, r) in enumerate(zip(watched, ratings))],
+            )
+            conn.executemany(
+                "INSERT INTO watchlist (user_id, movie_id, added_at) "
+                "VALUES (?, ?, datetime('2024-01-01', '+' || ? || ' minutes'))",
+                [(user_id, int(m), i) for i, m in enumerate(watchlist)],
+            )
+    conn.executescript(AGGREGATES_SQL)
+    conn.executescript(REBUILD_AGGREGATES_SQL)
+    conn.close()
+
+
+def build_data_dir(data_dir: Path, n_movies: int, n_users: int, history: int, seed: int = 0,
+                   feature_builder: str = "tfidf") -> dict:
+    """Generate the data set into ``data_dir`` unless it already holds the same one."""
+    spec = {
+        "n_movies": n_movies, "n_users": n_users, "history": history,
+        "seed": seed, "feature_builder": feature_builder,
+    }
+    spec_path = data_dir / "benchmark_spec.json"
+    if spec_path.exists() and json.loads(spec_path.read_text()) == spec:
+        return spec
+
+    data_dir.mkdir(parents=True, exist_ok=True)
+    spec_path.unlink(missing_ok=True)
+    for stale in ["app.db", "manifest"]:
+        path = data_dir / stale
+        if path.is_dir():
+            for child in path.iterdir():
+                child.unlink()
+        else:
+            path.unlink(missing_ok=True)
+
+    generate_movies(n_movies, seed=seed).to_parquet(data_dir / "movies_clean.parquet", index=False)
+    _run_stage("02_load_db.py", data_dir, "--full")
+    if feature_builder == "hashed":
+        _run_stage("03b_build_hashed_features.py", data_dir, "--full")
+    else:
+        _run_stage("03_build_features.py", data_dir, "--full")
+    _run_stage("04_build_catalog_stats.py", data_dir, "--full")
+    create_users(data_dir / "app.db", n_users, history, seed)
+
+    spec_path.write_text(json.dumps(spec))
+    return spec
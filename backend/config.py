@@ -1,18 +1,108 @@
+import json
 import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent
+# Generated artifacts (database, feature matrix, stats); overridable so the
+# API can run against another data set, e.g. the synthetic benchmark catalog
+DATA_DIR = Path(os.getenv("DATA_DIR", str(BASE_DIR / "data")))
 
 # Database
-DATABASE_URL = os.getenv("DATABASE_URL", str(BASE_DIR / "data" / "app.db"))
+DATABASE_URL = os.getenv("DATABASE_URL", str(DATA_DIR / "app.db"))
 
 # JWT
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 7
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+
+# Comma-separated usernames allowed to call /api/admin endpoints
+ADMIN_USERNAMES = {u.strip() for u in os.getenv("ADMIN_USERNAMES", "").split(",") if u.strip()}
+
+# Password hashing (bcrypt runs on a dedicated, bounded thread pool)
+BCRYPT_MAX_WORKERS = int(os.getenv("BCRYPT_MAX_WORKERS", "2"))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "32"))
+BCRYPT_QUEUE_TIMEOUT_SECONDS = float(os.getenv("BCRYPT_QUEUE_TIMEOUT_SECONDS", "2.0"))
+
+# A/B test of feature block weights: variant name -> {block: weight}, e.g.
+# {"control": {}, "keywords_heavy": {"keywords": 4.0}}. Users are bucketed
+# deterministically by id; blocks not listed keep their default weight.
+BLOCK_WEIGHT_VARIANTS = json.loads(os.getenv("BLOCK_WEIGHT_VARIANTS", "{}"))
+
+# Admission control: route prefix -> concurrency limit, wait queue and timeout.
+# Degradable routes serve a cheap fallback instead of a 503 when saturated.
+RECOMMENDATIONS_LATENCY_BUDGET_SECONDS = float(os.getenv("RECOMMENDATIONS_LATENCY_BUDGET_SECONDS", "0.5"))
+ADMISSION_LIMITS = {
+    "/api/recommendations": {
+        "max_concurrency": int(os.getenv("RECOMMENDATIONS_MAX_CONCURRENCY", "4")),
+        "max_queue": int(os.getenv("RECOMMENDATIONS_MAX_QUEUE", "32")),
+        "queue_timeout": float(os.getenv("RECOMMENDATIONS_QUEUE_TIMEOUT_SECONDS", "0.25")),
+        "degradable": True,
+    },
+    "/api/analytics": {
+        "max_concurrency": int(os.getenv("ANALYTICS_MAX_CONCURRENCY", "8")),
+        "max_queue": int(os.getenv("ANALYTICS_MAX_QUEUE", "64")),
+        "queue_timeout": float(os.getenv("ANALYTICS_QUEUE_TIMEOUT_SECONDS", "2.0")),
+    },
+    "/api/movies/search": {
+        "max_concurrency": int(os.getenv("SEARCH_MAX_CONCURRENCY", "16")),
+        "max_queue": int(os.getenv("SEARCH_MAX_QUEUE", "128")),
+        "queue_timeout": float(os.getenv("SEARCH_QUEUE_TIMEOUT_SECONDS", "2.0")),
+    },
+}
+
+# Most movies per /api/movies/batch lookup and items per bulk watchlist or
+# watched request
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "500"))
+
+# Cache for /api/movies/search and /popular responses: TTL (0 disables the
+# cache), entry bound, and how long past expiry an entry may still be served
+# while it is refreshed in the background (0 disables stale-while-revalidate)
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "30"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1024"))
+RESULT_CACHE_STALE_SECONDS = float(os.getenv("RESULT_CACHE_STALE_SECONDS", "0"))
+
+# Per-request phase timing: Server-Timing header and latency histograms at
+# /api/metrics (counters and gauges there are always available)
+REQUEST_TIMING_ENABLED = os.getenv("REQUEST_TIMING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Request profiling: a sampling profiler captures requests sent by an admin
+# with an "X-Profile: 1" header, a random fraction of requests, and any request
+# slower than PROFILE_SLOW_MS (0 disables the last two). Captured profiles are
+# kept in a ring buffer and downloaded from /api/admin/profiles.
+# PROFILE_SLOW_MS collects every request speculatively, so under steady
+# traffic the sampler never stops: each interval it walks every thread's
+# stack and adds the stacks to every in-flight request's counts, i.e. cost
+# grows with threads x stack depth x concurrent requests. Prefer it for
+# short investigations, or raise PROFILE_INTERVAL_MS while it is on.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "50"))
 
 # Data paths
-DATA_DIR = BASE_DIR / "data"
 FEATURE_MATRIX_PATH = DATA_DIR / "feature_matrix.npz"
 MOVIE_IDS_PATH = DATA_DIR / "movie_ids.npy"
+FEATURE_VOCAB_PATH = DATA_DIR / "feature_vocab.json"
+FEATURE_SHARDS_DIR = DATA_DIR / "feature_shards"
 PARQUET_PATH = DATA_DIR / "movies_clean.parquet"
+CATALOG_STATS_PATH = DATA_DIR / "catalog_stats.json"
+
+# Threads scoring feature shards in parallel (sharded layout only)
+RECOMMENDATION_SHARD_WORKERS = int(os.getenv("RECOMMENDATION_SHARD_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Candidates re-ranked by maximal marginal relevance when a recommendations
+# request asks for diversity
+RECOMMENDATION_DIVERSITY_POOL = int(os.getenv("RECOMMENDATION_DIVERSITY_POOL", "300"))
+
+# Precision the engine holds full-precision feature artifacts in: "float64",
+# "float16" or "int8" with a per-row scale (about 1/3 the memory either way).
+# Shards written quantized (03_build_features.py --precision) load as stored.
+FEATURE_PRECISION = os.getenv("FEATURE_PRECISION", "float64")
+
+# Collaborative filtering (scripts/06_train_cf.py): users with at least
+# CF_MIN_HISTORY watched movies known to the model get
+# (1 - CF_BLEND_WEIGHT) * content score + CF_BLEND_WEIGHT * CF score
+CF_MODEL_DIR = DATA_DIR / "cf_model"
+CF_BLEND_WEIGHT = float(os.getenv("CF_BLEND_WEIGHT", "0.3"))
+CF_MIN_HISTORY = int(os.getenv("CF_MIN_HISTORY", "5"))
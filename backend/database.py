@@ -1,5 +1,6 @@
 import aiosqlite
 from config import DATABASE_URL
+from timing import timed, wrap_connection
 
 SCHEMA_SQL = """
 CREATE TABLE IF NOT EXISTS users (
@@ -33,19 +34,225 @@ CREATE TABLE IF NOT EXISTS watchlist (
     FOREIGN KEY (movie_id) REFERENCES movies(id),
     UNIQUE(user_id, movie_id)
 );
+
+CREATE INDEX IF NOT EXISTS idx_watched_user_created ON watched(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_watchlist_user_added ON watchlist(user_id, added_at);
 """
 
+# Bucket edges match analytics_router.REVENUE_BUCKETS
+_REVENUE_BUCKET_SQL = """CASE
+        WHEN revenue < 10000000 THEN 0
+        WHEN revenue < 50000000 THEN 1
+        WHEN revenue < 100000000 THEN 2
+        WHEN revenue < 500000000 THEN 3
+        WHEN revenue < 1000000000 THEN 4
+        ELSE 5
+    END"""
 
-async def get_db():
+# Per-user analytics aggregates, kept current by triggers on watched/watchlist
+# so the dashboard never rescans a user's history. Decades are stored as the
+# first year (1990), revenue as an index into analytics_router.REVENUE_BUCKETS.
+AGGREGATES_SQL = f"""
+CREATE TABLE IF NOT EXISTS user_genre_counts (
+    user_id INTEGER NOT NULL,
+    genre_id INTEGER NOT NULL,
+    watched INTEGER NOT NULL DEFAULT 0,
+    watchlist INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, genre_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS user_decade_counts (
+    user_id INTEGER NOT NULL,
+    decade INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, decade)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS user_revenue_counts (
+    user_id INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, bucket)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS user_rating_counts (
+    user_id INTEGER NOT NULL,
+    rating INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, rating)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS user_agg_watched_insert AFTER INSERT ON watched
+BEGIN
+    INSERT INTO user_genre_counts (user_id, genre_id, watched)
+    SELECT NEW.user_id, genre_id, 1 FROM movie_genres WHERE movie_id = NEW.movie_id
+    ON CONFLICT (user_id, genre_id) DO UPDATE SET watched = watched + 1;
+
+    INSERT INTO user_decade_counts (user_id, decade, count)
+    SELECT NEW.user_id, (CAST(substr(release_date, 1, 4) AS INTEGER) / 10) * 10, 1
+    FROM movies WHERE id = NEW.movie_id AND release_date GLOB '[0-9][0-9][0-9][0-9]*'
+    ON CONFLICT (user_id, decade) DO UPDATE SET count = count + 1;
+
+    INSERT INTO user_revenue_counts (user_id, bucket, count)
+    SELECT NEW.user_id, {_REVENUE_BUCKET_SQL}, 1
+    FROM movies WHERE id = NEW.movie_id AND revenue > 0
+    ON CONFLICT (user_id, bucket) DO UPDATE SET count = count + 1;
+
+    INSERT INTO user_rating_counts (user_id, rating, count)
+    SELECT NEW.user_id, NEW.rating, 1 WHERE NEW.rating IS NOT NULL
+    ON CONFLICT (user_id, rating) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_agg_watched_delete AFTER DELETE ON watched
+BEGIN
+    UPDATE user_genre_counts SET watched = watched - 1
+    WHERE user_id = OLD.user_id
+      AND genre_id IN (SELECT genre_id FROM movie_genres WHERE movie_id = OLD.movie_id);
+
+    UPDATE user_decade_counts SET count = count - 1
+    WHERE user_id = OLD.user_id
+      AND decade = (SELECT (CAST(substr(release_date, 1, 4) AS INTEGER) / 10) * 10
+                    FROM movies WHERE id = OLD.movie_id
+                      AND release_date GLOB '[0-9][0-9][0-9][0-9]*');
+
+    UPDATE user_revenue_counts SET count = count - 1
+    WHERE user_id = OLD.user_id
+      AND bucket = (SELECT {_REVENUE_BUCKET_SQL} FROM movies WHERE id = OLD.movie_id AND revenue > 0);
+
+    UPDATE user_rating_counts SET count = count - 1
+    WHERE user_id = OLD.user_id AND rating = OLD.rating;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_agg_watched_rating AFTER UPDATE OF rating ON watched
+WHEN OLD.rating IS NOT NEW.rating
+BEGIN
+    UPDATE user_rating_counts SET count = count - 1
+    WHERE user_id = OLD.user_id AND rating = OLD.rating;
+
+    INSERT INTO user_rating_counts (user_id, rating, count)
+    SELECT NEW.user_id, NEW.rating, 1 WHERE NEW.rating IS NOT NULL
+    ON CONFLICT (user_id, rating) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_agg_watchlist_insert AFTER INSERT ON watchlist
+BEGIN
+    INSERT INTO user_genre_counts (user_id, genre_id, watchlist)
+    SELECT NEW.user_id, genre_id, 1 FROM movie_genres WHERE movie_id = NEW.movie_id
+    ON CONFLICT (user_id, genre_id) DO UPDATE SET watchlist = watchlist + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_agg_watchlist_delete AFTER DELETE ON watchlist
+BEGIN
+    UPDATE user_genre_counts SET watchlist = watchlist - 1
+    WHERE user_id = OLD.user_id
+      AND genre_id IN (SELECT genre_id FROM movie_genres WHERE movie_id = OLD.movie_id);
+END;
+"""
+
+# Recomputes every user's aggregates from scratch; run when the aggregate
+# tables are first created (or were dropped by a catalog reload).
+REBUILD_AGGREGATES_SQL = f"""
+DELETE FROM user_genre_counts;
+DELETE FROM user_decade_counts;
+DELETE FROM user_revenue_counts;
+DELETE FROM user_rating_counts;
+
+INSERT INTO user_genre_counts (user_id, genre_id, watched, watchlist)
+SELECT h.user_id, mg.genre_id, SUM(h.source = 'watched'), SUM(h.source = 'watchlist')
+FROM (SELECT user_id, movie_id, 'watched' AS source FROM watched
+      UNION ALL
+      SELECT user_id, movie_id, 'watchlist' AS source FROM watchlist) h
+JOIN movie_genres mg ON mg.movie_id = h.movie_id
+GROUP BY h.user_id, mg.genre_id;
+
+INSERT INTO user_decade_counts (user_id, decade, count)
+SELECT w.user_id, (CAST(substr(m.release_date, 1, 4) AS INTEGER) / 10) * 10 AS decade, COUNT(*)
+FROM watched w JOIN movies m ON w.movie_id = m.id
+WHERE m.release_date GLOB '[0-9][0-9][0-9][0-9]*'
+GROUP BY w.user_id, decade;
+
+INSERT INTO user_revenue_counts (user_id, bucket, count)
+SELECT w.user_id, {_REVENUE_BUCKET_SQL} AS bucket, COUNT(*)
+FROM watched w JOIN movies m ON w.movie_id = m.id
+WHERE m.revenue > 0
+GROUP BY w.user_id, bucket;
+
+INSERT INTO user_rating_counts (user_id, rating, count)
+SELECT user_id, rating, COUNT(*) FROM watched
+WHERE rating IS NOT NULL
+GROUP BY user_id, rating;
+"""
+
+# Recomputes only the catalog-dependent aggregates (genres, decades, revenue)
+# of the users in temp.affected_users, after movies on their lists changed or
+# were deleted; rating counts depend on the watched table alone.
+_AFFECTED = "user_id IN (SELECT user_id FROM temp.affected_users)"
+REBUILD_USER_AGGREGATES_SQL = f"""
+DELETE FROM user_genre_counts WHERE {_AFFECTED};
+DELETE FROM user_decade_counts WHERE {_AFFECTED};
+DELETE FROM user_revenue_counts WHERE {_AFFECTED};
+
+INSERT INTO user_genre_counts (user_id, genre_id, watched, watchlist)
+SELECT h.user_id, mg.genre_id, SUM(h.source = 'watched'), SUM(h.source = 'watchlist')
+FROM (SELECT user_id, movie_id, 'watched' AS source FROM watched WHERE {_AFFECTED}
+      UNION ALL
+      SELECT user_id, movie_id, 'watchlist' AS source FROM watchlist WHERE {_AFFECTED}) h
+JOIN movie_genres mg ON mg.movie_id = h.movie_id
+GROUP BY h.user_id, mg.genre_id;
+
+INSERT INTO user_decade_counts (user_id, decade, count)
+SELECT w.user_id, (CAST(substr(m.release_date, 1, 4) AS INTEGER) / 10) * 10 AS decade, COUNT(*)
+FROM watched w JOIN movies m ON w.movie_id = m.id
+WHERE w.{_AFFECTED} AND m.release_date GLOB '[0-9][0-9][0-9][0-9]*'
+GROUP BY w.user_id, decade;
+
+INSERT INTO user_revenue_counts (user_id, bucket, count)
+SELECT w.user_id, {_REVENUE_BUCKET_SQL} AS bucket, COUNT(*)
+FROM watched w JOIN movies m ON w.movie_id = m.id
+WHERE w.{_AFFECTED} AND m.revenue > 0
+GROUP BY w.user_id, bucket;
+"""
+
+
+async def connect() -> aiosqlite.Connection:
     db = await aiosqlite.connect(DATABASE_URL)
     db.row_factory = aiosqlite.Row
+    return db
+
+
+async def fetch_ids(db, sql: str, ids, *params) -> set[int]:
+    """First-column values of ``sql`` with ``{ids}`` expanded to placeholders for ``ids``."""
+    ids = list(set(ids))
+    if not ids:
+        return set()
+    cursor = await db.execute(sql.format(ids=",".join("?" * len(ids))), [*params, *ids])
+    return {row[0] for row in await cursor.fetchall()}
+
+
+def values_placeholders(n_rows: int, n_columns: int) -> str:
+    """``(?, ?), (?, ?)`` for a multi-row INSERT."""
+    row = "(" + ", ".join("?" * n_columns) + ")"
+    return ", ".join([row] * n_rows)
+
+
+async def get_db():
+    with timed("db_connect"):
+        db = await connect()
     try:
-        yield db
+        yield wrap_connection(db)
     finally:
         await db.close()
 
 
 async def init_db():
     async with aiosqlite.connect(DATABASE_URL) as db:
+        cursor = await db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_genre_counts'"
+        )
+        needs_rebuild = await cursor.fetchone() is None
+
         await db.executescript(SCHEMA_SQL)
+        await db.executescript(AGGREGATES_SQL)
+        if needs_rebuild:
+            await db.executescript(REBUILD_AGGREGATES_SQL)
         await db.commit()
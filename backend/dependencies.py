@@ -1,6 +1,7 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from auth import decode_access_token
+from config import ADMIN_USERNAMES
 
 security = HTTPBearer()
 
@@ -19,3 +20,12 @@ async def get_current_user(
         "id": int(payload["sub"]),
         "username": payload["username"],
     }
+
+
+async def get_admin_user(user: dict = Depends(get_current_user)) -> dict:
+    if user["username"] not in ADMIN_USERNAMES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required",
+        )
+    return user
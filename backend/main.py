@@ -1,9 +1,22 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+import pandas as pd
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from database import init_db
-from services.recommendation_service import RecommendationEngine
+from fastapi.responses import JSONResponse, PlainTextResponse
+from auth import PasswordHasherBusy
+from admission import AdmissionControlMiddleware
+from config import ADMISSION_LIMITS, BLOCK_WEIGHT_VARIANTS, CATALOG_STATS_PATH, FEATURE_VOCAB_PATH, PARQUET_PATH
+from database import connect, init_db
+from metrics import register_gauge, render_prometheus
+from pagination import NEXT_CURSOR_HEADER
+from profiling import ProfilingMiddleware
+from services.catalog_stats import CatalogStats
+from services.discover import DISCOVER_COLUMNS, DiscoverCatalog
+from services.features import load_featurizer
+from services.recommendation_service import POPULARITY_FALLBACK_SQL, RecommendationEngine, PopularityFallback
+from services.title_index import TITLE_INDEX_SQL, TitleIndex
 from state import app_state
+from timing import TimingMiddleware
 
 
 @asynccontextmanager
@@ -14,7 +27,44 @@ async def lifespan(app: FastAPI):
     # Load recommendation engine into memory
     print("Loading recommendation engine...")
     app_state["engine"] = RecommendationEngine()
-    print(f"  Feature matrix: {app_state['engine'].feature_matrix.shape}")
+    print(f"  Feature matrix: {app_state['engine'].shape} in {app_state['engine'].n_shards} shard(s)")
+    print(f"  Block weights: {app_state['engine'].default_weights}")
+    if app_state["engine"].cf is not None:
+        cf = app_state["engine"].cf
+        print(f"  CF model: {len(cf.movie_ids)} movies x {cf.factors} factors (hybrid scoring on)")
+    # Fail fast on a misconfigured weight experiment
+    for variant, block_weights in BLOCK_WEIGHT_VARIANTS.items():
+        app_state["engine"].block_factors(block_weights)
+    # Featurizer (fitted TF-IDF vocabularies or hashed) used for movies added
+    # through the admin API
+    if FEATURE_VOCAB_PATH.exists():
+        app_state["featurizer"] = load_featurizer(FEATURE_VOCAB_PATH)
+    register_gauge("engine_feature_bytes", lambda: app_state["engine"].nbytes,
+                   "Memory held by the recommendation feature matrix")
+    register_gauge("engine_movies", lambda: app_state["engine"].shape[0], "Rows in the feature matrix")
+    register_gauge("engine_shards", lambda: app_state["engine"].n_shards, "Feature matrix shards")
+
+    # Precompute popular-by-genre lists served when recommendations degrade
+    db = await connect()
+    try:
+        cursor = await db.execute(POPULARITY_FALLBACK_SQL)
+        app_state["fallback"] = PopularityFallback(await cursor.fetchall())
+        # Prefix index behind /api/movies/suggest
+        cursor = await db.execute(TITLE_INDEX_SQL)
+        app_state["title_index"] = TitleIndex(await cursor.fetchall())
+        print(f"  Title index: {len(app_state['title_index'].keys)} entries")
+    finally:
+        await db.close()
+
+    # Catalog-wide baselines for user-vs-catalog analytics (optional artifact)
+    if CATALOG_STATS_PATH.exists():
+        app_state["catalog_stats"] = CatalogStats()
+        print(f"  Catalog stats: {app_state['catalog_stats'].total} movies")
+
+    # Columnar catalog for /api/movies/discover (optional artifact)
+    if PARQUET_PATH.exists():
+        app_state["discover"] = DiscoverCatalog(pd.read_parquet(PARQUET_PATH, columns=DISCOVER_COLUMNS))
+        print(f"  Discover catalog: {app_state['discover'].n} movies, {len(app_state['discover'].genres)} genres")
     print("Ready!")
 
     yield
@@ -24,13 +74,31 @@ async def lifespan(app: FastAPI):
 
 app = FastAPI(title="Netflix Recommender API", version="1.0.0", lifespan=lifespan)
 
+# Registered first so CORS wraps it and 503 rejections still carry CORS headers
+app.add_middleware(AdmissionControlMiddleware, limits=ADMISSION_LIMITS)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://localhost:3001", "http://frontend:3000"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
+# Profiles include admission waits; profiled requests are flagged by an admin
+# header, PROFILE_SAMPLE_RATE or PROFILE_SLOW_MS
+app.add_middleware(ProfilingMiddleware)
+# Outermost, so Server-Timing covers admission waits and CORS handling too
+app.add_middleware(TimingMiddleware)
+
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many login attempts in progress, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
 
 # Import and include routers
 from routers.auth_router import router as auth_router
@@ -39,6 +107,7 @@ from routers.watched_router import router as watched_router
 from routers.watchlist_router import router as watchlist_router
 from routers.recommendations_router import router as recommendations_router
 from routers.analytics_router import router as analytics_router
+from routers.admin_router import router as admin_router
 
 app.include_router(auth_router, prefix="/api/auth", tags=["auth"])
 app.include_router(movies_router, prefix="/api/movies", tags=["movies"])
@@ -46,8 +115,15 @@ app.include_router(watched_router, prefix="/api/watched", tags=["watched"])
 app.include_router(watchlist_router, prefix="/api/watchlist", tags=["watchlist"])
 app.include_router(recommendations_router, prefix="/api/recommendations", tags=["recommendations"])
 app.include_router(analytics_router, prefix="/api/analytics", tags=["analytics"])
+app.include_router(admin_router, prefix="/api/admin", tags=["admin"])
 
 
 @app.get("/api/health")
 async def health():
     return {"status": "ok"}
+
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Counters, latency histograms and gauges in Prometheus text format."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
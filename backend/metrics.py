@@ -0,0 +1,78 @@
+"""Process-local counters, histograms and gauges, exported in Prometheus text format.
+
+Counters record operational events (fallbacks, rejections) and are always on.
+Histograms are fed by request timing (see timing.py) and stay empty when it is
+disabled. Gauges are callables sampled when /api/metrics is scraped, so they
+cost nothing between scrapes.
+"""
+
+from bisect import bisect_left
+from collections import Counter
+
+# Upper bounds in seconds, from sub-millisecond SQL statements to slow requests
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+counters: Counter = Counter()
+# (name, labels) -> [per-bucket counts (last is +Inf), sum]
+histograms: dict[tuple, list] = {}
+# name -> (help text, callable returning a number or a list of (labels, number))
+gauges: dict = {}
+
+
+def inc(name: str, value: int = 1, **labels: str) -> None:
+    counters[(name, tuple(sorted(labels.items())))] += value
+
+
+def observe(name: str, seconds: float, **labels: str) -> None:
+    key = (name, tuple(sorted(labels.items())))
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0]
+    histogram[0][bisect_left(BUCKETS, seconds)] += 1
+    histogram[1] += seconds
+
+
+def register_gauge(name: str, fn, help: str = "") -> None:
+    gauges[name] = (help, fn)
+
+
+def _labels(labels, **extra) -> str:
+    items = [*labels, *extra.items()]
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def render_prometheus() -> str:
+    lines = []
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_labels(labels)} {value}")
+
+    for (name, labels), (counts, total) in sorted(histograms.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, count in zip([*BUCKETS, "+Inf"], counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+        lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+
+    for name, (help, fn) in sorted(gauges.items()):
+        try:
+            value = fn()
+        except Exception:
+            continue  # a gauge whose source is gone (e.g. after shutdown) is skipped
+        if help:
+            lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        samples = value if isinstance(value, list) else [({}, value)]
+        for labels, sample in samples:
+            lines.append(f"{name}{_labels(sorted(labels.items()))} {sample}")
+    return "\n".join(lines) + "\n"
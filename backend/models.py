@@ -1,5 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional
+from config import BULK_MAX_ITEMS
 
 
 # Auth
@@ -51,6 +52,34 @@ class MovieResponse(BaseModel):
     imdb_id: Optional[str] = None
 
 
+class DiscoverFacets(BaseModel):
+    genres: dict[str, int]
+    languages: dict[str, int]
+    decades: dict[str, int]
+
+
+class DiscoverResult(BaseModel):
+    movies: list[MovieResponse]
+    total: int
+    page: int
+    pages: int
+    facets: DiscoverFacets
+
+
+class MovieSuggestion(BaseModel):
+    id: int
+    title: str
+    original_title: Optional[str] = None
+    release_date: Optional[str] = None
+    poster_path: Optional[str] = None
+
+
+class MovieUpsertResult(BaseModel):
+    inserted: int
+    updated: int
+    features: bool
+
+
 class MovieSearchResult(BaseModel):
     movies: list[MovieResponse]
     total: int
@@ -58,6 +87,11 @@ class MovieSearchResult(BaseModel):
     pages: int
 
 
+class MovieBatchResult(BaseModel):
+    movies: list[MovieResponse]  # in requested order, unknown ids skipped
+    missing: list[int]
+
+
 # Watched
 class WatchedCreate(BaseModel):
     movie_id: int
@@ -99,6 +133,29 @@ class MoveToWatchedRequest(BaseModel):
     notes: Optional[str] = None
 
 
+# Bulk watchlist / watched changes
+class WatchlistBulkRequest(BaseModel):
+    add: list[int] = Field(default_factory=list, max_length=BULK_MAX_ITEMS)
+    remove: list[int] = Field(default_factory=list, max_length=BULK_MAX_ITEMS)
+
+
+class WatchedBulkRequest(BaseModel):
+    add: list[WatchedCreate] = Field(default_factory=list, max_length=BULK_MAX_ITEMS)
+    remove: list[int] = Field(default_factory=list, max_length=BULK_MAX_ITEMS)
+
+
+class BulkItemResult(BaseModel):
+    movie_id: int
+    action: str  # "add" or "remove"
+    status: int  # what the single-item endpoint would have returned
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class BulkResult(BaseModel):
+    results: list[BulkItemResult]
+
+
 # Recommendations
 class RecommendationReason(BaseModel):
     text: str
@@ -112,6 +169,9 @@ class RecommendationItem(BaseModel):
 
 class RecommendationsResponse(BaseModel):
     recommendations: list[RecommendationItem]
+    fallback: bool = False
+    fallback_reason: Optional[str] = None
+    weight_variant: Optional[str] = None
 
 
 # Analytics
@@ -129,3 +189,21 @@ class RevenueAnalytics(BaseModel):
 
 class RatingAnalytics(BaseModel):
     data: list[dict]
+
+
+class AnalyticsSummary(BaseModel):
+    genres: list[dict]
+    timeline: list[dict]
+    revenue: list[dict]
+    ratings: list[dict]
+
+
+class CatalogComparison(BaseModel):
+    genres: list[dict]
+    decades: list[dict]
+    languages: list[dict]
+    revenue: list[dict]
+
+
+class CatalogPercentiles(BaseModel):
+    data: list[dict]
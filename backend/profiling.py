@@ -0,0 +1,237 @@
+"""On-demand sampling profiler for live requests.
+
+A background thread snapshots every thread's Python stack each
+PROFILE_INTERVAL_MS while at least one request is being profiled, and adds
+each stack to the collectors of all requests in flight. Sampling all threads
+covers work pushed off the event loop (engine scoring on the recommendations
+router's scoring pool, bcrypt), at the cost of attributing by time: requests that overlap share
+samples. Idle threads (event loop waiting in select, pool workers waiting for
+work) are skipped.
+
+A request is profiled when an admin sends ``X-Profile: 1`` (the response then
+carries ``X-Profile-Id``), when it is picked by PROFILE_SAMPLE_RATE, or, with
+PROFILE_SLOW_MS set, every request is collected and kept only if it turns out
+slower than the threshold. Kept profiles go into a bounded ring buffer and
+can be exported as collapsed stacks (flamegraph.pl, speedscope) or as a
+pstats file (snakeviz, ``python -m pstats``).
+"""
+
+import functools
+import itertools
+import marshal
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from pathlib import Path
+from auth import decode_access_token
+from config import (
+    ADMIN_USERNAMES, BASE_DIR,
+    PROFILE_BUFFER_SIZE, PROFILE_INTERVAL_MS, PROFILE_SAMPLE_RATE, PROFILE_SLOW_MS,
+)
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# Leaf frames of threads that are blocked waiting for work, not doing any
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def _basename(filename: str) -> str:
+    # called for every thread on every tick; the set of filenames is small
+    return Path(filename).name
+
+
+class StackSampler:
+    """Samples all thread stacks while any collector is registered."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        # id -> Counter of stacks (Counters are unhashable)
+        self._collectors: dict[int, Counter] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, collector: Counter) -> None:
+        with self._lock:
+            self._collectors[id(collector)] = collector
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def remove(self, collector: Counter) -> None:
+        with self._lock:
+            self._collectors.pop(id(collector), None)
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._collectors:
+                    self._thread = None
+                    return
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = Counter()
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if (_basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                stacks[tuple(reversed(stack))] += 1
+            # counted under the lock, so once remove() returns a collector
+            # gets no more samples and can be read safely
+            with self._lock:
+                for collector in self._collectors.values():
+                    collector.update(stacks)
+
+
+class Profile:
+    def __init__(self, profile_id, scope, status, duration, trigger, started_at, samples, interval):
+        self.id = profile_id
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.status = status
+        self.duration = duration
+        self.trigger = trigger
+        self.started_at = started_at
+        self.samples = samples
+        self.interval = interval
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "duration_ms": round(self.duration * 1000, 2),
+            "trigger": self.trigger,
+            "started_at": self.started_at,
+            "samples": sum(self.samples.values()),
+        }
+
+    def collapsed(self) -> str:
+        """One ``thread;frame;...;leaf count`` line per distinct stack."""
+        lines = []
+        for stack, count in self.samples.most_common():
+            frames = [stack[0], *(_frame_label(frame) for frame in stack[1:])]
+            lines.append(f"{';'.join(frames)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def pstats(self) -> bytes:
+        """Marshalled pstats dict; sample counts times the interval stand in for call times."""
+        stats = {}
+        for stack, count in self.samples.items():
+            seconds = count * self.interval
+            frames = stack[1:]
+            seen = set()
+            for depth, frame in enumerate(frames):
+                cc, nc, tt, ct, callers = stats.setdefault(frame, (0, 0, 0.0, 0.0, {}))
+                is_leaf = depth == len(frames) - 1
+                if is_leaf:
+                    tt += seconds
+                if frame not in seen:  # recursion counts once toward inclusive time
+                    seen.add(frame)
+                    cc, nc, ct = cc + count, nc + count, ct + seconds
+                if depth:
+                    caller = frames[depth - 1]
+                    c_nc, c_cc, c_tt, c_ct = callers.get(caller, (0, 0, 0.0, 0.0))
+                    callers[caller] = (c_nc + count, c_cc + count,
+                                       c_tt + (seconds if is_leaf else 0.0), c_ct + seconds)
+                stats[frame] = (cc, nc, tt, ct, callers)
+        return marshal.dumps(stats)
+
+
+def _frame_label(frame) -> str:
+    filename, line, name = frame
+    path = Path(filename)
+    if "site-packages" in path.parts:
+        short = "/".join(path.parts[path.parts.index("site-packages") + 1:])
+    elif path.is_relative_to(BASE_DIR):
+        short = str(path.relative_to(BASE_DIR))
+    else:
+        short = path.name
+    return f"{name} ({short}:{line})"
+
+
+sampler = StackSampler(PROFILE_INTERVAL_MS / 1000)
+profiles: deque[Profile] = deque(maxlen=PROFILE_BUFFER_SIZE)
+_profile_ids = itertools.count(1)
+
+
+def find_profile(profile_id: int) -> Profile | None:
+    return next((p for p in profiles if p.id == profile_id), None)
+
+
+def _is_admin_request(headers: dict) -> bool:
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer":
+        return False
+    payload = decode_access_token(token)
+    return payload is not None and payload.get("username") in ADMIN_USERNAMES
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    def _trigger(self, scope) -> str | None:
+        headers = dict(scope["headers"])
+        if headers.get(PROFILE_HEADER.lower().encode()) == b"1" and _is_admin_request(headers):
+            return "header"
+        if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            return "sampled"
+        if PROFILE_SLOW_MS:
+            return "slow"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trigger = self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = next(_profile_ids)
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trigger == "header":
+                    header = (PROFILE_ID_HEADER.lower().encode(), str(profile_id).encode())
+                    message["headers"] = [*message.get("headers", []), header]
+            await send(message)
+
+        samples = Counter()
+        started_at = datetime.now(timezone.utc).isoformat()
+        start = time.perf_counter()
+        sampler.add(samples)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.remove(samples)
+            duration = time.perf_counter() - start
+            # "slow" requests are collected speculatively and kept only past the threshold
+            if trigger != "slow" or duration * 1000 >= PROFILE_SLOW_MS:
+                profiles.append(Profile(profile_id, scope, status, duration, trigger,
+                                        started_at, samples, sampler.interval))
@@ -0,0 +1,111 @@
+"""In-process TTL cache for hot, user-independent responses (search, popular).
+
+Entries expire after RESULT_CACHE_TTL_SECONDS, and the least recently used
+ones are evicted beyond RESULT_CACHE_MAX_ENTRIES. Concurrent misses on one key
+are coalesced: the first caller starts the computation as a task and every
+caller awaits that task, so a cold key reaches SQLite once. The task is
+shielded, so a caller that disconnects does not cancel it for the others.
+
+With RESULT_CACHE_STALE_SECONDS set, an entry that expired less than that long
+ago is still served while one background task recomputes it
+(stale-while-revalidate). Errors are never cached.
+
+Keys are tuples whose first element names the endpoint; hits, stale hits,
+coalesced waits and misses are counted per endpoint and exported at
+/api/metrics, along with the hit ratio.
+"""
+
+import asyncio
+import time
+from collections import Counter, OrderedDict
+from config import RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_STALE_SECONDS, RESULT_CACHE_TTL_SECONDS
+from metrics import inc, register_gauge
+
+RESULTS = ("hit", "stale", "coalesced", "miss")
+
+
+class ResultCache:
+    def __init__(self, ttl: float, max_entries: int, stale: float = 0.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stale = stale
+        # key -> (value, monotonic time it expires)
+        self._entries: OrderedDict[tuple, tuple] = OrderedDict()
+        # key -> task computing it (a miss or a background refresh)
+        self._pending: dict[tuple, asyncio.Task] = {}
+        self.stats: Counter = Counter()  # (endpoint, result) -> count
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Drop every entry, e.g. after the catalog changed. In-flight computations still finish."""
+        self._entries.clear()
+        self._pending.clear()
+
+    def _count(self, key, result):
+        self.stats[(key[0], result)] += 1
+        inc("result_cache_requests_total", endpoint=key[0], result=result)
+
+    def _start(self, key, compute) -> asyncio.Task:
+        task = asyncio.ensure_future(compute())
+        self._pending[key] = task
+
+        def store(done):
+            if self._pending.get(key) is done:
+                del self._pending[key]
+                if not done.cancelled() and done.exception() is None:
+                    self._entries[key] = (done.result(), time.monotonic() + self.ttl)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+
+        task.add_done_callback(store)
+        return task
+
+    async def get(self, key: tuple, compute):
+        """The cached value for ``key``, else the result of ``await compute()``."""
+        if not self.enabled:
+            return await compute()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires = entry
+            now = time.monotonic()
+            if now < expires:
+                self._entries.move_to_end(key)
+                self._count(key, "hit")
+                return value
+            if now < expires + self.stale:
+                if key not in self._pending:
+                    self._start(key, compute)
+                self._count(key, "stale")
+                return value
+            del self._entries[key]
+
+        task = self._pending.get(key)
+        if task is not None:
+            self._count(key, "coalesced")
+        else:
+            self._count(key, "miss")
+            task = self._start(key, compute)
+        return await asyncio.shield(task)
+
+    def hit_ratios(self) -> list:
+        """Per endpoint: share of lookups answered without a computation of their own."""
+        ratios = []
+        for endpoint in sorted({e for e, _ in self.stats}):
+            total = sum(self.stats[(endpoint, r)] for r in RESULTS)
+            ratios.append(({"endpoint": endpoint}, round(1 - self.stats[(endpoint, "miss")] / total, 4)))
+        return ratios
+
+
+movie_results = ResultCache(RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_STALE_SECONDS)
+
+register_gauge("result_cache_entries", lambda: len(movie_results), "Cached search and popular responses")
+register_gauge("result_cache_hit_ratio", movie_results.hit_ratios,
+               "Lookups served from cache or a coalesced computation, per endpoint")
@@ -0,0 +1,90 @@
+import asyncio
+import sqlite3
+import pandas as pd
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse
+from config import DATABASE_URL, FEATURE_MATRIX_PATH, FEATURE_SHARDS_DIR, MOVIE_IDS_PATH
+from dependencies import get_admin_user
+from models import MovieResponse, MovieUpsertResult
+from profiling import find_profile, profiles
+from result_cache import movie_results
+from services.catalog_updates import prepare_movies, upsert_feature_rows, upsert_movies
+from services.recommendation_service import POPULARITY_FALLBACK_SQL, PopularityFallback
+from services.title_index import TITLE_INDEX_SQL, TitleIndex
+from state import app_state
+from timing import TimedRoute
+
+router = APIRouter(route_class=TimedRoute)
+
+# Serializes catalog writers: the database upsert, the in-memory engine update
+# and the on-disk feature artifact must land in the same order.
+_catalog_write_lock = asyncio.Lock()
+
+
+def _apply_movies(movies: list[dict]) -> tuple[int, int, bool]:
+    df = prepare_movies(pd.DataFrame(movies))
+
+    conn = sqlite3.connect(DATABASE_URL)
+    try:
+        inserted, updated = upsert_movies(conn, df)
+        # titles, genres and popularity may have changed; rebuilding each is a
+        # second or two for 200k movies. catalog_stats stays as of the last
+        # 04_build_catalog_stats.py run.
+        app_state["title_index"] = TitleIndex(conn.execute(TITLE_INDEX_SQL))
+        app_state["fallback"] = PopularityFallback(conn.execute(POPULARITY_FALLBACK_SQL))
+    finally:
+        conn.close()
+    if "discover" in app_state:
+        app_state["discover"] = app_state["discover"].upsert(df)
+
+    featurizer = app_state.get("featurizer")
+    if featurizer is None:
+        return inserted, updated, False
+
+    movie_ids, rows = df["id"].to_numpy(), featurizer.transform(df)
+    app_state["engine"].add_or_update(movie_ids, rows)
+    # only the touched shards (or a delta beside feature_matrix.npz) are
+    # written, so a restart picks up the new rows
+    upsert_feature_rows(movie_ids, rows, FEATURE_MATRIX_PATH, MOVIE_IDS_PATH, FEATURE_SHARDS_DIR)
+    return inserted, updated, True
+
+
+@router.post("/movies", response_model=MovieUpsertResult)
+async def upsert_catalog_movies(
+    movies: list[MovieResponse],
+    user: dict = Depends(get_admin_user),
+):
+    if not movies:
+        raise HTTPException(status_code=400, detail="No movies provided")
+
+    async with _catalog_write_lock:
+        inserted, updated, features = await asyncio.to_thread(
+            _apply_movies, [m.model_dump() for m in movies]
+        )
+        movie_results.clear()
+
+    return MovieUpsertResult(inserted=inserted, updated=updated, features=features)
+
+
+@router.get("/profiles")
+async def list_profiles(user: dict = Depends(get_admin_user)):
+    """Captured request profiles, newest first."""
+    return [p.summary() for p in reversed(profiles)]
+
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(
+    profile_id: int,
+    format: str = Query("collapsed", pattern="^(collapsed|pstats)$"),
+    user: dict = Depends(get_admin_user),
+):
+    profile = find_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found or already evicted")
+    if format == "pstats":
+        return Response(
+            profile.pstats(),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.prof"'},
+        )
+    return PlainTextResponse(profile.collapsed())
@@ -1,58 +1,91 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 import aiosqlite
 from database import get_db
 from dependencies import get_current_user
-from collections import Counter
+from models import AnalyticsSummary, CatalogComparison, CatalogPercentiles
+from services.catalog_stats import CatalogStats
+from state import app_state
+from timing import TimedRoute
+
+router = APIRouter(route_class=TimedRoute)
+
+# Labels for user_revenue_counts.bucket; edges live in database._REVENUE_BUCKET_SQL
+REVENUE_BUCKETS = [
+    "< $10M",
+    "$10M - $50M",
+    "$50M - $100M",
+    "$100M - $500M",
+    "$500M - $1B",
+    "> $1B",
+]
+
+
+# All reads below hit the per-user aggregate tables maintained by triggers in
+# database.AGGREGATES_SQL, so their cost doesn't grow with history length.
+async def load_genre_data(db: aiosqlite.Connection, user_id: int) -> list[dict]:
+    cursor = await db.execute(
+        """SELECT g.name AS genre, c.watched, c.watchlist
+           FROM user_genre_counts c JOIN genres g ON g.id = c.genre_id
+           WHERE c.user_id = ? AND (c.watched > 0 OR c.watchlist > 0)
+           ORDER BY c.watched + c.watchlist DESC, g.name""",
+        (user_id,),
+    )
+    rows = await cursor.fetchall()
+    return [
+        {"genre": row["genre"], "watched": row["watched"], "watchlist": row["watchlist"]}
+        for row in rows
+    ]
 
-router = APIRouter()
 
+async def load_timeline_data(db: aiosqlite.Connection, user_id: int) -> list[dict]:
+    cursor = await db.execute(
+        """SELECT decade, count FROM user_decade_counts
+           WHERE user_id = ? AND count > 0 ORDER BY decade""",
+        (user_id,),
+    )
+    rows = await cursor.fetchall()
+    return [{"decade": f"{row['decade']}s", "count": row["count"]} for row in rows]
 
-@router.get("/genres")
-async def genre_analytics(
-    current_user: dict = Depends(get_current_user),
-    db: aiosqlite.Connection = Depends(get_db),
-):
-    # Watched genres
+
+async def load_revenue_data(db: aiosqlite.Connection, user_id: int) -> list[dict]:
     cursor = await db.execute(
-        """SELECT m.genres FROM watched w
-           JOIN movies m ON w.movie_id = m.id
-           WHERE w.user_id = ?""",
-        (current_user["id"],),
+        "SELECT bucket, count FROM user_revenue_counts WHERE user_id = ?",
+        (user_id,),
     )
-    watched_rows = await cursor.fetchall()
-    watched_genres = Counter()
-    for row in watched_rows:
-        if row["genres"]:
-            for g in row["genres"].split(","):
-                watched_genres[g.strip()] += 1
-
-    # Watchlist genres
+    bucket_map = {row["bucket"]: row["count"] for row in await cursor.fetchall()}
+    return [{"bucket": label, "count": bucket_map.get(i, 0)} for i, label in enumerate(REVENUE_BUCKETS)]
+
+
+async def load_rating_data(db: aiosqlite.Connection, user_id: int) -> list[dict]:
     cursor = await db.execute(
-        """SELECT m.genres FROM watchlist wl
-           JOIN movies m ON wl.movie_id = m.id
-           WHERE wl.user_id = ?""",
-        (current_user["id"],),
+        "SELECT rating, count FROM user_rating_counts WHERE user_id = ?",
+        (user_id,),
     )
-    watchlist_rows = await cursor.fetchall()
-    watchlist_genres = Counter()
-    for row in watchlist_rows:
-        if row["genres"]:
-            for g in row["genres"].split(","):
-                watchlist_genres[g.strip()] += 1
-
-    all_genres = sorted(set(watched_genres.keys()) | set(watchlist_genres.keys()))
-    data = [
-        {
-            "genre": g,
-            "watched": watched_genres.get(g, 0),
-            "watchlist": watchlist_genres.get(g, 0),
-        }
-        for g in all_genres
-    ]
-    # Sort by total count descending
-    data.sort(key=lambda x: x["watched"] + x["watchlist"], reverse=True)
+    # Ensure all ratings 1-10 are represented
+    rating_map = {row["rating"]: row["count"] for row in await cursor.fetchall()}
+    return [{"rating": r, "count": rating_map.get(r, 0)} for r in range(1, 11)]
 
-    return {"data": data}
+
+@router.get("/summary", response_model=AnalyticsSummary)
+async def analytics_summary(
+    current_user: dict = Depends(get_current_user),
+    db: aiosqlite.Connection = Depends(get_db),
+):
+    user_id = current_user["id"]
+    return AnalyticsSummary(
+        genres=await load_genre_data(db, user_id),
+        timeline=await load_timeline_data(db, user_id),
+        revenue=await load_revenue_data(db, user_id),
+        ratings=await load_rating_data(db, user_id),
+    )
+
+
+@router.get("/genres")
+async def genre_analytics(
+    current_user: dict = Depends(get_current_user),
+    db: aiosqlite.Connection = Depends(get_db),
+):
+    return {"data": await load_genre_data(db, current_user["id"])}
 
 
 @router.get("/timeline")
@@ -60,24 +93,7 @@ async def timeline_analytics(
     current_user: dict = Depends(get_current_user),
     db: aiosqlite.Connection = Depends(get_db),
 ):
-    cursor = await db.execute(
-        """SELECT m.release_date FROM watched w
-           JOIN movies m ON w.movie_id = m.id
-           WHERE w.user_id = ? AND m.release_date IS NOT NULL""",
-        (current_user["id"],),
-    )
-    rows = await cursor.fetchall()
-    decade_counter = Counter()
-    for row in rows:
-        try:
-            year = int(row["release_date"][:4])
-            decade = f"{(year // 10) * 10}s"
-            decade_counter[decade] += 1
-        except (ValueError, IndexError, TypeError):
-            pass
-
-    data = [{"decade": d, "count": c} for d, c in sorted(decade_counter.items())]
-    return {"data": data}
+    return {"data": await load_timeline_data(db, current_user["id"])}
 
 
 @router.get("/revenue")
@@ -85,39 +101,7 @@ async def revenue_analytics(
     current_user: dict = Depends(get_current_user),
     db: aiosqlite.Connection = Depends(get_db),
 ):
-    cursor = await db.execute(
-        """SELECT m.revenue FROM watched w
-           JOIN movies m ON w.movie_id = m.id
-           WHERE w.user_id = ? AND m.revenue > 0""",
-        (current_user["id"],),
-    )
-    rows = await cursor.fetchall()
-
-    buckets = {
-        "< $10M": 0,
-        "$10M - $50M": 0,
-        "$50M - $100M": 0,
-        "$100M - $500M": 0,
-        "$500M - $1B": 0,
-        "> $1B": 0,
-    }
-    for row in rows:
-        rev = row["revenue"]
-        if rev < 10_000_000:
-            buckets["< $10M"] += 1
-        elif rev < 50_000_000:
-            buckets["$10M - $50M"] += 1
-        elif rev < 100_000_000:
-            buckets["$50M - $100M"] += 1
-        elif rev < 500_000_000:
-            buckets["$100M - $500M"] += 1
-        elif rev < 1_000_000_000:
-            buckets["$500M - $1B"] += 1
-        else:
-            buckets["> $1B"] += 1
-
-    data = [{"bucket": k, "count": v} for k, v in buckets.items()]
-    return {"data": data}
+    return {"data": await load_revenue_data(db, current_user["id"])}
 
 
 @router.get("/ratings")
@@ -125,14 +109,74 @@ async def rating_analytics(
     current_user: dict = Depends(get_current_user),
     db: aiosqlite.Connection = Depends(get_db),
 ):
+    return {"data": await load_rating_data(db, current_user["id"])}
+
+
+def get_catalog_stats() -> CatalogStats:
+    stats = app_state.get("catalog_stats")
+    if stats is None:
+        raise HTTPException(status_code=503, detail="Catalog statistics not available")
+    return stats
+
+
+@router.get("/compare", response_model=CatalogComparison)
+async def catalog_comparison(
+    current_user: dict = Depends(get_current_user),
+    db: aiosqlite.Connection = Depends(get_db),
+    stats: CatalogStats = Depends(get_catalog_stats),
+):
+    user_id = current_user["id"]
+    cursor = await db.execute("SELECT COUNT(*) FROM watched WHERE user_id = ?", (user_id,))
+    watched_total = (await cursor.fetchone())[0]
+
+    genres = {g["genre"]: g["watched"] for g in await load_genre_data(db, user_id) if g["watched"]}
+    decades = {d["decade"]: d["count"] for d in await load_timeline_data(db, user_id)}
+    revenue = {r["bucket"]: r["count"] for r in await load_revenue_data(db, user_id) if r["count"]}
+
     cursor = await db.execute(
-        "SELECT rating, COUNT(*) as count FROM watched WHERE user_id = ? AND rating IS NOT NULL GROUP BY rating ORDER BY rating",
-        (current_user["id"],),
+        """SELECT m.original_language AS language, COUNT(*) AS count
+           FROM watched w JOIN movies m ON w.movie_id = m.id
+           WHERE w.user_id = ? AND m.original_language != ''
+           GROUP BY m.original_language""",
+        (user_id,),
+    )
+    languages = {row["language"]: row["count"] for row in await cursor.fetchall()}
+
+    return CatalogComparison(
+        genres=stats.compare(genres, watched_total, stats.genres, stats.total),
+        decades=stats.compare(decades, watched_total, stats.decades, stats.total),
+        languages=stats.compare(languages, watched_total, stats.languages, stats.total),
+        revenue=stats.compare(
+            revenue, sum(revenue.values()),
+            dict(zip(REVENUE_BUCKETS, stats.revenue_buckets)), stats.revenue_total,
+        ),
     )
-    rows = await cursor.fetchall()
 
-    # Ensure all ratings 1-10 are represented
-    rating_map = {row["rating"]: row["count"] for row in rows}
-    data = [{"rating": r, "count": rating_map.get(r, 0)} for r in range(1, 11)]
 
-    return {"data": data}
+@router.get("/percentiles", response_model=CatalogPercentiles)
+async def catalog_percentiles(
+    current_user: dict = Depends(get_current_user),
+    db: aiosqlite.Connection = Depends(get_db),
+    stats: CatalogStats = Depends(get_catalog_stats),
+):
+    cursor = await db.execute(
+        """SELECT AVG(m.vote_average) AS vote_average,
+                  AVG(m.vote_count) AS vote_count,
+                  AVG(m.popularity) AS popularity
+           FROM watched w JOIN movies m ON w.movie_id = m.id
+           WHERE w.user_id = ?""",
+        (current_user["id"],),
+    )
+    row = await cursor.fetchone()
+
+    data = []
+    for column in ("vote_average", "vote_count", "popularity"):
+        if row[column] is None:
+            continue
+        data.append({
+            "metric": column,
+            "user_mean": round(row[column], 4),
+            "catalog_median": stats.percentiles[column][50],
+            "catalog_percentile": stats.percentile_rank(column, row[column]),
+        })
+    return CatalogPercentiles(data=data)
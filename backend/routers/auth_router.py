@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 import aiosqlite
 from database import get_db
-from auth import hash_password, verify_password, create_access_token
+from auth import hash_password_async, verify_password_async, create_access_token
 from dependencies import get_current_user
 from models import UserRegister, UserLogin, TokenResponse, UserResponse
+from timing import TimedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 
 @router.post("/register", response_model=TokenResponse)
@@ -21,7 +22,7 @@ async def register(user: UserRegister, db: aiosqlite.Connection = Depends(get_db
             detail="Username or email already registered",
         )
 
-    hashed = hash_password(user.password)
+    hashed = await hash_password_async(user.password)
     cursor = await db.execute(
         "INSERT INTO users (username, email, hashed_password) VALUES (?, ?, ?)",
         (user.username, user.email, hashed),
@@ -44,7 +45,7 @@ async def login(user: UserLogin, db: aiosqlite.Connection = Depends(get_db)):
         (user.username,),
     )
     row = await cursor.fetchone()
-    if not row or not verify_password(user.password, row["hashed_password"]):
+    if not row or not await verify_password_async(user.password, row["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password",
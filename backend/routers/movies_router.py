@@ -1,9 +1,15 @@
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 import aiosqlite
-from database import get_db
-from models import MovieResponse, MovieSearchResult
+from config import BULK_MAX_ITEMS
+from database import connect, get_db
+from models import DiscoverResult, MovieBatchResult, MovieResponse, MovieSearchResult, MovieSuggestion
+from result_cache import movie_results
+from services.discover import DiscoverCatalog
+from state import app_state
+from timing import TimedRoute, wrap_connection
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 MOVIE_COLUMNS = """id, title, original_title, overview, release_date, runtime,
     vote_average, vote_count, popularity, revenue, budget, original_language,
@@ -36,13 +42,35 @@ def row_to_movie(row) -> MovieResponse:
     )
 
 
+async def _with_connection(query, *args):
+    """``await query(db, *args)`` on a connection of its own.
+
+    Cached results are computed in a task that can outlive the request that
+    started it, so they cannot use the request-scoped connection.
+    """
+    db = wrap_connection(await connect())
+    try:
+        return await query(db, *args)
+    finally:
+        await db.close()
+
+
 @router.get("/search", response_model=MovieSearchResult)
 async def search_movies(
     q: str = Query(..., min_length=1),
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
-    db: aiosqlite.Connection = Depends(get_db),
 ):
+    if not q.strip():
+        raise HTTPException(status_code=422, detail="q must not be blank")
+    # The LIKE pattern keeps q as sent, spaces included, so only the key is
+    # normalized. LIKE ... COLLATE NOCASE only folds ASCII, so only ASCII
+    # queries share keys across case.
+    key = ("search", q.lower() if q.isascii() else q, page, limit)
+    return await movie_results.get(key, lambda: _with_connection(_search_page, q, page, limit))
+
+
+async def _search_page(db, q: str, page: int, limit: int) -> MovieSearchResult:
     offset = (page - 1) * limit
     search_term = f"%{q}%"
 
@@ -72,12 +100,79 @@ async def search_movies(
     )
 
 
+@router.get("/suggest", response_model=list[MovieSuggestion])
+async def suggest_movies(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=20),
+):
+    # Typeahead: served from the in-memory title index, no database round trip
+    return app_state["title_index"].suggestions(q, limit)
+
+
+def get_discover_catalog() -> DiscoverCatalog:
+    catalog = app_state.get("discover")
+    if catalog is None:
+        raise HTTPException(status_code=503, detail="Discover catalog not available")
+    return catalog
+
+
+@router.get("/discover", response_model=DiscoverResult)
+async def discover_movies(
+    genres: Optional[str] = Query(None, description="Comma-separated genre names"),
+    genre_match: str = Query("all", pattern="^(all|any)$"),
+    languages: Optional[str] = Query(None, description="Comma-separated original language codes"),
+    year_min: Optional[int] = None,
+    year_max: Optional[int] = None,
+    runtime_min: Optional[int] = Query(None, ge=0),
+    runtime_max: Optional[int] = Query(None, ge=0),
+    rating_min: Optional[float] = Query(None, ge=0, le=10),
+    votes_min: Optional[int] = Query(None, ge=0),
+    sort: str = Query("popularity", pattern="^(popularity|vote_average|release_date)$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100),
+    catalog: DiscoverCatalog = Depends(get_discover_catalog),
+    db: aiosqlite.Connection = Depends(get_db),
+):
+    # Filtering, sorting and facets run on the in-memory columns; SQLite
+    # only fetches the details of the page being returned
+    ids, total, facets = catalog.search(
+        genres=genres.split(",") if genres else None,
+        match_all_genres=genre_match == "all",
+        languages=languages.split(",") if languages else None,
+        year_min=year_min, year_max=year_max,
+        runtime_min=runtime_min, runtime_max=runtime_max,
+        rating_min=rating_min, votes_min=votes_min,
+        sort=sort, descending=order == "desc",
+        offset=(page - 1) * limit, limit=limit,
+    )
+
+    movies = []
+    if ids:
+        placeholders = ",".join("?" * len(ids))
+        cursor = await db.execute(f"SELECT {MOVIE_COLUMNS} FROM movies WHERE id IN ({placeholders})", ids)
+        rows = {row["id"]: row for row in await cursor.fetchall()}
+        movies = [row_to_movie(rows[i]) for i in ids if i in rows]
+
+    return DiscoverResult(
+        movies=movies,
+        total=total,
+        page=page,
+        pages=(total + limit - 1) // limit if total > 0 else 0,
+        facets=facets,
+    )
+
+
 @router.get("/popular", response_model=MovieSearchResult)
 async def popular_movies(
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
-    db: aiosqlite.Connection = Depends(get_db),
 ):
+    key = ("popular", page, limit)
+    return await movie_results.get(key, lambda: _with_connection(_popular_page, page, limit))
+
+
+async def _popular_page(db, page: int, limit: int) -> MovieSearchResult:
     offset = (page - 1) * limit
 
     cursor = await db.execute("SELECT COUNT(*) FROM movies")
@@ -100,6 +195,31 @@ async def popular_movies(
     )
 
 
+@router.get("/batch", response_model=MovieBatchResult)
+async def get_movies_batch(
+    ids: str = Query(..., description="Comma-separated movie ids"),
+    db: aiosqlite.Connection = Depends(get_db),
+):
+    """Several movies in one round trip, in the requested order."""
+    try:
+        requested = [int(x) for x in ids.split(",") if x.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    if not requested:
+        raise HTTPException(status_code=400, detail="No movie ids provided")
+    if len(requested) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} ids per request")
+
+    unique = list(dict.fromkeys(requested))
+    placeholders = ",".join("?" * len(unique))
+    cursor = await db.execute(f"SELECT {MOVIE_COLUMNS} FROM movies WHERE id IN ({placeholders})", unique)
+    rows = {row["id"]: row for row in await cursor.fetchall()}
+    return MovieBatchResult(
+        movies=[row_to_movie(rows[i]) for i in requested if i in rows],
+        missing=[i for i in unique if i not in rows],
+    )
+
+
 @router.get("/{movie_id}", response_model=MovieResponse)
 async def get_movie(movie_id: int, db: aiosqlite.Connection = Depends(get_db)):
     cursor = await db.execute(
@@ -1,21 +1,119 @@
-from fastapi import APIRouter, Depends, Query
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 import aiosqlite
+from config import ADMISSION_LIMITS, BLOCK_WEIGHT_VARIANTS, RECOMMENDATIONS_LATENCY_BUDGET_SECONDS
 from database import get_db
 from dependencies import get_current_user
+from metrics import inc
 from models import RecommendationsResponse, RecommendationItem, MovieResponse
 from state import app_state
-
-router = APIRouter()
+from timing import TimedRoute, timed
+
+router = APIRouter(route_class=TimedRoute)
+
+# Scoring threads, as many as the route admits at once. A request that gives
+# up at its deadline frees its admission slot before its scoring stops (at the
+# next shard boundary), so the cap on CPU is this pool, not the gate: scoring
+# abandoned under overload queues here instead of piling up on the default
+# executor, and queued work past its deadline never starts scoring.
+_scoring_pool = ThreadPoolExecutor(
+    max_workers=ADMISSION_LIMITS["/api/recommendations"]["max_concurrency"],
+    thread_name_prefix="recommend",
+)
+
+# Each query returns (value, count) aggregated over the user's watched movies
+PROFILE_QUERIES = {
+    "genres": (
+        """SELECT g.name AS value, COUNT(*) AS count
+           FROM watched w
+           JOIN movie_genres mg ON mg.movie_id = w.movie_id
+           JOIN genres g ON g.id = mg.genre_id
+           WHERE w.user_id = ?
+           GROUP BY g.id ORDER BY count DESC, g.name LIMIT 10"""
+    ),
+    "keywords": (
+        """SELECT k.name AS value, COUNT(*) AS count
+           FROM watched w
+           JOIN movie_keywords mk ON mk.movie_id = w.movie_id
+           JOIN keywords k ON k.id = mk.keyword_id
+           WHERE w.user_id = ?
+           GROUP BY k.id ORDER BY count DESC, k.name LIMIT 20"""
+    ),
+    "languages": (
+        """SELECT m.original_language AS value, COUNT(*) AS count
+           FROM watched w JOIN movies m ON w.movie_id = m.id
+           WHERE w.user_id = ? AND m.original_language != ''
+           GROUP BY m.original_language ORDER BY count DESC, value LIMIT 3"""
+    ),
+    "decades": (
+        """SELECT ((CAST(substr(m.release_date, 1, 4) AS INTEGER) / 10) * 10) || 's' AS value,
+                  COUNT(*) AS count
+           FROM watched w JOIN movies m ON w.movie_id = m.id
+           WHERE w.user_id = ? AND m.release_date GLOB '[0-9][0-9][0-9][0-9]*'
+           GROUP BY value ORDER BY count DESC, value LIMIT 3"""
+    ),
+}
+
+
+async def load_taste_profile(db: aiosqlite.Connection, user_id: int) -> dict[str, list[str]]:
+    profile = {}
+    for name, sql in PROFILE_QUERIES.items():
+        cursor = await db.execute(sql, (user_id,))
+        profile[name] = [row["value"] for row in await cursor.fetchall()]
+    return profile
+
+
+def parse_block_weights(weights: str) -> dict[str, float]:
+    """Parse ``genres:3,keywords:1.5`` into a block -> weight mapping."""
+    parsed = {}
+    for part in weights.split(","):
+        name, sep, value = part.partition(":")
+        try:
+            parsed[name.strip()] = float(value)
+        except ValueError:
+            sep = ""
+        if not sep:
+            raise HTTPException(status_code=400, detail=f"Invalid block weight: {part!r}")
+    return parsed
+
+
+def assign_weight_variant(user_id: int) -> Optional[str]:
+    """Deterministic A/B bucket for the block-weight experiment, if one is configured."""
+    if not BLOCK_WEIGHT_VARIANTS:
+        return None
+    variants = sorted(BLOCK_WEIGHT_VARIANTS)
+    digest = hashlib.sha256(str(user_id).encode()).digest()
+    return variants[int.from_bytes(digest[:8], "big") % len(variants)]
 
 
 @router.get("", response_model=RecommendationsResponse)
 async def get_recommendations(
+    request: Request,
     limit: int = Query(20, ge=1, le=50),
+    weights: Optional[str] = Query(None, description="Block weight overrides, e.g. genres:3,keywords:1"),
+    diversity: float = Query(0.0, ge=0.0, le=1.0, description="MMR trade-off: 0 ranks by relevance only"),
     current_user: dict = Depends(get_current_user),
     db: aiosqlite.Connection = Depends(get_db),
 ):
+    deadline = time.monotonic() + RECOMMENDATIONS_LATENCY_BUDGET_SECONDS
     engine = app_state["engine"]
 
+    # Explicit weights win over the user's A/B bucket
+    if weights is not None:
+        weight_variant, block_weights = "custom", parse_block_weights(weights)
+        try:
+            engine.block_factors(block_weights)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        weight_variant = assign_weight_variant(current_user["id"])
+        block_weights = BLOCK_WEIGHT_VARIANTS.get(weight_variant)
+
     # Get user's watched movies with ratings
     cursor = await db.execute(
         "SELECT movie_id, rating FROM watched WHERE user_id = ?",
@@ -24,7 +122,7 @@ async def get_recommendations(
     watched_rows = await cursor.fetchall()
 
     if not watched_rows:
-        return RecommendationsResponse(recommendations=[])
+        return RecommendationsResponse(recommendations=[], weight_variant=weight_variant)
 
     watched_ids = [row["movie_id"] for row in watched_rows]
     watched_ratings = [row["rating"] for row in watched_rows]
@@ -39,48 +137,37 @@ async def get_recommendations(
 
     exclude_ids = set(watched_ids) | set(watchlist_ids)
 
-    # Get recommendations
-    recs = engine.recommend(watched_ids, watched_ratings, exclude_ids, limit)
+    # Build user taste profile for explanations
+    with timed("profile"):
+        profile = await load_taste_profile(db, current_user["id"])
+    user_top_genres = profile["genres"]
+    user_top_keywords = profile["keywords"]
+    user_languages = profile["languages"]
+    user_decades = profile["decades"]
+
+    # Full scoring runs off the event loop within the latency budget; when the
+    # admission gate is saturated or the budget runs out, serve popular movies
+    # from the user's top genres instead.
+    fallback_reason = "overloaded" if getattr(request.state, "admission_degraded", False) else None
+    if fallback_reason is None:
+        try:
+            with timed("recommend"):
+                scoring = asyncio.get_running_loop().run_in_executor(_scoring_pool, partial(
+                    engine.recommend, watched_ids, watched_ratings, exclude_ids, limit, block_weights,
+                    diversity, deadline=deadline,
+                ))
+                recs = await asyncio.wait_for(scoring, timeout=max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            fallback_reason = "deadline"
+    if fallback_reason is not None:
+        inc("recommendations_fallback_total", reason=fallback_reason)
+        recs = app_state["fallback"].recommend(user_top_genres, exclude_ids, limit)
+
+    if weight_variant is not None:
+        inc("recommendations_weight_variant_total", variant=weight_variant)
 
     if not recs:
-        return RecommendationsResponse(recommendations=[])
-
-    # Build user taste profile for explanations
-    cursor = await db.execute(
-        """SELECT m.genres, m.keywords, m.original_language, m.release_date
-           FROM watched w JOIN movies m ON w.movie_id = m.id
-           WHERE w.user_id = ?""",
-        (current_user["id"],),
-    )
-    profile_rows = await cursor.fetchall()
-
-    # Aggregate user preferences
-    from collections import Counter
-    genre_counter = Counter()
-    keyword_counter = Counter()
-    lang_counter = Counter()
-    decade_counter = Counter()
-
-    for row in profile_rows:
-        if row["genres"]:
-            for g in row["genres"].split(","):
-                genre_counter[g.strip()] += 1
-        if row["keywords"]:
-            for k in row["keywords"].split(","):
-                keyword_counter[k.strip()] += 1
-        if row["original_language"]:
-            lang_counter[row["original_language"]] += 1
-        if row["release_date"]:
-            try:
-                year = int(row["release_date"][:4])
-                decade_counter[f"{(year // 10) * 10}s"] += 1
-            except (ValueError, IndexError):
-                pass
-
-    user_top_genres = [g for g, _ in genre_counter.most_common(10)]
-    user_top_keywords = [k for k, _ in keyword_counter.most_common(20)]
-    user_languages = [l for l, _ in lang_counter.most_common(3)]
-    user_decades = [d for d, _ in decade_counter.most_common(3)]
+        return RecommendationsResponse(recommendations=[], weight_variant=weight_variant)
 
     # Fetch movie details and build response
     rec_movie_ids = [r["movie_id"] for r in recs]
@@ -115,16 +202,17 @@ async def get_recommendations(
             imdb_id=row["imdb_id"],
         )
 
-        reasons = engine.explain(
-            movie_genres=row["genres"] or "",
-            movie_keywords=row["keywords"] or "",
-            movie_language=row["original_language"] or "",
-            movie_release_date=row["release_date"] or "",
-            user_top_genres=user_top_genres,
-            user_top_keywords=user_top_keywords,
-            user_languages=user_languages,
-            user_decades=user_decades,
-        )
+        with timed("explain"):
+            reasons = engine.explain(
+                movie_genres=row["genres"] or "",
+                movie_keywords=row["keywords"] or "",
+                movie_language=row["original_language"] or "",
+                movie_release_date=row["release_date"] or "",
+                user_top_genres=user_top_genres,
+                user_top_keywords=user_top_keywords,
+                user_languages=user_languages,
+                user_decades=user_decades,
+            )
 
         recommendations.append(RecommendationItem(
             movie=movie,
@@ -132,4 +220,9 @@ async def get_recommendations(
             reasons=reasons,
         ))
 
-    return RecommendationsResponse(recommendations=recommendations)
+    return RecommendationsResponse(
+        recommendations=recommendations,
+        fallback=fallback_reason is not None,
+        fallback_reason=fallback_reason,
+        weight_variant=weight_variant,
+    )
@@ -1,50 +1,94 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 import aiosqlite
-from database import get_db
+from database import connect, fetch_ids, get_db, values_placeholders
 from dependencies import get_current_user
-from models import WatchedCreate, WatchedUpdate, WatchedResponse, MovieResponse
+from models import (
+    BulkItemResult, BulkResult, MovieResponse, WatchedBulkRequest, WatchedCreate, WatchedResponse, WatchedUpdate,
+)
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from timing import TimedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
-
-@router.get("", response_model=list[WatchedResponse])
-async def get_watched(
-    current_user: dict = Depends(get_current_user),
-    db: aiosqlite.Connection = Depends(get_db),
-):
-    cursor = await db.execute(
-        """SELECT w.id, w.movie_id, w.rating, w.notes, w.watched_date, w.created_at,
+WATCHED_SELECT = """SELECT w.id, w.movie_id, w.rating, w.notes, w.watched_date, w.created_at,
                   m.id as m_id, m.title, m.original_title, m.overview, m.release_date,
                   m.runtime, m.vote_average, m.vote_count, m.popularity, m.revenue,
                   m.budget, m.original_language, m.genres, m.keywords,
                   m.production_companies, m.spoken_languages, m.poster_path,
                   m.backdrop_path, m.tagline, m.imdb_id
-           FROM watched w JOIN movies m ON w.movie_id = m.id
-           WHERE w.user_id = ?
-           ORDER BY w.created_at DESC""",
-        (current_user["id"],),
+           FROM watched w JOIN movies m ON w.movie_id = m.id"""
+
+
+def row_to_watched(row) -> WatchedResponse:
+    movie = MovieResponse(
+        id=row["m_id"], title=row["title"], original_title=row["original_title"],
+        overview=row["overview"], release_date=row["release_date"],
+        runtime=row["runtime"], vote_average=row["vote_average"],
+        vote_count=row["vote_count"], popularity=row["popularity"],
+        revenue=row["revenue"], budget=row["budget"],
+        original_language=row["original_language"], genres=row["genres"],
+        keywords=row["keywords"], production_companies=row["production_companies"],
+        spoken_languages=row["spoken_languages"], poster_path=row["poster_path"],
+        backdrop_path=row["backdrop_path"], tagline=row["tagline"],
+        imdb_id=row["imdb_id"],
     )
-    rows = await cursor.fetchall()
-    results = []
-    for row in rows:
-        movie = MovieResponse(
-            id=row["m_id"], title=row["title"], original_title=row["original_title"],
-            overview=row["overview"], release_date=row["release_date"],
-            runtime=row["runtime"], vote_average=row["vote_average"],
-            vote_count=row["vote_count"], popularity=row["popularity"],
-            revenue=row["revenue"], budget=row["budget"],
-            original_language=row["original_language"], genres=row["genres"],
-            keywords=row["keywords"], production_companies=row["production_companies"],
-            spoken_languages=row["spoken_languages"], poster_path=row["poster_path"],
-            backdrop_path=row["backdrop_path"], tagline=row["tagline"],
-            imdb_id=row["imdb_id"],
-        )
-        results.append(WatchedResponse(
-            id=row["id"], movie_id=row["movie_id"], rating=row["rating"],
-            notes=row["notes"], watched_date=row["watched_date"],
-            created_at=row["created_at"], movie=movie,
-        ))
-    return results
+    return WatchedResponse(
+        id=row["id"], movie_id=row["movie_id"], rating=row["rating"],
+        notes=row["notes"], watched_date=row["watched_date"],
+        created_at=row["created_at"], movie=movie,
+    )
+
+
+@router.get("", response_model=list[WatchedResponse])
+async def get_watched(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user),
+    db: aiosqlite.Connection = Depends(get_db),
+):
+    # Keyset pagination over idx_watched_user_created; without a limit the
+    # whole history is returned for older clients.
+    sql = WATCHED_SELECT + " WHERE w.user_id = ?"
+    params: list = [current_user["id"]]
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        sql += " AND (w.created_at, w.id) < (?, ?)"
+        params += [created_at, row_id]
+    sql += " ORDER BY w.created_at DESC, w.id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    result = await db.execute(sql, params)
+    rows = await result.fetchall()
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last["created_at"], last["id"])
+    return [row_to_watched(row) for row in rows]
+
+
+@router.get("/export")
+async def export_watched(current_user: dict = Depends(get_current_user)):
+    # The request-scoped connection from get_db is closed before a streaming
+    # body is sent, so the generator owns its own connection.
+    async def stream_rows():
+        db = await connect()
+        try:
+            async with db.execute(
+                WATCHED_SELECT + """ WHERE w.user_id = ?
+                ORDER BY w.created_at DESC, w.id DESC""",
+                (current_user["id"],),
+            ) as cursor:
+                async for row in cursor:
+                    yield row_to_watched(row).model_dump_json() + "\n"
+        finally:
+            await db.close()
+
+    return StreamingResponse(stream_rows(), media_type="application/x-ndjson")
 
 
 @router.post("", response_model=WatchedResponse, status_code=status.HTTP_201_CREATED)
@@ -86,6 +130,80 @@ async def add_watched(
     )
 
 
+@router.post("/bulk", response_model=BulkResult)
+async def bulk_update_watched(
+    data: WatchedBulkRequest,
+    current_user: dict = Depends(get_current_user),
+    db: aiosqlite.Connection = Depends(get_db),
+):
+    """Apply ``remove`` then ``add`` in one transaction, with a result per item.
+
+    Each result carries the status the single-item endpoint would have
+    returned (201, 204, 404 or 409, and 422 for a rating outside 1-10);
+    failed items do not abort the others. Added movies leave the watchlist.
+    """
+    user_id = current_user["id"]
+    add_ids = [item.movie_id for item in data.add]
+    movies = await fetch_ids(db, "SELECT id FROM movies WHERE id IN ({ids})", add_ids)
+    watched = await fetch_ids(
+        db, "SELECT movie_id FROM watched WHERE user_id = ? AND movie_id IN ({ids})",
+        add_ids + data.remove, user_id,
+    )
+
+    results = []
+    removed = []
+    for movie_id in data.remove:
+        if movie_id in watched:
+            watched.discard(movie_id)
+            removed.append(movie_id)
+            results.append(BulkItemResult(movie_id=movie_id, action="remove", status=204))
+        else:
+            results.append(BulkItemResult(movie_id=movie_id, action="remove", status=404,
+                                          detail="Movie not in watched list"))
+    if removed:
+        await db.execute(
+            f"DELETE FROM watched WHERE user_id = ? AND movie_id IN ({','.join('?' * len(removed))})",
+            [user_id, *removed],
+        )
+
+    added = {}
+    for item in data.add:
+        movie_id = item.movie_id
+        if movie_id not in movies:
+            result = BulkItemResult(movie_id=movie_id, action="add", status=404, detail="Movie not found")
+        elif movie_id in watched or movie_id in added:
+            result = BulkItemResult(movie_id=movie_id, action="add", status=409,
+                                    detail="Movie already in watched list")
+        elif not 1 <= item.rating <= 10:
+            result = BulkItemResult(movie_id=movie_id, action="add", status=422,
+                                    detail="Rating must be between 1 and 10")
+        else:
+            result = BulkItemResult(movie_id=movie_id, action="add", status=201)
+            added[movie_id] = (item, result)
+        results.append(result)
+    if added:
+        ids = list(added)
+        await db.execute(
+            f"DELETE FROM watchlist WHERE user_id = ? AND movie_id IN ({','.join('?' * len(ids))})",
+            [user_id, *ids],
+        )
+        # rows a concurrent request inserted first are skipped, not returned
+        cursor = await db.execute(
+            f"""INSERT INTO watched (user_id, movie_id, rating, notes, watched_date)
+                VALUES {values_placeholders(len(added), 5)}
+                ON CONFLICT (user_id, movie_id) DO NOTHING RETURNING id, movie_id""",
+            [value for item, _ in added.values()
+             for value in (user_id, item.movie_id, item.rating, item.notes, item.watched_date)],
+        )
+        for row_id, movie_id in await cursor.fetchall():
+            added.pop(movie_id)[1].id = row_id
+        for _, result in added.values():
+            result.status, result.detail = 409, "Movie already in watched list"
+
+    await db.commit()
+    return BulkResult(results=results)
+
+
 @router.put("/{movie_id}", response_model=WatchedResponse)
 async def update_watched(
     movie_id: int,
@@ -1,49 +1,95 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 import aiosqlite
-from database import get_db
+from database import connect, fetch_ids, get_db, values_placeholders
 from dependencies import get_current_user
-from models import WatchlistCreate, WatchlistResponse, WatchedResponse, MoveToWatchedRequest, MovieResponse
+from models import (
+    BulkItemResult, BulkResult, MoveToWatchedRequest, MovieResponse, WatchedResponse, WatchlistBulkRequest,
+    WatchlistCreate, WatchlistResponse,
+)
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from timing import TimedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 
-@router.get("", response_model=list[WatchlistResponse])
-async def get_watchlist(
-    current_user: dict = Depends(get_current_user),
-    db: aiosqlite.Connection = Depends(get_db),
-):
-    cursor = await db.execute(
-        """SELECT wl.id, wl.movie_id, wl.added_at,
+WATCHLIST_SELECT = """SELECT wl.id, wl.movie_id, wl.added_at,
                   m.id as m_id, m.title, m.original_title, m.overview, m.release_date,
                   m.runtime, m.vote_average, m.vote_count, m.popularity, m.revenue,
                   m.budget, m.original_language, m.genres, m.keywords,
                   m.production_companies, m.spoken_languages, m.poster_path,
                   m.backdrop_path, m.tagline, m.imdb_id
-           FROM watchlist wl JOIN movies m ON wl.movie_id = m.id
-           WHERE wl.user_id = ?
-           ORDER BY wl.added_at DESC""",
-        (current_user["id"],),
+           FROM watchlist wl JOIN movies m ON wl.movie_id = m.id"""
+
+
+def row_to_watchlist(row) -> WatchlistResponse:
+    movie = MovieResponse(
+        id=row["m_id"], title=row["title"], original_title=row["original_title"],
+        overview=row["overview"], release_date=row["release_date"],
+        runtime=row["runtime"], vote_average=row["vote_average"],
+        vote_count=row["vote_count"], popularity=row["popularity"],
+        revenue=row["revenue"], budget=row["budget"],
+        original_language=row["original_language"], genres=row["genres"],
+        keywords=row["keywords"], production_companies=row["production_companies"],
+        spoken_languages=row["spoken_languages"], poster_path=row["poster_path"],
+        backdrop_path=row["backdrop_path"], tagline=row["tagline"],
+        imdb_id=row["imdb_id"],
     )
-    rows = await cursor.fetchall()
-    results = []
-    for row in rows:
-        movie = MovieResponse(
-            id=row["m_id"], title=row["title"], original_title=row["original_title"],
-            overview=row["overview"], release_date=row["release_date"],
-            runtime=row["runtime"], vote_average=row["vote_average"],
-            vote_count=row["vote_count"], popularity=row["popularity"],
-            revenue=row["revenue"], budget=row["budget"],
-            original_language=row["original_language"], genres=row["genres"],
-            keywords=row["keywords"], production_companies=row["production_companies"],
-            spoken_languages=row["spoken_languages"], poster_path=row["poster_path"],
-            backdrop_path=row["backdrop_path"], tagline=row["tagline"],
-            imdb_id=row["imdb_id"],
-        )
-        results.append(WatchlistResponse(
-            id=row["id"], movie_id=row["movie_id"],
-            added_at=row["added_at"], movie=movie,
-        ))
-    return results
+    return WatchlistResponse(
+        id=row["id"], movie_id=row["movie_id"],
+        added_at=row["added_at"], movie=movie,
+    )
+
+
+@router.get("", response_model=list[WatchlistResponse])
+async def get_watchlist(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user),
+    db: aiosqlite.Connection = Depends(get_db),
+):
+    # Keyset pagination over idx_watchlist_user_added; without a limit the
+    # whole watchlist is returned for older clients.
+    sql = WATCHLIST_SELECT + " WHERE wl.user_id = ?"
+    params: list = [current_user["id"]]
+    if cursor:
+        added_at, row_id = decode_cursor(cursor)
+        sql += " AND (wl.added_at, wl.id) < (?, ?)"
+        params += [added_at, row_id]
+    sql += " ORDER BY wl.added_at DESC, wl.id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    result = await db.execute(sql, params)
+    rows = await result.fetchall()
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last["added_at"], last["id"])
+    return [row_to_watchlist(row) for row in rows]
+
+
+@router.get("/export")
+async def export_watchlist(current_user: dict = Depends(get_current_user)):
+    # The request-scoped connection from get_db is closed before a streaming
+    # body is sent, so the generator owns its own connection.
+    async def stream_rows():
+        db = await connect()
+        try:
+            async with db.execute(
+                WATCHLIST_SELECT + """ WHERE wl.user_id = ?
+                ORDER BY wl.added_at DESC, wl.id DESC""",
+                (current_user["id"],),
+            ) as cursor:
+                async for row in cursor:
+                    yield row_to_watchlist(row).model_dump_json() + "\n"
+        finally:
+            await db.close()
+
+    return StreamingResponse(stream_rows(), media_type="application/x-ndjson")
 
 
 @router.post("", response_model=WatchlistResponse, status_code=status.HTTP_201_CREATED)
@@ -77,6 +123,72 @@ async def add_to_watchlist(
     return WatchlistResponse(id=cursor.lastrowid, movie_id=data.movie_id)
 
 
+@router.post("/bulk", response_model=BulkResult)
+async def bulk_update_watchlist(
+    data: WatchlistBulkRequest,
+    current_user: dict = Depends(get_current_user),
+    db: aiosqlite.Connection = Depends(get_db),
+):
+    """Apply ``remove`` then ``add`` in one transaction, with a result per item.
+
+    Each result carries the status the single-item endpoint would have
+    returned (201, 204, 404 or 409); failed items do not abort the others.
+    """
+    user_id = current_user["id"]
+    movies = await fetch_ids(db, "SELECT id FROM movies WHERE id IN ({ids})", data.add)
+    watched = await fetch_ids(
+        db, "SELECT movie_id FROM watched WHERE user_id = ? AND movie_id IN ({ids})", data.add, user_id
+    )
+    listed = await fetch_ids(
+        db, "SELECT movie_id FROM watchlist WHERE user_id = ? AND movie_id IN ({ids})",
+        data.add + data.remove, user_id,
+    )
+
+    results = []
+    removed = []
+    for movie_id in data.remove:
+        if movie_id in listed:
+            listed.discard(movie_id)
+            removed.append(movie_id)
+            results.append(BulkItemResult(movie_id=movie_id, action="remove", status=204))
+        else:
+            results.append(BulkItemResult(movie_id=movie_id, action="remove", status=404,
+                                          detail="Movie not in watchlist"))
+    if removed:
+        await db.execute(
+            f"DELETE FROM watchlist WHERE user_id = ? AND movie_id IN ({','.join('?' * len(removed))})",
+            [user_id, *removed],
+        )
+
+    added = {}
+    for movie_id in data.add:
+        if movie_id not in movies:
+            result = BulkItemResult(movie_id=movie_id, action="add", status=404, detail="Movie not found")
+        elif movie_id in watched:
+            result = BulkItemResult(movie_id=movie_id, action="add", status=409,
+                                    detail="Movie already in watched list")
+        elif movie_id in listed or movie_id in added:
+            result = BulkItemResult(movie_id=movie_id, action="add", status=409,
+                                    detail="Movie already in watchlist")
+        else:
+            result = added[movie_id] = BulkItemResult(movie_id=movie_id, action="add", status=201)
+        results.append(result)
+    if added:
+        # rows a concurrent request inserted first are skipped, not returned
+        cursor = await db.execute(
+            f"""INSERT INTO watchlist (user_id, movie_id) VALUES {values_placeholders(len(added), 2)}
+                ON CONFLICT (user_id, movie_id) DO NOTHING RETURNING id, movie_id""",
+            [value for movie_id in added for value in (user_id, movie_id)],
+        )
+        for row_id, movie_id in await cursor.fetchall():
+            added.pop(movie_id).id = row_id
+        for result in added.values():
+            result.status, result.detail = 409, "Movie already in watchlist"
+
+    await db.commit()
+    return BulkResult(results=results)
+
+
 @router.delete("/{movie_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def remove_from_watchlist(
     movie_id: int,
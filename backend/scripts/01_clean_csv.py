@@ -7,38 +7,127 @@ Filters:
 - has genres
 - not adult content
 
+By default the CSV is streamed in record batches with pyarrow: only the needed
+columns are parsed, numeric columns are cast in Arrow (unparseable cells
+become null, as pandas' errors="coerce" does, and rows without a numeric id
+are dropped), filters are applied per batch and only the current top-N by
+popularity is kept in memory. ``--mode pandas`` keeps the original whole-file
+pandas path.
+
+The step is skipped when the raw CSV (size and mtime) and --top-n match the
+previous run recorded in data/manifest/clean.json; pass --force to rerun.
+
 Outputs: backend/data/movies_clean.parquet (~200k rows)
 """
 
+import argparse
+import os
+import sys
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.pipeline_manifest import StageManifest, file_fingerprint  # noqa: E402
+
 # Check Docker mount point first, then fall back to local dev path
 _DOCKER_CSV = Path("/app/TMDB_movie_dataset_v11.csv")
 _LOCAL_CSV = Path(__file__).resolve().parent.parent.parent / "TMDB_movie_dataset_v11.csv"
 RAW_CSV = _DOCKER_CSV if _DOCKER_CSV.exists() else _LOCAL_CSV
-OUTPUT_DIR = Path(__file__).resolve().parent.parent / "data"
+OUTPUT_DIR = Path(os.getenv("DATA_DIR", Path(__file__).resolve().parent.parent / "data"))
 OUTPUT_PATH = OUTPUT_DIR / "movies_clean.parquet"
 
+TOP_N = 200_000
+ROW_GROUP_SIZE = 50_000
+
+TEXT_COLUMNS = [
+    "keywords", "production_companies", "overview", "tagline",
+    "poster_path", "backdrop_path", "imdb_id", "spoken_languages",
+    "original_title", "original_language",
+]
+
+# Columns read from the CSV (in CSV order); status/adult are only used to filter.
+# Numeric columns are read as strings and cast by parse_numeric, so one dirty
+# cell nulls that cell instead of failing the whole read.
+CSV_COLUMN_TYPES = {
+    "id": pa.int64(),
+    "title": pa.string(),
+    "vote_average": pa.float64(),
+    "vote_count": pa.float64(),
+    "status": pa.string(),
+    "release_date": pa.string(),
+    "revenue": pa.float64(),
+    "runtime": pa.float64(),
+    "adult": pa.string(),
+    "backdrop_path": pa.string(),
+    "budget": pa.float64(),
+    "imdb_id": pa.string(),
+    "original_language": pa.string(),
+    "original_title": pa.string(),
+    "overview": pa.string(),
+    "popularity": pa.float64(),
+    "poster_path": pa.string(),
+    "tagline": pa.string(),
+    "genres": pa.string(),
+    "production_companies": pa.string(),
+    "spoken_languages": pa.string(),
+    "keywords": pa.string(),
+}
+
+NUMERIC_COLUMNS = {name: t for name, t in CSV_COLUMN_TYPES.items() if t != pa.string()}
+_INTEGER = r"^\s*[-+]?\d{1,18}\s*$"
+_DECIMAL = r"^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$"
+
+OUTPUT_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("title", pa.string()),
+    ("vote_average", pa.float64()),
+    ("vote_count", pa.int64()),
+    ("release_date", pa.string()),
+    ("revenue", pa.int64()),
+    ("runtime", pa.int64()),
+    ("backdrop_path", pa.string()),
+    ("budget", pa.int64()),
+    ("imdb_id", pa.string()),
+    ("original_language", pa.string()),
+    ("original_title", pa.string()),
+    ("overview", pa.string()),
+    ("popularity", pa.float64()),
+    ("poster_path", pa.string()),
+    ("tagline", pa.string()),
+    ("genres", pa.string()),
+    ("production_companies", pa.string()),
+    ("spoken_languages", pa.string()),
+    ("keywords", pa.string()),
+])
 
-def main():
-    print(f"Reading {RAW_CSV}...")
-    df = pd.read_csv(RAW_CSV, low_memory=False)
-    print(f"  Raw rows: {len(df)}")
 
+def filter_movies(df, verbose=False):
     # Filter to usable movies
     df = df[df["status"] == "Released"]
-    print(f"  After status=Released: {len(df)}")
+    if verbose:
+        print(f"  After status=Released: {len(df)}")
 
     df = df[df["vote_count"] >= 1]
-    print(f"  After vote_count>=1: {len(df)}")
+    if verbose:
+        print(f"  After vote_count>=1: {len(df)}")
 
     df = df[df["genres"].notna() & (df["genres"].str.strip() != "")]
-    print(f"  After has genres: {len(df)}")
+    if verbose:
+        print(f"  After has genres: {len(df)}")
 
     # Exclude adult content
     df = df[df["adult"].astype(str).str.lower() != "true"]
-    print(f"  After excluding adult: {len(df)}")
+    if verbose:
+        print(f"  After excluding adult: {len(df)}")
+    return df
+
+
+def clean_movies(df):
+    df = df.copy()
 
     # Clean numeric columns
     for col in ["revenue", "budget"]:
@@ -52,26 +141,148 @@ def main():
     df["release_date"] = pd.to_datetime(df["release_date"], errors="coerce").dt.strftime("%Y-%m-%d")
 
     # Fill NaN text fields
-    text_cols = [
-        "keywords", "production_companies", "overview", "tagline",
-        "poster_path", "backdrop_path", "imdb_id", "spoken_languages",
-        "original_title", "original_language",
-    ]
-    for col in text_cols:
+    for col in TEXT_COLUMNS:
         df[col] = df[col].fillna("")
 
     # Drop unnecessary columns
-    df = df.drop(columns=["adult", "status", "homepage", "production_countries"], errors="ignore")
+    return df.drop(columns=["adult", "status", "homepage", "production_countries"], errors="ignore")
 
-    # Sort by popularity, take top 200k for dev performance
-    df = df.sort_values("popularity", ascending=False).head(200_000)
-    df = df.reset_index(drop=True)
 
-    # Save
+def write_parquet(df):
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    df.to_parquet(OUTPUT_PATH, index=False)
-    print(f"\nSaved {len(df)} movies to {OUTPUT_PATH}")
-    print(f"Columns: {list(df.columns)}")
+    if df.empty:
+        table = OUTPUT_SCHEMA.empty_table()
+    else:
+        table = pa.Table.from_pandas(df, schema=OUTPUT_SCHEMA, preserve_index=False)
+    with pq.ParquetWriter(OUTPUT_PATH, OUTPUT_SCHEMA) as writer:
+        for batch in table.to_batches(max_chunksize=ROW_GROUP_SIZE):
+            writer.write_batch(batch)
+
+
+def run_in_memory(top_n):
+    df = pd.read_csv(RAW_CSV, low_memory=False)
+    print(f"  Raw rows: {len(df)}")
+
+    df = clean_movies(filter_movies(df, verbose=True))
+
+    # Sort by popularity, take top N for dev performance
+    df = df.sort_values("popularity", ascending=False)
+    if top_n:
+        df = df.head(top_n)
+    df = df.reset_index(drop=True)
+
+    write_parquet(df)
+    return len(df)
+
+
+def parse_numeric(batch):
+    """Cast NUMERIC_COLUMNS from strings; cells that are not numbers become null."""
+    columns = []
+    for name in batch.schema.names:
+        column = batch.column(name)
+        if name in NUMERIC_COLUMNS:
+            target = NUMERIC_COLUMNS[name]
+            valid = pc.match_substring_regex(column, _INTEGER if pa.types.is_integer(target) else _DECIMAL)
+            column = pc.cast(pc.if_else(valid, pc.utf8_trim_whitespace(column), None), target)
+        columns.append(column)
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+
+def run_streaming(top_n, block_size):
+    reader = pv.open_csv(
+        RAW_CSV,
+        read_options=pv.ReadOptions(block_size=block_size),
+        parse_options=pv.ParseOptions(newlines_in_values=True),
+        convert_options=pv.ConvertOptions(
+            include_columns=list(CSV_COLUMN_TYPES),
+            column_types={name: pa.string() for name in CSV_COLUMN_TYPES},
+            strings_can_be_null=True,
+        ),
+    )
+
+    raw_rows = 0
+    dropped_rows = 0
+    kept_rows = 0
+    # Full-catalog mode writes batches through to a temporary file that
+    # replaces OUTPUT_PATH only once the whole CSV has been read.
+    tmp_path = OUTPUT_PATH.with_name(f"tmp_{OUTPUT_PATH.name}")
+    writer = None
+    # Best top_n rows seen so far; only rows beating the current cutoff are
+    # considered, so memory stays at top_n + one batch.
+    top = pd.DataFrame()
+    cutoff = float("-inf")
+
+    try:
+        for batch in reader:
+            raw_rows += batch.num_rows
+            batch = parse_numeric(batch)
+            has_id = pc.is_valid(batch.column("id"))
+            dropped_rows += batch.num_rows - pc.sum(has_id).as_py()
+            df = clean_movies(filter_movies(batch.filter(has_id).to_pandas()))
+            kept_rows += len(df)
+
+            if not top_n:
+                # Full-catalog mode: nothing to rank, write each batch through.
+                if writer is None:
+                    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+                    writer = pq.ParquetWriter(tmp_path, OUTPUT_SCHEMA)
+                writer.write_table(pa.Table.from_pandas(df, schema=OUTPUT_SCHEMA, preserve_index=False))
+                continue
+
+            df = df[df["popularity"] > cutoff]
+            if df.empty:
+                continue
+            top = pd.concat([top, df], ignore_index=True).nlargest(top_n, "popularity")
+            if len(top) == top_n:
+                cutoff = top["popularity"].iloc[-1]
+    except BaseException:
+        if writer is not None:
+            writer.close()
+            tmp_path.unlink(missing_ok=True)
+        raise
+
+    print(f"  Raw rows: {raw_rows}")
+    if dropped_rows:
+        print(f"  Dropped without a numeric id: {dropped_rows}")
+    print(f"  After filters: {kept_rows}")
+
+    if writer is not None:
+        writer.close()
+        os.replace(tmp_path, OUTPUT_PATH)
+        return kept_rows
+
+    top = top.sort_values("popularity", ascending=False).reset_index(drop=True)
+    write_parquet(top)
+    return len(top)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["stream", "pandas"], default="stream")
+    parser.add_argument("--top-n", type=int, default=TOP_N,
+                        help="keep the N most popular movies (0 keeps all)")
+    parser.add_argument("--block-size-mb", type=int, default=64,
+                        help="CSV bytes parsed per batch in stream mode")
+    parser.add_argument("--force", action="store_true",
+                        help="rerun even if the CSV is unchanged since the last run")
+    args = parser.parse_args()
+
+    manifest = StageManifest(OUTPUT_DIR, "clean")
+    inputs = {"csv": file_fingerprint(RAW_CSV), "top_n": args.top_n}
+    if not args.force and OUTPUT_PATH.exists() and manifest.load_meta() == inputs:
+        print(f"{RAW_CSV} unchanged since last run, skipping.")
+        return
+
+    manifest.clear()
+    print(f"Reading {RAW_CSV} ({args.mode} mode)...")
+    if args.mode == "stream":
+        n = run_streaming(args.top_n, args.block_size_mb * 1024 * 1024)
+    else:
+        n = run_in_memory(args.top_n)
+    manifest.save(meta=inputs)
+
+    print(f"\nSaved {n} movies to {OUTPUT_PATH}")
+    print(f"Columns: {OUTPUT_SCHEMA.names}")
     print(f"File size: {OUTPUT_PATH.stat().st_size / 1024 / 1024:.1f} MB")
 
 
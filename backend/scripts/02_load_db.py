@@ -2,18 +2,39 @@
 Step 2: Load cleaned Parquet into SQLite database.
 
 Creates the full schema (users, movies, watched, watchlist tables)
-and inserts movie data from the Parquet file.
+and bulk-inserts movie data from the Parquet file: record batches are
+streamed into executemany inside a single transaction with journaling off,
+and indexes are built (then ANALYZEd) only after the data is in.
+
+Genres and keywords are also normalized into genres/movie_genres and
+keywords/movie_keywords so analytics can aggregate them in SQL instead of
+splitting strings in Python.
+
+After the first load, only movies whose content hash changed since the last
+successful run (see services/pipeline_manifest.py) are upserted or deleted,
+and the step is skipped when nothing changed. --full forces a reload.
 
 Outputs: backend/data/app.db
 """
 
+import argparse
+import os
 import sqlite3
-import pandas as pd
+import sys
+import time
+import pyarrow.parquet as pq
 from pathlib import Path
 
-DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.catalog_updates import (  # noqa: E402
+    MOVIE_COLUMNS, delete_movies, insert_tags, load_tag_ids, prepare_movies, upsert_movies,
+)
+from services.pipeline_manifest import StageManifest, diff_hashes, hash_parquet  # noqa: E402
+
+DATA_DIR = Path(os.getenv("DATA_DIR", Path(__file__).resolve().parent.parent / "data"))
 PARQUET_PATH = DATA_DIR / "movies_clean.parquet"
 DB_PATH = DATA_DIR / "app.db"
+BATCH_SIZE = 20_000
 
 SCHEMA_SQL = """
 CREATE TABLE IF NOT EXISTS users (
@@ -70,34 +91,158 @@ CREATE TABLE IF NOT EXISTS watchlist (
     FOREIGN KEY (movie_id) REFERENCES movies(id),
     UNIQUE(user_id, movie_id)
 );
+
+CREATE INDEX IF NOT EXISTS idx_watched_user_created ON watched(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_watchlist_user_added ON watchlist(user_id, added_at);
 """
 
+INSERT_MOVIE_SQL = (
+    f"INSERT OR REPLACE INTO movies ({', '.join(MOVIE_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(MOVIE_COLUMNS))})"
+)
 
-def main():
-    print(f"Reading {PARQUET_PATH}...")
-    df = pd.read_parquet(PARQUET_PATH)
-    print(f"  Loaded {len(df)} movies")
+# Rebuilt from the movies data on every load
+TAGS_SCHEMA_SQL = """
+DROP TABLE IF EXISTS movie_genres;
+DROP TABLE IF EXISTS genres;
+DROP TABLE IF EXISTS movie_keywords;
+DROP TABLE IF EXISTS keywords;
+
+CREATE TABLE genres (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE movie_genres (
+    movie_id INTEGER NOT NULL,
+    genre_id INTEGER NOT NULL,
+    PRIMARY KEY (movie_id, genre_id)
+) WITHOUT ROWID;
+
+CREATE TABLE keywords (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE movie_keywords (
+    movie_id INTEGER NOT NULL,
+    keyword_id INTEGER NOT NULL,
+    PRIMARY KEY (movie_id, keyword_id)
+) WITHOUT ROWID;
+"""
+
+TAGS_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_movie_genres_genre ON movie_genres(genre_id, movie_id);
+CREATE INDEX IF NOT EXISTS idx_movie_keywords_keyword ON movie_keywords(keyword_id, movie_id);
+"""
+
+
+def insert_movies(conn, batch):
+    """Insert one Arrow record batch into movies (last row wins on duplicate ids)."""
+    columns = [batch.column(name).to_pylist() for name in MOVIE_COLUMNS]
+    # title is NOT NULL in the schema; a handful of TMDB rows have none
+    columns[1] = [title or "" for title in columns[1]]
+    conn.executemany(INSERT_MOVIE_SQL, zip(*columns))
 
-    # Connect to SQLite
-    conn = sqlite3.connect(DB_PATH)
 
-    # Create schema
+def drop_user_aggregates(conn):
+    triggers = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'user_agg_%'"
+    ).fetchall()
+    for (name,) in triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+    for table in ("user_genre_counts", "user_decade_counts", "user_revenue_counts", "user_rating_counts"):
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.commit()
+
+
+def full_load(conn, parquet):
+    start = time.perf_counter()
+
+    # Autocommit mode so the load runs in one explicit transaction. Journaling
+    # and fsyncs are off only for the duration of the bulk load.
+    conn.isolation_level = None
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+
+    # Create schema; movies is recreated so it keeps the typed schema with
+    # id as INTEGER PRIMARY KEY (a rowid alias).
+    conn.execute("DROP TABLE IF EXISTS movies")
     conn.executescript(SCHEMA_SQL)
+    conn.executescript(TAGS_SCHEMA_SQL)
     print("  Created tables")
 
-    # Insert movies
-    df.to_sql("movies", conn, if_exists="replace", index=False)
-    print(f"  Inserted {len(df)} movies")
+    genre_ids = load_tag_ids(conn, "genres")
+    keyword_ids = load_tag_ids(conn, "keywords")
+    n_movies = n_genre_links = n_keyword_links = 0
+
+    conn.execute("BEGIN")
+    for batch in parquet.iter_batches(batch_size=BATCH_SIZE, columns=MOVIE_COLUMNS):
+        insert_movies(conn, batch)
+        tags_df = batch.select(["id", "genres", "keywords"]).to_pandas()
+        n_genre_links += insert_tags(conn, tags_df, "genres", "genres", "movie_genres", "genre_id", genre_ids)
+        n_keyword_links += insert_tags(conn, tags_df, "keywords", "keywords", "movie_keywords", "keyword_id", keyword_ids)
+        n_movies += batch.num_rows
+    conn.execute("COMMIT")
+    print(f"  Inserted {n_movies} movies ({time.perf_counter() - start:.1f}s)")
+    print(f"  Inserted {len(genre_ids)} genres ({n_genre_links} movie links)")
+    print(f"  Inserted {len(keyword_ids)} keywords ({n_keyword_links} movie links)")
 
-    # Create indexes
+    # Create indexes after the data is in, then refresh planner statistics
+    conn.executescript(TAGS_INDEX_SQL)
     conn.execute("CREATE INDEX IF NOT EXISTS idx_movies_title ON movies(title COLLATE NOCASE)")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_movies_popularity ON movies(popularity DESC)")
-    conn.commit()
-    print("  Created indexes")
+    conn.execute("ANALYZE")
+    print(f"  Created indexes ({time.perf_counter() - start:.1f}s)")
 
-    # Recreate user tables (since to_sql replace drops them)
-    conn.executescript(SCHEMA_SQL)
-    conn.commit()
+    # Per-user analytics aggregates reference genre ids and movie metadata
+    # that may have changed; drop them so the API rebuilds them on startup.
+    drop_user_aggregates(conn)
+
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.execute("PRAGMA synchronous = FULL")
+
+
+def incremental_load(conn, changes):
+    start = time.perf_counter()
+    if len(changes.changed):
+        table = pq.read_table(PARQUET_PATH, columns=MOVIE_COLUMNS, filters=[("id", "in", changes.changed.tolist())])
+        inserted, updated = upsert_movies(conn, prepare_movies(table.to_pandas()))
+        print(f"  Upserted {inserted} new and {updated} changed movies")
+    if len(changes.deleted):
+        print(f"  Deleted {delete_movies(conn, changes.deleted)} movies")
+    print(f"  Applied changes ({time.perf_counter() - start:.1f}s)")
+
+
+def has_movies_table(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movies'").fetchone() is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--full", action="store_true", help="reload every movie even if unchanged")
+    args = parser.parse_args()
+
+    parquet = pq.ParquetFile(PARQUET_PATH)
+    print(f"Reading {PARQUET_PATH} ({parquet.metadata.num_rows} movies)...")
+
+    manifest = StageManifest(DATA_DIR, "load")
+    hashes = hash_parquet(PARQUET_PATH, MOVIE_COLUMNS[1:])
+    previous = manifest.load_hashes()
+
+    conn = sqlite3.connect(DB_PATH)
+    if args.full or previous is None or not has_movies_table(conn):
+        manifest.clear()
+        full_load(conn, parquet)
+    else:
+        changes = diff_hashes(previous, hashes)
+        print(f"  Changes since last load: {changes}")
+        if not changes:
+            print("Database is up to date, skipping.")
+            conn.close()
+            return
+        incremental_load(conn, changes)
+    manifest.save(hashes)
 
     # Verify
     cursor = conn.execute("SELECT COUNT(*) FROM movies")
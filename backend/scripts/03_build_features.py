@@ -7,81 +7,203 @@ Creates a sparse TF-IDF feature matrix from movie metadata:
 - Original language (weight 2.0) - MEDIUM importance
 - Release decade (weight 1.5) - LOW-MEDIUM importance
 
+Blocks are stored unweighted, with their column ranges and the default
+weights above recorded in feature_vocab.json; the engine applies the weights
+at query time, so they can be tuned or A/B tested without a rebuild.
+
+Every column is tokenized once with vectorized pandas string ops; the four
+TF-IDF blocks are then fitted concurrently in a process pool. The result
+matches what per-document TfidfVectorizer callbacks would produce.
+
+The fitted vocabularies and idf weights are saved alongside the matrix so new
+movies can be featurized later without a rebuild (see 05_add_movies.py).
+Later runs use them the same way: only movies whose genres, keywords,
+language or release date changed since the last build are re-featurized
+(deleted ones are dropped), and the step is skipped when nothing changed.
+Vocabularies and idf weights are refitted from scratch with --full, on the
+first run, or when more than --refit-fraction of the catalog changed.
+
+--shard-rows N also writes the matrix as row shards of N movies to
+feature_shards/, which the API scores in parallel with per-shard top-k; use
+it with a full-catalog 01_clean_csv.py --top-n 0. An existing shard layout is
+kept in sync on later runs; --shard-rows 0 removes it. --precision float16 or
+int8 stores the shards quantized (about 1/3 or 1/4 of the memory; see
+benchmarks/quantization_report.py for the effect on rankings), while
+feature_matrix.npz stays full precision.
+
 Outputs:
   - backend/data/feature_matrix.npz  (sparse matrix)
   - backend/data/movie_ids.npy       (movie ID array matching matrix rows)
+  - backend/data/feature_vocab.json  (per-block vocabulary, idf and weight)
 """
 
+import argparse
+import os
+import shutil
+import sys
+import time
 import pandas as pd
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from scipy.sparse import hstack, save_npz
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from scipy.sparse import hstack
 from pathlib import Path
 
-DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.features import (  # noqa: E402
+    BLOCKS, FeatureVocabulary, build_block, delete_rows, has_shards, load_feature_matrix, refresh_shards,
+    save_feature_matrix, shard_precision, shard_size, tokenize, upsert_rows, write_shards,
+)
+from services.quantization import PRECISIONS  # noqa: E402
+from services.pipeline_manifest import StageManifest, diff_hashes, hash_parquet  # noqa: E402
+
+DATA_DIR = Path(os.getenv("DATA_DIR", Path(__file__).resolve().parent.parent / "data"))
 PARQUET_PATH = DATA_DIR / "movies_clean.parquet"
+FEATURE_MATRIX_PATH = DATA_DIR / "feature_matrix.npz"
+MOVIE_IDS_PATH = DATA_DIR / "movie_ids.npy"
+FEATURE_VOCAB_PATH = DATA_DIR / "feature_vocab.json"
+FEATURE_SHARDS_DIR = DATA_DIR / "feature_shards"
+FEATURE_COLUMNS = ["genres", "keywords", "original_language", "release_date"]
 
 
-def comma_tokenizer(text):
-    """Split comma-separated text into stripped, lowered tokens."""
-    if not text or pd.isna(text):
-        return []
-    return [t.strip().lower() for t in text.split(",") if t.strip()]
+@contextmanager
+def timed(label):
+    start = time.perf_counter()
+    yield
+    print(f"  [{label}] {time.perf_counter() - start:.2f}s")
 
 
-def main():
+def update_features(changes):
+    """Re-featurize changed movies with the saved vocabularies; drop deleted ones.
+
+    Rows upserted since the last run (feature_delta.npz) are folded in.
+    """
+    matrix, movie_ids = load_feature_matrix(FEATURE_MATRIX_PATH, MOVIE_IDS_PATH)
+
+    if len(changes.changed):
+        df = pd.read_parquet(
+            PARQUET_PATH, columns=["id", *FEATURE_COLUMNS], filters=[("id", "in", changes.changed.tolist())]
+        ).drop_duplicates("id", keep="last")
+        vocab = FeatureVocabulary.load(FEATURE_VOCAB_PATH)
+        matrix, movie_ids = upsert_rows(matrix, movie_ids, df["id"].to_numpy(), vocab.transform(df))
+    if len(changes.deleted):
+        matrix, movie_ids = delete_rows(matrix, movie_ids, changes.deleted)
+
+    save_feature_matrix(FEATURE_MATRIX_PATH, MOVIE_IDS_PATH, matrix, movie_ids)
+    refresh_shards(matrix, movie_ids, FEATURE_SHARDS_DIR)
+    print(f"  Final matrix shape: {matrix.shape}")
+
+
+def build_features(workers):
     print(f"Reading {PARQUET_PATH}...")
-    df = pd.read_parquet(PARQUET_PATH)
+    with timed("read"):
+        df = pd.read_parquet(PARQUET_PATH, columns=["id", *FEATURE_COLUMNS])
     print(f"  {len(df)} movies loaded")
 
-    # 1. Genre features (HIGH weight)
-    print("Building genre features...")
-    genre_tfidf = TfidfVectorizer(
-        tokenizer=comma_tokenizer,
-        token_pattern=None,
-        lowercase=False,
-    )
-    genre_matrix = genre_tfidf.fit_transform(df["genres"].fillna("")) * 3.0
-    print(f"  Genres: {genre_matrix.shape[1]} features")
-
-    # 2. Keyword features (MEDIUM weight)
-    print("Building keyword features...")
-    keyword_tfidf = TfidfVectorizer(
-        tokenizer=comma_tokenizer,
-        token_pattern=None,
-        lowercase=False,
-        max_features=5000,
-    )
-    keyword_matrix = keyword_tfidf.fit_transform(df["keywords"].fillna("")) * 2.0
-    print(f"  Keywords: {keyword_matrix.shape[1]} features")
-
-    # 3. Language features (MEDIUM weight)
-    print("Building language features...")
-    lang_tfidf = TfidfVectorizer()
-    lang_matrix = lang_tfidf.fit_transform(df["original_language"].fillna("")) * 2.0
-    print(f"  Languages: {lang_matrix.shape[1]} features")
-
-    # 4. Decade features (LOW-MEDIUM weight)
-    print("Building decade features...")
-    release_dates = pd.to_datetime(df["release_date"], errors="coerce")
-    decades = (release_dates.dt.year // 10 * 10).fillna(0).astype(int).astype(str)
-    decade_tfidf = TfidfVectorizer()
-    decade_matrix = decade_tfidf.fit_transform(decades) * 1.5
-    print(f"  Decades: {decade_matrix.shape[1]} features")
-
-    # 5. Stack all features
+    print("Tokenizing...")
+    with timed("tokenize"):
+        tokens = tokenize(df.reset_index(drop=True))
+
+    print(f"Building {len(BLOCKS)} feature blocks on {workers} workers...")
+    blocks = {}
+    with timed("blocks"), ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            name: pool.submit(
+                build_block,
+                tokens[name].index.to_numpy(),
+                tokens[name].to_numpy(),
+                len(df),
+                max_features,
+            )
+            for name, _, max_features in BLOCKS
+        }
+        for name, future in futures.items():
+            blocks[name] = future.result()
+            print(f"  {name}: {blocks[name][0].shape[1]} features")
+
+    # Stack all features
     print("Stacking feature matrix...")
-    feature_matrix = hstack([genre_matrix, keyword_matrix, lang_matrix, decade_matrix]).tocsr()
+    with timed("stack"):
+        feature_matrix = hstack([blocks[name][0] for name, _, _ in BLOCKS]).tocsr()
     print(f"  Final matrix shape: {feature_matrix.shape}")
     print(f"  Non-zero entries: {feature_matrix.nnz}")
 
-    # 6. Save
-    save_npz(str(DATA_DIR / "feature_matrix.npz"), feature_matrix)
-    np.save(str(DATA_DIR / "movie_ids.npy"), df["id"].values)
-
-    fm_size = (DATA_DIR / "feature_matrix.npz").stat().st_size / 1024 / 1024
+    # Save
+    with timed("save"):
+        save_feature_matrix(FEATURE_MATRIX_PATH, MOVIE_IDS_PATH, feature_matrix, df["id"].values)
+        FeatureVocabulary([
+            {
+                "name": name,
+                "weight": weight,
+                "vocabulary": blocks[name][1].tolist(),
+                "idf": blocks[name][2].tolist(),
+            }
+            for name, weight, _ in BLOCKS
+        ]).save(FEATURE_VOCAB_PATH)
+
+    fm_size = FEATURE_MATRIX_PATH.stat().st_size / 1024 / 1024
     print(f"\nSaved feature_matrix.npz ({fm_size:.1f} MB)")
     print(f"Saved movie_ids.npy ({len(df)} IDs)")
+    print("Saved feature_vocab.json")
+    refresh_shards(feature_matrix, df["id"].values, FEATURE_SHARDS_DIR)
+
+
+def apply_shard_layout(shard_rows, precision):
+    if shard_rows == 0:
+        shutil.rmtree(FEATURE_SHARDS_DIR, ignore_errors=True)
+        print("Removed feature_shards/")
+        return
+    existing = has_shards(FEATURE_SHARDS_DIR)
+    if shard_rows is None:
+        if not existing:
+            print("No feature_shards/ to store at another precision; pass --shard-rows")
+            return
+        shard_rows = shard_size(FEATURE_SHARDS_DIR)
+    if precision is None:
+        precision = shard_precision(FEATURE_SHARDS_DIR) if existing else "float64"
+    matrix, movie_ids = load_feature_matrix(FEATURE_MATRIX_PATH, MOVIE_IDS_PATH)
+    n = write_shards(matrix, movie_ids, FEATURE_SHARDS_DIR, shard_rows, precision)
+    print(f"Saved {n} {precision} feature shards of up to {shard_rows} rows to feature_shards/")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=min(len(BLOCKS), os.cpu_count() or 1))
+    parser.add_argument("--full", action="store_true", help="refit vocabularies and rebuild every row")
+    parser.add_argument("--refit-fraction", type=float, default=0.2,
+                        help="refit from scratch when more than this fraction of movies changed")
+    parser.add_argument("--shard-rows", type=int, default=None,
+                        help="also write the matrix as row shards of this many movies (0 removes shards)")
+    parser.add_argument("--precision", choices=PRECISIONS, default=None,
+                        help="store the shards at this precision (default: keep the existing layout's)")
+    args = parser.parse_args()
+
+    manifest = StageManifest(DATA_DIR, "features")
+    hashes = hash_parquet(PARQUET_PATH, FEATURE_COLUMNS)
+    previous = manifest.load_hashes()
+    artifacts = [FEATURE_MATRIX_PATH, MOVIE_IDS_PATH, FEATURE_VOCAB_PATH]
+
+    if not args.full and previous is not None and all(path.exists() for path in artifacts):
+        changes = diff_hashes(previous, hashes)
+        print(f"Changes since last build: {changes}")
+        if not changes:
+            print("Feature matrix is up to date, skipping.")
+        elif changes.fraction <= args.refit_fraction:
+            with timed("update"):
+                update_features(changes)
+            manifest.save(hashes)
+        else:
+            print(f"  {changes.fraction:.0%} of movies changed, refitting")
+            changes = None
+    else:
+        changes = None
+
+    if changes is None:
+        manifest.clear()
+        build_features(args.workers)
+        manifest.save(hashes)
+
+    if args.shard_rows is not None or args.precision is not None:
+        apply_shard_layout(args.shard_rows, args.precision)
 
 
 if __name__ == "__main__":
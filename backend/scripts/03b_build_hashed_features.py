@@ -0,0 +1,102 @@
+"""
+Step 3 (alternative): Build a hashed feature matrix out of core.
+
+Instead of fitting a vocabulary, genre, keyword, language and decade tokens
+are hashed into a fixed number of columns per block (no max_features cap on
+keywords). The Parquet file is read in record batches and each batch's rows
+are written straight into CSR row shards, so memory stays constant no matter
+how large the catalog or its vocabulary is. The featurizer is stateless, so
+new movies are featurized the same way without any fitted state.
+
+The step is skipped when the feature columns are unchanged since the last
+run; --full forces a rebuild. Set FEATURE_BUILDER=hashed for init_data.sh to
+run this instead of 03_build_features.py. --precision float16 or int8 stores
+the shards quantized.
+
+Outputs:
+  - backend/data/feature_shards/     (CSR row shards, movie_ids.npy, index.json)
+  - backend/data/feature_vocab.json  (hashed featurizer settings)
+The single-file feature_matrix.npz/movie_ids.npy from 03_build_features.py
+are removed, since they belong to a different feature space.
+"""
+
+import argparse
+import os
+import sys
+import time
+import pyarrow.parquet as pq
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.features import (  # noqa: E402
+    HashedFeaturizer, ShardWriter, has_shards, load_featurizer, remove_feature_matrix, shard_precision,
+)
+from services.pipeline_manifest import StageManifest, diff_hashes, hash_parquet  # noqa: E402
+from services.quantization import PRECISIONS  # noqa: E402
+
+DATA_DIR = Path(os.getenv("DATA_DIR", Path(__file__).resolve().parent.parent / "data"))
+PARQUET_PATH = DATA_DIR / "movies_clean.parquet"
+FEATURE_MATRIX_PATH = DATA_DIR / "feature_matrix.npz"
+MOVIE_IDS_PATH = DATA_DIR / "movie_ids.npy"
+FEATURE_VOCAB_PATH = DATA_DIR / "feature_vocab.json"
+FEATURE_SHARDS_DIR = DATA_DIR / "feature_shards"
+FEATURE_COLUMNS = ["genres", "keywords", "original_language", "release_date"]
+
+
+def is_current(manifest, hashes, precision):
+    previous = manifest.load_hashes()
+    return (
+        previous is not None
+        and has_shards(FEATURE_SHARDS_DIR)
+        and shard_precision(FEATURE_SHARDS_DIR) == precision
+        and FEATURE_VOCAB_PATH.exists()
+        and isinstance(load_featurizer(FEATURE_VOCAB_PATH), HashedFeaturizer)
+        and not diff_hashes(previous, hashes)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shard-rows", type=int, default=100_000, help="movies per CSR shard")
+    parser.add_argument("--batch-size", type=int, default=50_000, help="Parquet rows featurized at a time")
+    parser.add_argument("--full", action="store_true", help="rebuild even if inputs are unchanged")
+    parser.add_argument("--precision", choices=PRECISIONS, default="float64", help="shard storage precision")
+    args = parser.parse_args()
+
+    manifest = StageManifest(DATA_DIR, "hashed_features")
+    hashes = hash_parquet(PARQUET_PATH, FEATURE_COLUMNS)
+    if not args.full and is_current(manifest, hashes, args.precision):
+        print("Hashed feature shards are up to date, skipping.")
+        return
+
+    manifest.clear()
+    featurizer = HashedFeaturizer()
+    parquet = pq.ParquetFile(PARQUET_PATH)
+    print(f"Hashing {parquet.metadata.num_rows} movies into {featurizer.n_features} columns...")
+
+    start = time.perf_counter()
+    writer = ShardWriter(FEATURE_SHARDS_DIR, args.shard_rows, featurizer.n_features, args.precision)
+    n_rows = nnz = 0
+    for batch in parquet.iter_batches(batch_size=args.batch_size, columns=["id", *FEATURE_COLUMNS]):
+        df = batch.to_pandas()
+        rows = featurizer.transform(df)
+        writer.write(rows, df["id"].to_numpy())
+        n_rows += rows.shape[0]
+        nnz += rows.nnz
+    n_shards = writer.close()
+    featurizer.save(FEATURE_VOCAB_PATH)
+    print(f"  {n_rows} rows, {nnz} non-zero entries ({time.perf_counter() - start:.1f}s)")
+
+    # The TF-IDF artifacts no longer match feature_vocab.json; removing them
+    # (and their manifest) makes the engine load the shards and makes
+    # 03_build_features.py rebuild from scratch if it is run again.
+    remove_feature_matrix(FEATURE_MATRIX_PATH, MOVIE_IDS_PATH)
+    StageManifest(DATA_DIR, "features").clear()
+    manifest.save(hashes)
+
+    print(f"\nSaved {n_shards} shards of up to {args.shard_rows} rows to {FEATURE_SHARDS_DIR}")
+    print("Saved feature_vocab.json")
+
+
+if __name__ == "__main__":
+    main()
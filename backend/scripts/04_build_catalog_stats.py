@@ -0,0 +1,103 @@
+"""
+Step 4: Precompute catalog-wide distributions for user-vs-catalog analytics.
+
+Aggregates the movies table once so the API can compare a user's habits with
+the whole catalog without scanning it per request:
+- Genre, decade, original language and revenue-bucket counts
+- Percentile baselines (0-100) for vote_average, vote_count and popularity
+
+The stats are recomputed only when one of the columns they read changed
+since the last run (see services/pipeline_manifest.py); --full forces it.
+
+Outputs: backend/data/catalog_stats.json
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.pipeline_manifest import StageManifest, diff_hashes, hash_parquet  # noqa: E402
+
+DATA_DIR = Path(os.getenv("DATA_DIR", Path(__file__).resolve().parent.parent / "data"))
+PARQUET_PATH = DATA_DIR / "movies_clean.parquet"
+DB_PATH = DATA_DIR / "app.db"
+OUTPUT_PATH = DATA_DIR / "catalog_stats.json"
+STATS_COLUMNS = ["genres", "release_date", "original_language", "revenue", "vote_average", "vote_count", "popularity"]
+
+# Same edges as the API's revenue analytics buckets
+REVENUE_EDGES = [10_000_000, 50_000_000, 100_000_000, 500_000_000, 1_000_000_000]
+PERCENTILE_COLUMNS = ["vote_average", "vote_count", "popularity"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--full", action="store_true", help="recompute even if inputs are unchanged")
+    args = parser.parse_args()
+
+    manifest = StageManifest(DATA_DIR, "catalog_stats")
+    hashes = hash_parquet(PARQUET_PATH, STATS_COLUMNS)
+    previous = manifest.load_hashes()
+    if not args.full and previous is not None and OUTPUT_PATH.exists() and not diff_hashes(previous, hashes):
+        print(f"{OUTPUT_PATH} is up to date, skipping.")
+        return
+
+    print(f"Reading {DB_PATH}...")
+    conn = sqlite3.connect(DB_PATH)
+    df = pd.read_sql(
+        """SELECT release_date, original_language, revenue,
+                  vote_average, vote_count, popularity
+           FROM movies""",
+        conn,
+    )
+    print(f"  {len(df)} movies loaded")
+
+    genre_counts = dict(conn.execute(
+        """SELECT g.name, COUNT(*) FROM movie_genres mg
+           JOIN genres g ON g.id = mg.genre_id
+           GROUP BY g.id"""
+    ).fetchall())
+    conn.close()
+    print(f"  Genres: {len(genre_counts)}")
+
+    years = pd.to_numeric(df["release_date"].str[:4], errors="coerce").dropna().astype(int)
+    decade_counts = (years // 10 * 10).value_counts().sort_index()
+    print(f"  Decades: {len(decade_counts)}")
+
+    languages = df["original_language"].fillna("")
+    language_counts = languages[languages != ""].value_counts()
+    print(f"  Languages: {len(language_counts)}")
+
+    revenue = df.loc[df["revenue"] > 0, "revenue"]
+    revenue_counts = np.bincount(
+        np.searchsorted(REVENUE_EDGES, revenue.to_numpy(), side="right"),
+        minlength=len(REVENUE_EDGES) + 1,
+    )
+    print(f"  Movies with revenue: {len(revenue)}")
+
+    percentiles = {
+        col: np.percentile(df[col].fillna(0).to_numpy(), np.arange(101)).round(4).tolist()
+        for col in PERCENTILE_COLUMNS
+    }
+
+    stats = {
+        "total": int(len(df)),
+        "genres": {name: int(n) for name, n in genre_counts.items()},
+        "decades": {str(d): int(n) for d, n in decade_counts.items()},
+        "languages": {lang: int(n) for lang, n in language_counts.items()},
+        "revenue": {"total": int(len(revenue)), "buckets": revenue_counts.tolist()},
+        "percentiles": percentiles,
+    }
+
+    OUTPUT_PATH.write_text(json.dumps(stats))
+    manifest.save(hashes)
+    print(f"\nSaved {OUTPUT_PATH} ({OUTPUT_PATH.stat().st_size / 1024:.1f} KB)")
+
+
+if __name__ == "__main__":
+    main()
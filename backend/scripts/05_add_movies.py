@@ -0,0 +1,67 @@
+"""
+Add or update movies without rerunning the full pipeline.
+
+Reads movies from a CSV or Parquet file with the movies-table columns, upserts
+them (and their genre/keyword links) into app.db, then featurizes them with
+the featurizer saved by the last feature build and upserts their rows in the
+feature artifacts. Existing rows keep their position; new movies are appended.
+Only the feature shards holding these movies are rewritten; the single-file
+matrix records them in feature_delta.npz, which the engine applies on load and
+03_build_features.py folds in.
+
+A running API does not see the new feature rows until restart; use
+POST /api/admin/movies to update a live server instead.
+
+Usage: python scripts/05_add_movies.py --input new_movies.csv
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+import pandas as pd
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.catalog_updates import prepare_movies, upsert_feature_artifact, upsert_movies  # noqa: E402
+from services.features import load_featurizer  # noqa: E402
+
+DATA_DIR = Path(os.getenv("DATA_DIR", Path(__file__).resolve().parent.parent / "data"))
+DB_PATH = DATA_DIR / "app.db"
+FEATURE_MATRIX_PATH = DATA_DIR / "feature_matrix.npz"
+MOVIE_IDS_PATH = DATA_DIR / "movie_ids.npy"
+FEATURE_VOCAB_PATH = DATA_DIR / "feature_vocab.json"
+FEATURE_SHARDS_DIR = DATA_DIR / "feature_shards"
+
+
+def read_movies(path):
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", type=Path, required=True, help="CSV or Parquet file of movies")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df = prepare_movies(read_movies(args.input))
+    print(f"Read {len(df)} movies from {args.input}")
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        inserted, updated = upsert_movies(conn, df)
+    finally:
+        conn.close()
+    print(f"  Database: {inserted} inserted, {updated} updated")
+
+    featurizer = load_featurizer(FEATURE_VOCAB_PATH)
+    upsert_feature_artifact(featurizer, df, FEATURE_MATRIX_PATH, MOVIE_IDS_PATH, FEATURE_SHARDS_DIR)
+    print(f"  Features: {len(df)} rows upserted")
+    print(f"Done in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
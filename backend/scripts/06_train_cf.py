@@ -0,0 +1,91 @@
+"""
+Step 6 (offline, periodic): train the collaborative-filtering model.
+
+Reads every (user, movie, rating) row of the watched table and fits implicit
+ALS factors with a conjugate-gradient solver (services/collaborative.py).
+Users and movies are solved in blocks on --workers threads. The API blends
+the model's scores with content similarity for users with at least
+CF_MIN_HISTORY watched movies the model knows. It picks up a new model on
+restart.
+
+The watched table grows as people use the app, so run this on a schedule
+(e.g. nightly), not as part of init_data.sh. A few million ratings train in
+minutes on one machine.
+
+Outputs: backend/data/cf_model/ (item_factors.npy, user_factors.npy,
+movie_ids.npy, user_ids.npy, model.json)
+
+Usage: python scripts/06_train_cf.py --factors 64 --iterations 15
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+import numpy as np
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.collaborative import interaction_matrix, save_model, train_als  # noqa: E402
+
+DATA_DIR = Path(os.getenv("DATA_DIR", Path(__file__).resolve().parent.parent / "data"))
+DB_PATH = DATA_DIR / "app.db"
+CF_MODEL_DIR = DATA_DIR / "cf_model"
+
+
+def read_watched(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT user_id, movie_id, rating FROM watched").fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([])
+    user_ids, movie_ids, ratings = zip(*rows)
+    # NULL ratings become NaN and count as neutral
+    return np.array(user_ids), np.array(movie_ids), np.array(ratings, dtype=np.float64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--factors", type=int, default=64, help="latent dimensions")
+    parser.add_argument("--iterations", type=int, default=15, help="ALS sweeps over users and movies")
+    parser.add_argument("--cg-steps", type=int, default=3, help="conjugate-gradient steps per half-sweep")
+    parser.add_argument("--regularization", type=float, default=0.05)
+    parser.add_argument("--alpha", type=float, default=20.0, help="confidence = 1 + alpha * rating / 10")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="solver threads")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    print(f"Reading {DB_PATH}...")
+    user_ids, movie_ids, ratings = read_watched(DB_PATH)
+    if not len(user_ids):
+        print("  No watched rows yet, nothing to train.")
+        return
+    interactions, users, movies = interaction_matrix(user_ids, movie_ids, ratings, args.alpha)
+    print(f"  {interactions.nnz:,} ratings from {len(users):,} users on {len(movies):,} movies")
+
+    print(f"Training {args.factors} factors, {args.iterations} iterations on {args.workers} thread(s)...")
+    user_factors, item_factors = train_als(
+        interactions,
+        factors=args.factors,
+        regularization=args.regularization,
+        iterations=args.iterations,
+        cg_steps=args.cg_steps,
+        workers=args.workers,
+        seed=args.seed,
+        on_iteration=lambda i, seconds: print(f"  iteration {i + 1}: {seconds:.2f}s"),
+    )
+
+    save_model(
+        CF_MODEL_DIR, user_factors, item_factors, users, movies,
+        alpha=args.alpha, regularization=args.regularization, iterations=args.iterations,
+        ratings=int(interactions.nnz),
+    )
+    print(f"\nSaved {CF_MODEL_DIR} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
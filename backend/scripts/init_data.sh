@@ -1,12 +1,18 @@
 #!/bin/sh
-# Skip if artifacts already exist (from a previous run via volume persistence)
-if [ -f /app/data/app.db ] && [ -f /app/data/feature_matrix.npz ]; then
-    echo "Data artifacts already exist, skipping pipeline."
-    exit 0
-fi
+# Each stage compares its inputs with the manifest from the previous run
+# (data/manifest/) and only applies what changed, skipping itself entirely
+# when nothing did. The first run, or a fresh volume, builds everything.
+# FEATURE_BUILDER=hashed builds stateless hashed feature shards instead of
+# the fitted TF-IDF matrix.
+set -e
 
 echo "Running data pipeline..."
 python scripts/01_clean_csv.py
 python scripts/02_load_db.py
-python scripts/03_build_features.py
+if [ "$FEATURE_BUILDER" = "hashed" ]; then
+    python scripts/03b_build_hashed_features.py
+else
+    python scripts/03_build_features.py
+fi
+python scripts/04_build_catalog_stats.py
 echo "Data pipeline complete."
@@ -0,0 +1,48 @@
+import json
+from bisect import bisect_right
+from config import CATALOG_STATS_PATH
+
+
+class CatalogStats:
+    """Catalog-wide distributions precomputed by scripts/04_build_catalog_stats.py.
+
+    They describe the catalog as of that run; movies upserted since (admin API
+    or 05_add_movies.py) are not counted until it is run again.
+    """
+
+    def __init__(self, path=CATALOG_STATS_PATH):
+        with open(path) as f:
+            data = json.load(f)
+        self.total = data["total"]
+        self.genres = data["genres"]
+        self.decades = {f"{d}s": n for d, n in data["decades"].items()}
+        self.languages = data["languages"]
+        self.revenue_total = data["revenue"]["total"]
+        self.revenue_buckets = data["revenue"]["buckets"]
+        self.percentiles = data["percentiles"]
+
+    def percentile_rank(self, column: str, value: float) -> int:
+        """Share of the catalog (0-100) at or below ``value`` for ``column``."""
+        quantiles = self.percentiles[column]
+        return max(bisect_right(quantiles, value) - 1, 0)
+
+    @staticmethod
+    def compare(
+        user_counts: dict[str, int],
+        user_total: int,
+        catalog_counts: dict[str, int],
+        catalog_total: int,
+    ) -> list[dict]:
+        data = []
+        for key, count in user_counts.items():
+            user_share = count / user_total if user_total else 0.0
+            catalog_share = catalog_counts.get(key, 0) / catalog_total if catalog_total else 0.0
+            data.append({
+                "key": key,
+                "user_count": count,
+                "user_share": round(user_share, 4),
+                "catalog_share": round(catalog_share, 4),
+                "lift": round(user_share / catalog_share, 2) if catalog_share else None,
+            })
+        data.sort(key=lambda x: x["user_count"], reverse=True)
+        return data
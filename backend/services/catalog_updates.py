@@ -0,0 +1,171 @@
+"""Writes to the movie catalog shared by the loader, the add-movies CLI and the admin API.
+
+All functions take a plain sqlite3 connection; the API calls them from a
+worker thread.
+"""
+
+import numpy as np
+import pandas as pd
+from database import REBUILD_USER_AGGREGATES_SQL
+from services.features import append_feature_delta, has_shards, upsert_shard_rows
+
+MOVIE_COLUMNS = [
+    "id", "title", "original_title", "overview", "release_date", "runtime",
+    "vote_average", "vote_count", "popularity", "revenue", "budget",
+    "original_language", "genres", "keywords", "production_companies",
+    "spoken_languages", "poster_path", "backdrop_path", "tagline", "imdb_id",
+]
+INTEGER_COLUMNS = ["runtime", "vote_count", "revenue", "budget"]
+FLOAT_COLUMNS = ["vote_average", "popularity"]
+
+UPSERT_MOVIE_SQL = (
+    f"INSERT INTO movies ({', '.join(MOVIE_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(MOVIE_COLUMNS))}) "
+    f"ON CONFLICT (id) DO UPDATE SET "
+    + ", ".join(f"{col} = excluded.{col}" for col in MOVIE_COLUMNS[1:])
+)
+
+TAG_TABLES = [
+    # source column, tag table, link table, link column
+    ("genres", "genres", "movie_genres", "genre_id"),
+    ("keywords", "keywords", "movie_keywords", "keyword_id"),
+]
+
+
+def prepare_movies(df):
+    """Normalize incoming movie rows to the movies schema, last row wins per id."""
+    df = df.reindex(columns=MOVIE_COLUMNS).drop_duplicates("id", keep="last")
+    df = df[df["id"].notna()].copy()
+    df["id"] = df["id"].astype(np.int64)
+    for col in INTEGER_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(np.int64)
+    for col in FLOAT_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0.0)
+    df["title"] = df["title"].fillna("")
+    return df.reset_index(drop=True)
+
+
+def explode_tags(df, column):
+    """Return unique (movie_id, name) pairs from a comma-separated column."""
+    tags = df[["id"]].assign(name=df[column].fillna("").str.split(",")).explode("name")
+    tags["name"] = tags["name"].str.strip()
+    tags = tags[tags["name"].notna() & (tags["name"] != "")]
+    return tags.drop_duplicates(["id", "name"])
+
+
+def load_tag_ids(conn, tag_table):
+    return dict(conn.execute(f"SELECT name, id FROM {tag_table}").fetchall())
+
+
+def insert_tags(conn, df, column, tag_table, link_table, link_column, name_to_id):
+    """Insert tag links for the movies in ``df``, registering unseen tag names."""
+    tags = explode_tags(df, column)
+    new_names = [name for name in tags["name"].unique() if name not in name_to_id]
+    next_id = max(name_to_id.values(), default=0) + 1
+    for i, name in enumerate(new_names):
+        name_to_id[name] = next_id + i
+    conn.executemany(
+        f"INSERT INTO {tag_table} (id, name) VALUES (?, ?)",
+        [(name_to_id[name], name) for name in new_names],
+    )
+    conn.executemany(
+        f"INSERT OR IGNORE INTO {link_table} (movie_id, {link_column}) VALUES (?, ?)",
+        zip(tags["id"].astype(int).tolist(), tags["name"].map(name_to_id).tolist()),
+    )
+    return len(tags)
+
+
+def _chunks(values, size=10_000):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def upsert_movies(conn, df) -> tuple[int, int]:
+    """Insert or update movies and their tag links in one transaction.
+
+    Returns (inserted, updated). The analytics aggregates of users who have
+    an updated movie on their watched list or watchlist are rebuilt, since
+    the triggers only track list changes, not catalog changes.
+    """
+    ids = df["id"].tolist()
+    existing = set()
+    for chunk in _chunks(ids):
+        placeholders = ",".join("?" * len(chunk))
+        existing.update(
+            row[0] for row in conn.execute(f"SELECT id FROM movies WHERE id IN ({placeholders})", chunk)
+        )
+
+    rows = df[MOVIE_COLUMNS].astype(object).where(df[MOVIE_COLUMNS].notna(), None)
+    with conn:
+        conn.executemany(UPSERT_MOVIE_SQL, rows.itertuples(index=False, name=None))
+        for column, tag_table, link_table, link_column in TAG_TABLES:
+            for chunk in _chunks(ids):
+                placeholders = ",".join("?" * len(chunk))
+                conn.execute(f"DELETE FROM {link_table} WHERE movie_id IN ({placeholders})", chunk)
+            insert_tags(conn, df, column, tag_table, link_table, link_column, load_tag_ids(conn, tag_table))
+
+        if existing:
+            _rebuild_user_aggregates(conn, sorted(existing))
+
+    return len(ids) - len(existing), len(existing)
+
+
+def delete_movies(conn, movie_ids) -> int:
+    """Delete movies and their tag links in one transaction; returns rows deleted.
+
+    Watched/watchlist entries are kept, as with a full reload, but the
+    aggregates of users who listed a deleted movie are rebuilt.
+    """
+    movie_ids = [int(mid) for mid in movie_ids]
+    deleted = 0
+    with conn:
+        for chunk in _chunks(movie_ids):
+            placeholders = ",".join("?" * len(chunk))
+            for _, _, link_table, _ in TAG_TABLES:
+                conn.execute(f"DELETE FROM {link_table} WHERE movie_id IN ({placeholders})", chunk)
+            deleted += conn.execute(f"DELETE FROM movies WHERE id IN ({placeholders})", chunk).rowcount
+        _rebuild_user_aggregates(conn, movie_ids)
+    return deleted
+
+
+def _rebuild_user_aggregates(conn, movie_ids):
+    """Recompute the aggregates of users with any of ``movie_ids`` on a list.
+
+    Only those users' rows are touched, so the cost follows their history
+    size rather than the size of watched and watchlist.
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS affected_users (user_id INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.affected_users")
+    for chunk in _chunks(movie_ids):
+        placeholders = ",".join("?" * len(chunk))
+        conn.execute(
+            f"""INSERT OR IGNORE INTO temp.affected_users (user_id)
+                SELECT user_id FROM watched WHERE movie_id IN ({placeholders})
+                UNION
+                SELECT user_id FROM watchlist WHERE movie_id IN ({placeholders})""",
+            chunk + chunk,
+        )
+    if conn.execute("SELECT 1 FROM temp.affected_users LIMIT 1").fetchone() is None:
+        return
+    # executescript() would commit the caller's transaction; run statements one by one
+    for statement in REBUILD_USER_AGGREGATES_SQL.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+
+
+def upsert_feature_artifact(featurizer, df, matrix_path, ids_path, shard_dir=None):
+    """Featurize ``df`` with the saved featurizer and upsert its rows on disk."""
+    upsert_feature_rows(df["id"].to_numpy(), featurizer.transform(df), matrix_path, ids_path, shard_dir)
+
+
+def upsert_feature_rows(movie_ids, rows, matrix_path, ids_path, shard_dir=None):
+    """Persist upserted feature rows with I/O proportional to the change.
+
+    A shard layout gets only the shards holding these movies rewritten; the
+    single-file matrix, if there is one, records them in its delta file until
+    the next pipeline run folds them in. Full precision is kept either way.
+    """
+    if shard_dir is not None and has_shards(shard_dir):
+        upsert_shard_rows(shard_dir, movie_ids, rows)
+    if matrix_path.exists():
+        append_feature_delta(matrix_path, movie_ids, rows)
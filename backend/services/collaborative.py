@@ -0,0 +1,203 @@
+"""Implicit-feedback collaborative filtering over the watched table.
+
+Every watched row is a positive observation (preference 1). Its rating sets
+the confidence, ``1 + alpha * rating / 10``; unrated rows count as a neutral
+5. The model factors the user x movie matrix with alternating least squares
+(Hu, Koren & Volinsky, 2008). Each half-step keeps one side's factors fixed
+and solves the other side's regularized least-squares systems. Those are
+solved approximately by a few conjugate-gradient steps, warm-started from the
+previous iteration (Takács et al., 2011), instead of exactly.
+
+The CG steps are vectorized over blocks of users (or movies), not looped per
+row. The per-row product ``A_u p_u = (YᵀY + λI) p_u + Y_uᵀ (C_u - I) Y_u p_u``
+is computed for a whole block at once: one row-wise dot product per non-zero,
+then one sparse x dense product. Blocks are bounded by their non-zero count,
+so memory stays flat as the data grows, and they are solved on a thread pool
+because the NumPy and scipy kernels release the GIL.
+
+``save_model`` writes the factors as .npy files that ``CollaborativeModel``
+memory-maps. model.json is written last, so a directory without it is
+incomplete. A user's vector is not read from the artifact at serving time.
+It is folded in from their current history with one exact k x k solve, so
+ratings added since training count immediately.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy.sparse import csr_matrix
+
+MODEL_INDEX = "model.json"
+NEUTRAL_RATING = 5
+
+
+def confidence(ratings, alpha: float) -> np.ndarray:
+    """Confidence per watched row; ``None``/NaN ratings count as NEUTRAL_RATING."""
+    ratings = np.asarray(ratings, dtype=np.float64)
+    return 1 + alpha * np.nan_to_num(ratings, nan=NEUTRAL_RATING) / 10
+
+
+def interaction_matrix(user_ids, movie_ids, ratings, alpha: float):
+    """CSR user x movie confidence matrix and the user and movie ids of its rows and columns."""
+    users, user_rows = np.unique(np.asarray(user_ids), return_inverse=True)
+    movies, movie_cols = np.unique(np.asarray(movie_ids), return_inverse=True)
+    matrix = csr_matrix(
+        (confidence(ratings, alpha).astype(np.float32), (user_rows, movie_cols)),
+        shape=(len(users), len(movies)),
+    )
+    matrix.sum_duplicates()
+    return matrix, users, movies
+
+
+def _row_blocks(indptr, block_nnz):
+    """Split rows into contiguous (start, end) ranges of about ``block_nnz`` non-zeros."""
+    n_rows = len(indptr) - 1
+    cuts = np.searchsorted(indptr, np.arange(block_nnz, indptr[-1], block_nnz))
+    bounds = np.unique(np.concatenate([[0], cuts, [n_rows]]))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _cg_block(conf, X, Y, gram, cg_steps):
+    """Refine ``X`` (rows of one block, in place) against fixed factors ``Y``.
+
+    ``conf`` holds the block's confidence rows and ``gram`` is YᵀY + λI.
+    """
+    rows = np.repeat(np.arange(conf.shape[0]), np.diff(conf.indptr))
+    Yi = Y[conf.indices]                  # one factor row per non-zero
+    extra = conf.data - 1                 # C_u - I on the observed entries
+
+    def product(P):
+        dots = np.einsum("ij,ij->i", Yi, P[rows])
+        weighted = csr_matrix((extra * dots, conf.indices, conf.indptr), shape=conf.shape)
+        return P @ gram + weighted @ Y
+
+    # b_u = Y_uᵀ C_u p_u with p_u = 1 on observed entries
+    r = conf @ Y - product(X)
+    p = r.copy()
+    rs_old = np.einsum("ij,ij->i", r, r)
+    for _ in range(cg_steps):
+        Ap = product(p)
+        pAp = np.einsum("ij,ij->i", p, Ap)
+        step = np.divide(rs_old, pAp, out=np.zeros_like(rs_old), where=pAp > 0)
+        X += step[:, None] * p
+        r -= step[:, None] * Ap
+        rs_new = np.einsum("ij,ij->i", r, r)
+        p = r + np.divide(rs_new, rs_old, out=np.zeros_like(rs_new), where=rs_old > 0)[:, None] * p
+        rs_old = rs_new
+
+
+def _solve_side(conf, X, Y, regularization, cg_steps, pool, block_nnz):
+    gram = (Y.T @ Y + regularization * np.eye(Y.shape[1])).astype(np.float32)
+
+    def solve(bounds):
+        start, end = bounds
+        block = X[start:end]
+        _cg_block(conf[start:end], block, Y, gram, cg_steps)
+
+    list(pool.map(solve, _row_blocks(conf.indptr, block_nnz)))
+
+
+def train_als(
+    interactions,
+    factors: int = 64,
+    regularization: float = 0.05,
+    iterations: int = 15,
+    cg_steps: int = 3,
+    workers: int = 1,
+    block_nnz: int = 1 << 13,
+    seed: int = 0,
+    on_iteration=None,
+):
+    """Fit (user_factors, item_factors), both float32, to a confidence matrix.
+
+    ``on_iteration(i, seconds)`` is called after each user + item half-step pair.
+    """
+    interactions = interactions.tocsr().astype(np.float32)
+    by_item = interactions.T.tocsr()
+    rng = np.random.default_rng(seed)
+    X = np.zeros((interactions.shape[0], factors), dtype=np.float32)
+    Y = (rng.standard_normal((interactions.shape[1], factors)) * 0.01).astype(np.float32)
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="als") as pool:
+        for i in range(iterations):
+            start = time.perf_counter()
+            _solve_side(interactions, X, Y, regularization, cg_steps, pool, block_nnz)
+            _solve_side(by_item, Y, X, regularization, cg_steps, pool, block_nnz)
+            if on_iteration is not None:
+                on_iteration(i, time.perf_counter() - start)
+    return X, Y
+
+
+def _save_array(path, array):
+    # a new file replaces the old one, so a server that has the old one
+    # memory-mapped keeps reading it instead of seeing it truncated
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def save_model(model_dir, user_factors, item_factors, user_ids, movie_ids, **meta):
+    """Write factor arrays and ids to ``model_dir``; ``meta`` (alpha, regularization, ...) goes in model.json."""
+    model_dir.mkdir(parents=True, exist_ok=True)
+    (model_dir / MODEL_INDEX).unlink(missing_ok=True)
+    _save_array(model_dir / "user_factors.npy", np.ascontiguousarray(user_factors, dtype=np.float32))
+    _save_array(model_dir / "item_factors.npy", np.ascontiguousarray(item_factors, dtype=np.float32))
+    _save_array(model_dir / "user_ids.npy", np.asarray(user_ids, dtype=np.int64))
+    _save_array(model_dir / "movie_ids.npy", np.asarray(movie_ids, dtype=np.int64))
+    (model_dir / MODEL_INDEX).write_text(json.dumps({"factors": int(item_factors.shape[1]), **meta}))
+
+
+def has_model(model_dir) -> bool:
+    return (model_dir / MODEL_INDEX).exists()
+
+
+class CollaborativeModel:
+    """Item factors for serving; user vectors are folded in per request."""
+
+    def __init__(self, item_factors, movie_ids, regularization: float, alpha: float):
+        self.item_factors = item_factors
+        self.movie_ids = np.asarray(movie_ids)
+        self.regularization = regularization
+        self.alpha = alpha
+        self._sorter = np.argsort(self.movie_ids, kind="stable")
+        self._gram = item_factors.T.astype(np.float64) @ item_factors + regularization * np.eye(self.factors)
+
+    @classmethod
+    def load(cls, model_dir) -> "CollaborativeModel":
+        meta = json.loads((model_dir / MODEL_INDEX).read_text())
+        return cls(
+            np.load(str(model_dir / "item_factors.npy"), mmap_mode="r"),
+            np.load(str(model_dir / "movie_ids.npy")),
+            meta["regularization"],
+            meta["alpha"],
+        )
+
+    @property
+    def factors(self) -> int:
+        return self.item_factors.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.item_factors.nbytes + self.movie_ids.nbytes
+
+    def item_index(self, movie_ids) -> np.ndarray:
+        """Row in item_factors of each movie id, -1 for movies the model has not seen."""
+        movie_ids = np.asarray(movie_ids)
+        if not len(self.movie_ids):
+            return np.full(len(movie_ids), -1, dtype=np.int64)
+        pos = np.searchsorted(self.movie_ids, movie_ids, sorter=self._sorter)
+        rows = self._sorter[np.minimum(pos, len(self._sorter) - 1)]
+        return np.where(self.movie_ids[rows] == movie_ids, rows, -1)
+
+    def fold_in(self, items, ratings) -> np.ndarray:
+        """Exact least-squares user vector for watched ``items`` (item_factors rows)."""
+        Yu = np.asarray(self.item_factors[items], dtype=np.float64)
+        conf = confidence(ratings, self.alpha)
+        A = self._gram + Yu.T @ ((conf - 1)[:, None] * Yu)
+        return np.linalg.solve(A, Yu.T @ conf)
+
+    def scores(self, items, ratings) -> np.ndarray:
+        """Predicted preference of every item for a user who watched ``items``."""
+        return self.item_factors @ self.fold_in(items, ratings).astype(np.float32)
@@ -0,0 +1,153 @@
+"""Columnar in-memory catalog behind /api/movies/discover.
+
+Filterable columns are loaded from movies_clean.parquet into NumPy arrays.
+Every genre and language also gets a packed bitmap (one bit per movie, in
+catalog order) built up front. A query ANDs/ORs the bitmaps of its genre and
+language filters with the packed mask of its numeric range filters. Facet
+counts are popcounts of that result against each genre bitmap, plus
+bincounts over the language and decade columns of the selected rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+DISCOVER_COLUMNS = [
+    "id", "popularity", "vote_average", "vote_count",
+    "release_date", "runtime", "original_language", "genres",
+]
+LANGUAGE_FACETS = 20
+
+# set bits per byte value, for counting packed bitmaps
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(bits: np.ndarray) -> int:
+    return int(_POPCOUNT[bits].sum(dtype=np.int64))
+
+
+class DiscoverCatalog:
+    def __init__(self, df: pd.DataFrame):
+        """``df`` holds DISCOVER_COLUMNS; ties in every sort keep its row order."""
+        df = df[DISCOVER_COLUMNS].drop_duplicates("id", keep="last").reset_index(drop=True)
+        self.frame = df
+        self.n = len(df)
+        self.ids = df["id"].to_numpy(np.int64)
+        self.popularity = df["popularity"].fillna(0).to_numpy(np.float32)
+        self.vote_average = df["vote_average"].fillna(0).to_numpy(np.float32)
+        self.vote_count = df["vote_count"].fillna(0).to_numpy(np.int64)
+        self.runtime = df["runtime"].fillna(0).to_numpy(np.int32)
+        dates = pd.to_datetime(df["release_date"], format="%Y-%m-%d", errors="coerce")
+        self.year = dates.dt.year.fillna(0).to_numpy(np.int16)  # 0 = unknown
+        # days since the epoch, NaN when unknown
+        self.release_day = (dates - pd.Timestamp(0)).dt.days.to_numpy(np.float64)
+
+        codes, languages = pd.factorize(df["original_language"].fillna("").str.lower())
+        self.language_codes = codes.astype(np.int32)
+        self.languages = list(languages)
+        self.language_bitmaps = {
+            lang: np.packbits(self.language_codes == i) for i, lang in enumerate(self.languages) if lang
+        }
+
+        tags = df["genres"].fillna("").str.split(",").explode().str.strip()
+        tags = tags[tags != ""]
+        self.genres = sorted(tags.unique())
+        self.genre_bitmaps = {}
+        for genre, rows in tags.groupby(tags).groups.items():
+            mask = np.zeros(self.n, dtype=bool)
+            mask[np.asarray(rows)] = True
+            self.genre_bitmaps[genre] = np.packbits(mask)
+        self._genre_names = {g.lower(): g for g in self.genres}
+
+    def upsert(self, df: pd.DataFrame) -> "DiscoverCatalog":
+        """A new catalog with ``df``'s movies replacing or appended to this one's."""
+        kept = self.frame[~self.frame["id"].isin(df["id"])]
+        merged = pd.concat([kept, df[DISCOVER_COLUMNS]], ignore_index=True)
+        return DiscoverCatalog(merged.sort_values("popularity", ascending=False, kind="stable"))
+
+    def genre_bitmap(self, name: str):
+        genre = self._genre_names.get(name.strip().lower())
+        return None if genre is None else self.genre_bitmaps[genre]
+
+    def search(
+        self,
+        genres: list[str] | None = None,
+        match_all_genres: bool = True,
+        languages: list[str] | None = None,
+        year_min: int | None = None,
+        year_max: int | None = None,
+        runtime_min: int | None = None,
+        runtime_max: int | None = None,
+        rating_min: float | None = None,
+        votes_min: int | None = None,
+        sort: str = "popularity",
+        descending: bool = True,
+        offset: int = 0,
+        limit: int = 20,
+    ) -> tuple[list[int], int, dict]:
+        """Movie ids for one page, the total match count and facet counts."""
+        bits = np.packbits(np.ones(self.n, dtype=bool))
+
+        if genres:
+            maps = [self.genre_bitmap(g) for g in genres]
+            if match_all_genres:
+                for bitmap in maps:
+                    bits &= bitmap if bitmap is not None else 0
+            else:
+                known = [bitmap for bitmap in maps if bitmap is not None]
+                bits &= np.bitwise_or.reduce(known) if known else 0
+
+        if languages:
+            known = [self.language_bitmaps[l] for l in (x.strip().lower() for x in languages)
+                     if l in self.language_bitmaps]
+            bits &= np.bitwise_or.reduce(known) if known else 0
+
+        mask = None
+        # year and runtime store 0 for unknown; a bound on either only
+        # matches movies where it is known, as the SQL filters do with NULL
+        for column, low, high, zero_unknown in [
+            (self.year, year_min, year_max, True),
+            (self.runtime, runtime_min, runtime_max, True),
+            (self.vote_average, rating_min, None, False),
+            (self.vote_count, votes_min, None, False),
+        ]:
+            if zero_unknown and (low is not None or high is not None):
+                mask = (column > 0) if mask is None else mask & (column > 0)
+            if low is not None:
+                mask = (column >= low) if mask is None else mask & (column >= low)
+            if high is not None:
+                mask = (column <= high) if mask is None else mask & (column <= high)
+        if mask is not None:
+            bits &= np.packbits(mask)
+
+        selected = np.flatnonzero(np.unpackbits(bits, count=self.n))
+        page = self._page(selected, sort, descending, offset, limit)
+        return self.ids[page].tolist(), len(selected), self._facets(bits, selected)
+
+    def _page(self, selected, sort, descending, offset, limit):
+        values = getattr(self, "release_day" if sort == "release_date" else sort)[selected].astype(np.float64)
+        key = -values if descending else values
+        key[np.isnan(key)] = np.inf  # unknown values sort last either way
+        k = min(offset + limit, len(selected))
+        if k == 0:
+            return selected[:0]
+        if k < len(selected):
+            # everything tied with the k-th key, so ties are broken by catalog
+            # (popularity) order rather than by where the partition split them
+            top = np.flatnonzero(key <= np.partition(key, k - 1)[k - 1])
+        else:
+            top = np.arange(len(selected))
+        top = top[np.lexsort((selected[top], key[top]))]
+        return selected[top[offset:k]]
+
+    def _facets(self, bits, selected) -> dict:
+        genres = {g: _popcount(bits & self.genre_bitmaps[g]) for g in self.genres}
+        language_counts = np.bincount(self.language_codes[selected], minlength=len(self.languages))
+        top_languages = np.argsort(-language_counts, kind="stable")[:LANGUAGE_FACETS]
+        years = self.year[selected]
+        decades, decade_counts = np.unique(years[years > 0] // 10 * 10, return_counts=True)
+        return {
+            "genres": {g: n for g, n in genres.items() if n},
+            "languages": {self.languages[i]: int(language_counts[i])
+                          for i in top_languages if language_counts[i] and self.languages[i]},
+            "decades": {f"{d}s": int(n) for d, n in zip(decades.tolist(), decade_counts)},
+        }
@@ -0,0 +1,463 @@
+"""Movie feature extraction shared by the offline pipeline and the API.
+
+The pipeline (scripts/03_build_features.py) fits one TF-IDF block per
+metadata field and persists each block's vocabulary, idf and default weight
+next to the matrix. Blocks are stored unweighted; the engine applies block
+weights at query time, so they can change without a rebuild. ``FeatureVocabulary`` replays those fitted blocks on new or
+changed movies so they can be featurized without refitting the catalog.
+
+``HashedFeaturizer`` is the stateless alternative used by
+scripts/03b_build_hashed_features.py: tokens are hashed into fixed column
+ranges, so nothing has to be fitted or kept in memory across the catalog.
+
+For large catalogs the matrix can also be written as row shards
+(``ShardWriter``), which the engine scores independently and in parallel.
+Shards can be stored at reduced precision (see services/quantization.py).
+
+Movies upserted outside the pipeline are persisted with I/O proportional to
+the change: ``upsert_shard_rows`` rewrites only the shards they touch, and
+``append_feature_delta`` records them next to the single-file matrix, which
+``load_feature_matrix`` applies and ``save_feature_matrix`` folds back in.
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, diags, hstack, load_npz, save_npz, vstack
+from services.quantization import load_matrix, save_matrix
+from sklearn.feature_extraction.text import TfidfTransformer
+from sklearn.preprocessing import normalize
+
+# name, weight, max_features
+BLOCKS = [
+    ("genres", 3.0, None),
+    ("keywords", 2.0, 5000),
+    ("language", 2.0, None),
+    ("decade", 1.5, None),
+]
+
+# TfidfVectorizer's default token_pattern, used for the language/decade blocks
+WORD_PATTERN = r"(?u)\b\w\w+\b"
+
+
+def comma_tokens(series):
+    """Explode comma-separated text into stripped, lowered tokens (index = row)."""
+    tokens = series.fillna("").str.lower().str.split(",").explode().str.strip()
+    return tokens[tokens.notna() & (tokens != "")]
+
+
+def word_tokens(series):
+    """Explode text into lowered word tokens of 2+ characters (index = row)."""
+    tokens = series.fillna("").str.lower().str.findall(WORD_PATTERN).explode()
+    return tokens.dropna()
+
+
+def tokenize(df):
+    """Tokenize every block's source column once; ``df`` must have a RangeIndex."""
+    release_dates = pd.to_datetime(df["release_date"], errors="coerce")
+    decades = (release_dates.dt.year // 10 * 10).fillna(0).astype(int).astype(str)
+    return {
+        "genres": comma_tokens(df["genres"]),
+        "keywords": comma_tokens(df["keywords"]),
+        "language": word_tokens(df["original_language"]),
+        "decade": word_tokens(decades),
+    }
+
+
+def build_block(rows, tokens, n_rows, max_features):
+    """Fit one TF-IDF block from (row, token) pairs.
+
+    Mirrors TfidfVectorizer: alphabetical vocabulary, max_features keeps the
+    highest corpus frequencies, smoothed idf and l2-normalized rows.
+    Returns (unweighted matrix, vocabulary array, idf array).
+    """
+    vocab, codes = np.unique(tokens.astype(str), return_inverse=True)
+    counts = csr_matrix(
+        (np.ones(len(codes)), (rows, codes)),
+        shape=(n_rows, len(vocab)),
+    )
+    counts.sum_duplicates()
+
+    if max_features is not None and len(vocab) > max_features:
+        term_freqs = np.asarray(counts.sum(axis=0)).ravel()
+        keep = np.sort((-term_freqs).argsort()[:max_features])
+        counts = counts[:, keep]
+        vocab = vocab[keep]
+
+    transformer = TfidfTransformer()
+    matrix = transformer.fit_transform(counts)
+    return matrix.tocsr(), vocab, transformer.idf_
+
+
+class FeatureVocabulary:
+    """Fitted vocabularies and idf weights for every feature block.
+
+    ``weights_applied`` is False for current artifacts (blocks stored
+    unweighted) and True for older ones built with the weights baked in.
+    """
+
+    def __init__(self, blocks: list[dict], weights_applied: bool = False):
+        # each block: {"name", "weight", "vocabulary": [...], "idf": [...]}
+        self.blocks = blocks
+        self.weights_applied = weights_applied
+        self._lookups = [
+            {token: i for i, token in enumerate(block["vocabulary"])} for block in blocks
+        ]
+        self._idf = [np.asarray(block["idf"], dtype=np.float64) for block in blocks]
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            spec = json.load(f)
+        return cls(spec["blocks"], spec.get("weights_applied", True))
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"blocks": self.blocks, "weights_applied": self.weights_applied}, f)
+
+    @property
+    def n_features(self) -> int:
+        return sum(len(block["vocabulary"]) for block in self.blocks)
+
+    @property
+    def block_columns(self) -> list[tuple[str, int, float]]:
+        """(name, column count, default weight) per block, in column order."""
+        return [(b["name"], len(b["vocabulary"]), b["weight"]) for b in self.blocks]
+
+    def transform(self, df) -> csr_matrix:
+        """Featurize movies with the saved vocabularies (unknown tokens are dropped)."""
+        df = df.reset_index(drop=True)
+        tokens = tokenize(df)
+        matrices = []
+        for block, lookup, idf in zip(self.blocks, self._lookups, self._idf):
+            block_tokens = tokens[block["name"]]
+            codes = block_tokens.map(lookup)
+            known = codes.notna().to_numpy()
+            counts = csr_matrix(
+                (
+                    np.ones(known.sum()),
+                    (block_tokens.index.to_numpy()[known], codes[known].astype(np.int64).to_numpy()),
+                ),
+                shape=(len(df), len(lookup)),
+            )
+            counts.sum_duplicates()
+            matrix = normalize(counts @ diags(idf))
+            matrices.append(matrix * block["weight"] if self.weights_applied else matrix)
+        return hstack(matrices).tocsr()
+
+
+# name, weight, n_features (columns each block is hashed into)
+HASHED_BLOCKS = [
+    ("genres", 3.0, 1 << 10),
+    ("keywords", 2.0, 1 << 18),
+    ("language", 2.0, 1 << 10),
+    ("decade", 1.5, 1 << 10),
+]
+
+
+class HashedFeaturizer:
+    """Stateless featurizer: tokens are hashed into a fixed column range per block.
+
+    No vocabulary or idf is fitted, so memory does not grow with the catalog
+    and any movie can be featurized on its own. Each block is l2-normalized
+    term counts, like the TF-IDF blocks without idf.
+    """
+
+    def __init__(self, blocks: list[dict] | None = None, weights_applied: bool = False):
+        # each block: {"name", "weight", "n_features"}
+        self.blocks = blocks or [
+            {"name": name, "weight": weight, "n_features": n} for name, weight, n in HASHED_BLOCKS
+        ]
+        self.weights_applied = weights_applied
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"type": "hashed", "blocks": self.blocks, "weights_applied": self.weights_applied}, f)
+
+    @property
+    def n_features(self) -> int:
+        return sum(block["n_features"] for block in self.blocks)
+
+    @property
+    def block_columns(self) -> list[tuple[str, int, float]]:
+        """(name, column count, default weight) per block, in column order."""
+        return [(b["name"], b["n_features"], b["weight"]) for b in self.blocks]
+
+    def transform(self, df) -> csr_matrix:
+        df = df.reset_index(drop=True)
+        tokens = tokenize(df)
+        matrices = []
+        for block in self.blocks:
+            block_tokens = tokens[block["name"]]
+            # pandas' hash_array is seeded with a fixed key, so columns are
+            # stable across processes and runs
+            columns = pd.util.hash_array(block_tokens.to_numpy(dtype=object)) % np.uint64(block["n_features"])
+            counts = csr_matrix(
+                (np.ones(len(columns)), (block_tokens.index.to_numpy(), columns.astype(np.int64))),
+                shape=(len(df), block["n_features"]),
+            )
+            counts.sum_duplicates()
+            matrix = normalize(counts)
+            matrices.append(matrix * block["weight"] if self.weights_applied else matrix)
+        return hstack(matrices).tocsr()
+
+
+def load_featurizer(path):
+    """Load whichever featurizer built the current matrix (TF-IDF or hashed)."""
+    with open(path) as f:
+        spec = json.load(f)
+    if spec.get("type") == "hashed":
+        return HashedFeaturizer(spec["blocks"], spec.get("weights_applied", True))
+    return FeatureVocabulary(spec["blocks"], spec.get("weights_applied", True))
+
+
+def upsert_rows(matrix, movie_ids, new_ids, new_rows):
+    """Replace rows for ids already in ``movie_ids`` in place; append the rest.
+
+    Existing row positions never move, so indices held by readers stay valid.
+    Returns (matrix, movie_ids).
+    """
+    id_to_idx = {int(mid): i for i, mid in enumerate(movie_ids)}
+    new_ids = np.asarray(new_ids, dtype=movie_ids.dtype)
+    positions = np.array([id_to_idx.get(int(mid), -1) for mid in new_ids], dtype=np.int64)
+    update = positions >= 0
+
+    if update.any():
+        n = matrix.shape[0]
+        keep = np.ones(n)
+        keep[positions[update]] = 0
+        k = int(update.sum())
+        placement = csr_matrix(
+            (np.ones(k), (positions[update], np.arange(k))), shape=(n, k)
+        )
+        matrix = diags(keep) @ matrix + placement @ new_rows[np.flatnonzero(update)]
+        matrix.eliminate_zeros()
+
+    if (~update).any():
+        matrix = vstack([matrix, new_rows[np.flatnonzero(~update)]])
+        movie_ids = np.concatenate([movie_ids, new_ids[~update]])
+
+    return matrix.tocsr(), movie_ids
+
+
+def delete_rows(matrix, movie_ids, ids):
+    """Drop the rows for ``ids``; later rows shift up. Returns (matrix, movie_ids)."""
+    keep = ~np.isin(movie_ids, np.asarray(ids, dtype=movie_ids.dtype))
+    return matrix[np.flatnonzero(keep)], movie_ids[keep]
+
+
+SHARD_INDEX = "index.json"
+
+
+class ShardWriter:
+    """Write CSR row shards of ``shard_rows`` rows as rows arrive.
+
+    movie_ids.npy in ``shard_dir`` covers all shards in order. index.json
+    names the shard files, their row counts and the ids file; it is written
+    last by ``close()``, so a layout without it is incomplete.
+    Shards are stored at ``precision`` ("float64", "float16" or "int8").
+    """
+
+    def __init__(self, shard_dir, shard_rows, n_features, precision="float64"):
+        self.shard_dir = shard_dir
+        self.shard_rows = shard_rows
+        self.n_features = n_features
+        self.precision = precision
+        self.names = []
+        self.rows = []
+        self.movie_ids = []
+        self._pending = []
+        self._pending_rows = 0
+
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        (shard_dir / SHARD_INDEX).unlink(missing_ok=True)
+        for old in [*shard_dir.glob("shard_*.npz"), *shard_dir.glob("movie_ids_g*.npy")]:
+            old.unlink()
+
+    def write(self, rows, movie_ids):
+        self._pending.append(rows.tocsr())
+        self._pending_rows += rows.shape[0]
+        self.movie_ids.append(np.asarray(movie_ids))
+        while self._pending_rows >= self.shard_rows:
+            self._flush(self.shard_rows)
+
+    def _flush(self, n):
+        pending = vstack(self._pending).tocsr() if len(self._pending) > 1 else self._pending[0]
+        name = f"shard_{len(self.names):05d}.npz"
+        save_matrix(self.shard_dir / name, pending[:n], self.precision)
+        self.names.append(name)
+        self.rows.append(int(n))
+        rest = pending[n:]
+        self._pending = [rest] if rest.shape[0] else []
+        self._pending_rows = rest.shape[0]
+
+    def close(self) -> int:
+        if self._pending_rows or not self.names:
+            if not self._pending:
+                self._pending = [csr_matrix((0, self.n_features))]
+            self._flush(self._pending_rows)
+        movie_ids = np.concatenate(self.movie_ids) if self.movie_ids else np.array([], dtype=np.int64)
+        np.save(str(self.shard_dir / "movie_ids.npy"), movie_ids)
+        (self.shard_dir / SHARD_INDEX).write_text(json.dumps({
+            "shard_rows": self.shard_rows,
+            "n_features": self.n_features,
+            "precision": self.precision,
+            "shards": self.names,
+            "rows": self.rows,
+            "movie_ids": "movie_ids.npy",
+        }))
+        return len(self.names)
+
+
+def write_shards(matrix, movie_ids, shard_dir, shard_rows, precision="float64"):
+    """Split ``matrix`` into contiguous row shards of ``shard_rows`` rows."""
+    writer = ShardWriter(shard_dir, shard_rows, matrix.shape[1], precision)
+    writer.write(matrix, movie_ids)
+    return writer.close()
+
+
+def has_shards(shard_dir) -> bool:
+    return (shard_dir / SHARD_INDEX).exists()
+
+
+def shard_size(shard_dir) -> int:
+    return json.loads((shard_dir / SHARD_INDEX).read_text())["shard_rows"]
+
+
+def shard_precision(shard_dir) -> str:
+    return json.loads((shard_dir / SHARD_INDEX).read_text()).get("precision", "float64")
+
+
+def _shard_rows(index, n_ids) -> list[int]:
+    if "rows" in index:
+        return list(index["rows"])
+    # layouts written before row counts were recorded: every shard but the
+    # last is full
+    n = len(index["shards"])
+    return [index["shard_rows"]] * (n - 1) + [n_ids - index["shard_rows"] * (n - 1)]
+
+
+def load_shards(shard_dir):
+    """Return (list of shards, movie_ids) for a layout from ``ShardWriter``.
+
+    Shards are CSR matrices, or QuantizedCSR for a reduced-precision layout.
+    Raises ValueError if the shards and movie ids do not line up.
+    """
+    index = json.loads((shard_dir / SHARD_INDEX).read_text())
+    shards = [load_matrix(shard_dir / name) for name in index["shards"]]
+    movie_ids = np.load(str(shard_dir / index.get("movie_ids", "movie_ids.npy")))
+    rows = _shard_rows(index, len(movie_ids))
+    if [shard.shape[0] for shard in shards] != rows or sum(rows) != len(movie_ids):
+        raise ValueError(f"{shard_dir}: shard rows do not match its {len(movie_ids)} movie ids; rebuild the shards")
+    return shards, movie_ids
+
+
+def _replace(path, write):
+    # written beside the target (keeping its suffix, which numpy and scipy
+    # would otherwise append) and renamed over it, so readers never see a
+    # partial file
+    tmp = path.with_name(f"tmp_{path.name}")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def upsert_shard_rows(shard_dir, movie_ids, rows):
+    """Upsert feature rows in a shard layout, rewriting only the shards they touch.
+
+    Changed movies are replaced inside their shard and new ones appended to
+    the last shard, as RecommendationEngine.add_or_update does in memory.
+    Touched shards keep the layout's precision. They and the movie ids are
+    written under new names, and index.json is replaced last to point at
+    them, as the commit point: a failure before then leaves the old layout
+    intact.
+    """
+    index = json.loads((shard_dir / SHARD_INDEX).read_text())
+    names, precision = list(index["shards"]), index.get("precision", "float64")
+    all_ids = np.load(str(shard_dir / index.get("movie_ids", "movie_ids.npy")))
+    counts = _shard_rows(index, len(all_ids))
+    offsets = np.cumsum([0, *counts])
+    id_to_idx = {int(mid): i for i, mid in enumerate(all_ids)}
+    movie_ids = np.asarray(movie_ids)
+    positions = np.array([id_to_idx.get(int(mid), -1) for mid in movie_ids])
+    owner = np.searchsorted(offsets, positions, side="right") - 1
+    owner[positions < 0] = len(names) - 1
+
+    generation = index.get("generation", 0) + 1
+    parts = []
+    for s, name in enumerate(names):
+        ids = all_ids[offsets[s]:offsets[s + 1]]
+        mine = np.flatnonzero(owner == s)
+        if len(mine):
+            shard = load_matrix(shard_dir / name).tocsr()
+            shard, ids = upsert_rows(shard, ids, movie_ids[mine], rows[mine])
+            names[s] = f"shard_{s:05d}_g{generation}.npz"
+            save_matrix(shard_dir / names[s], shard, precision)
+            counts[s] = int(shard.shape[0])
+        parts.append(ids)
+    new_ids_name = f"movie_ids_g{generation}.npy"
+    np.save(str(shard_dir / new_ids_name), np.concatenate(parts))
+
+    new_index = {**index, "shards": names, "rows": counts, "movie_ids": new_ids_name, "generation": generation}
+    _replace(shard_dir / SHARD_INDEX, lambda tmp: tmp.write_text(json.dumps(new_index)))
+    # the replaced files, and any left by an upsert that failed before its commit
+    current = {*names, new_ids_name}
+    for old in [*shard_dir.glob("shard_*.npz"), *shard_dir.glob("movie_ids*.npy")]:
+        if old.name not in current:
+            old.unlink()
+
+
+FEATURE_DELTA = "feature_delta.npz"
+
+
+def _delta_path(matrix_path):
+    return matrix_path.with_name(FEATURE_DELTA)
+
+
+def append_feature_delta(matrix_path, movie_ids, rows):
+    """Record upserted rows for the single-file matrix without rewriting it.
+
+    Rows for the same movie replace earlier ones. Ids are stored in the same
+    file as the rows, so the delta is replaced in one step.
+    """
+    path = _delta_path(matrix_path)
+    movie_ids = np.asarray(movie_ids, dtype=np.int64)
+    rows = rows.tocsr()
+    if path.exists():
+        with np.load(str(path)) as npz:
+            delta_ids = npz["movie_ids"]
+        rows, movie_ids = upsert_rows(load_npz(str(path)), delta_ids, movie_ids, rows)
+
+    def write(tmp):
+        np.savez(str(tmp), data=rows.data, indices=rows.indices, indptr=rows.indptr,
+                 shape=np.array(rows.shape), format=np.array("csr"), movie_ids=movie_ids)
+    _replace(path, write)
+
+
+def load_feature_matrix(matrix_path, ids_path):
+    """(matrix, movie_ids) of the single-file artifact with any recorded upserts applied."""
+    matrix, movie_ids = load_npz(str(matrix_path)).tocsr(), np.load(str(ids_path))
+    path = _delta_path(matrix_path)
+    if path.exists():
+        with np.load(str(path)) as npz:
+            delta_ids = npz["movie_ids"]
+        matrix, movie_ids = upsert_rows(matrix, movie_ids, delta_ids, load_npz(str(path)).tocsr())
+    return matrix, movie_ids
+
+
+def save_feature_matrix(matrix_path, ids_path, matrix, movie_ids):
+    """Write the whole single-file artifact; recorded upserts are now part of it."""
+    save_npz(str(matrix_path), matrix)
+    np.save(str(ids_path), movie_ids)
+    _delta_path(matrix_path).unlink(missing_ok=True)
+
+
+def remove_feature_matrix(matrix_path, ids_path):
+    for path in (matrix_path, ids_path, _delta_path(matrix_path)):
+        path.unlink(missing_ok=True)
+
+
+def refresh_shards(matrix, movie_ids, shard_dir):
+    """Rewrite an existing shard layout from ``matrix``, keeping its shard size and precision."""
+    if has_shards(shard_dir):
+        write_shards(matrix, movie_ids, shard_dir, shard_size(shard_dir), shard_precision(shard_dir))
@@ -0,0 +1,114 @@
+"""Change detection for the offline data pipeline.
+
+Each stage keeps a snapshot of per-movie content hashes, taken over the
+columns it consumes, from the last time it completed. Diffing the current
+hashes against that snapshot tells the stage which movies were inserted,
+updated or deleted, or that it has nothing to do. Snapshots are written only
+after a stage succeeds, so an interrupted run is redone on the next one.
+
+Snapshots live in backend/data/manifest/<stage>.parquet (id, hash), with an
+optional <stage>.json for stage-level inputs such as the raw CSV fingerprint.
+"""
+
+import json
+import os
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+HASH_BATCH_SIZE = 50_000
+
+
+def hash_parquet(path, columns) -> pd.DataFrame:
+    """Per-movie uint64 content hash of ``columns``, read in record batches.
+
+    Duplicate ids keep the last row, matching how the loaders resolve them.
+    """
+    parts = []
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=HASH_BATCH_SIZE, columns=["id", *columns]):
+        df = batch.to_pandas()
+        parts.append(pd.DataFrame({
+            "id": df["id"].to_numpy(np.int64),
+            "hash": pd.util.hash_pandas_object(df[columns], index=False).to_numpy(),
+        }))
+    if not parts:
+        return pd.DataFrame({"id": np.array([], np.int64), "hash": np.array([], np.uint64)})
+    return pd.concat(parts, ignore_index=True).drop_duplicates("id", keep="last")
+
+
+@dataclass
+class ChangeSet:
+    inserted: np.ndarray
+    updated: np.ndarray
+    deleted: np.ndarray
+    total: int
+
+    @property
+    def changed(self) -> np.ndarray:
+        """Ids whose current row must be (re)applied."""
+        return np.concatenate([self.inserted, self.updated])
+
+    @property
+    def fraction(self) -> float:
+        n = len(self.inserted) + len(self.updated) + len(self.deleted)
+        return n / max(self.total, 1)
+
+    def __bool__(self):
+        return bool(len(self.inserted) or len(self.updated) or len(self.deleted))
+
+    def __str__(self):
+        return f"{len(self.inserted)} inserted, {len(self.updated)} updated, {len(self.deleted)} deleted"
+
+
+def diff_hashes(previous, current) -> ChangeSet:
+    prev_ids = previous["id"].to_numpy()
+    cur_ids = current["id"].to_numpy()
+    # inner merge keeps the hash columns uint64 (an outer merge would cast to float)
+    both = previous.merge(current, on="id", suffixes=("_old", "_new"))
+    return ChangeSet(
+        inserted=cur_ids[~np.isin(cur_ids, prev_ids)],
+        updated=both.loc[both["hash_old"] != both["hash_new"], "id"].to_numpy(),
+        deleted=prev_ids[~np.isin(prev_ids, cur_ids)],
+        total=len(current),
+    )
+
+
+class StageManifest:
+    """Snapshot of what one pipeline stage last built from."""
+
+    def __init__(self, data_dir, stage):
+        self.dir = data_dir / "manifest"
+        self.hashes_path = self.dir / f"{stage}.parquet"
+        self.meta_path = self.dir / f"{stage}.json"
+
+    def load_hashes(self):
+        if not self.hashes_path.exists():
+            return None
+        return pd.read_parquet(self.hashes_path)
+
+    def load_meta(self):
+        if not self.meta_path.exists():
+            return None
+        return json.loads(self.meta_path.read_text())
+
+    def save(self, hashes=None, meta=None):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        # write-then-rename so a crash never leaves a half-written snapshot
+        if hashes is not None:
+            tmp = self.hashes_path.with_suffix(".parquet.tmp")
+            hashes.to_parquet(tmp, index=False)
+            os.replace(tmp, self.hashes_path)
+        if meta is not None:
+            tmp = self.meta_path.with_suffix(".json.tmp")
+            tmp.write_text(json.dumps(meta))
+            os.replace(tmp, self.meta_path)
+
+    def clear(self):
+        self.hashes_path.unlink(missing_ok=True)
+        self.meta_path.unlink(missing_ok=True)
+
+
+def file_fingerprint(path) -> dict:
+    stat = path.stat()
+    return {"path": str(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
@@ -0,0 +1,127 @@
+"""Reduced-precision CSR storage for feature matrices.
+
+A float64 CSR row costs 12 bytes per non-zero (8-byte value, 4-byte column).
+QuantizedCSR keeps values as float16, or as int8 with one float32 scale per
+row (value = q * scale, scale = max |value| / 127), and columns as uint16
+whenever the matrix has at most 65536 of them. That is 4 or 3 bytes per
+non-zero for the TF-IDF matrix, 6 or 5 for the hashed one.
+
+A mat-vec widens one shard's values for the duration of the call and runs
+scipy's kernel with the float64 query, so products and row sums are float64:
+rounding comes only from the stored values, not from accumulation. The
+widening makes it about twice as slow as a float64 mat-vec.
+
+Quantized files record their precision; ``load_matrix`` returns a
+QuantizedCSR or a scipy CSR matrix accordingly, and both support ``tocsr()``.
+"""
+
+import numpy as np
+from scipy.sparse import csr_matrix, load_npz, save_npz
+
+PRECISIONS = ("float64", "float16", "int8")
+
+
+class QuantizedCSR:
+    def __init__(self, data, indices, indptr, shape, precision, scale=None):
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = tuple(shape)
+        self.precision = precision
+        self.scale = scale  # per-row float32 scale, int8 only
+
+    @classmethod
+    def from_csr(cls, matrix, precision: str) -> "QuantizedCSR":
+        matrix = matrix.tocsr()
+        matrix.sort_indices()
+        index_dtype = np.uint16 if matrix.shape[1] <= 1 << 16 else np.int32
+        indices = matrix.indices.astype(index_dtype)
+        indptr = matrix.indptr.astype(np.int32 if matrix.nnz < 2**31 else np.int64)
+        if precision == "float16":
+            return cls(matrix.data.astype(np.float16), indices, indptr, matrix.shape, precision)
+        if precision != "int8":
+            raise ValueError(f"Unknown precision: {precision}")
+        row_max = np.zeros(matrix.shape[0])
+        nonempty = np.diff(indptr) > 0
+        row_max[nonempty] = np.maximum.reduceat(np.abs(matrix.data), indptr[:-1][nonempty])
+        scale = (row_max / 127).astype(np.float32)
+        per_value = np.repeat(scale, np.diff(indptr)).astype(np.float64)
+        data = np.rint(np.divide(matrix.data, per_value, out=np.zeros_like(matrix.data), where=per_value > 0))
+        return cls(data.astype(np.int8), indices, indptr, matrix.shape, precision, scale)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.data)
+
+    @property
+    def nbytes(self) -> int:
+        extra = self.scale.nbytes if self.scale is not None else 0
+        return self.data.nbytes + self.indices.nbytes + self.indptr.nbytes + extra
+
+    def _values(self, positions=None, rows=None):
+        """Dequantized float64 values (all, or at ``positions`` lying in ``rows``)."""
+        data = self.data if positions is None else self.data[positions]
+        values = data.astype(np.float64)
+        if self.scale is not None:
+            if rows is None:
+                rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+            values *= self.scale[rows]
+        return values
+
+    def tocsr(self) -> csr_matrix:
+        return csr_matrix((self._values(), self.indices.astype(np.int32), self.indptr), shape=self.shape)
+
+    def __getitem__(self, rows) -> csr_matrix:
+        """Dequantized float64 CSR of the given rows, in order."""
+        rows = np.asarray(rows)
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        positions = np.repeat(starts - indptr[:-1], lengths) + np.arange(indptr[-1])
+        values = self._values(positions, np.repeat(rows, lengths))
+        indices = self.indices[positions].astype(np.int32)
+        return csr_matrix((values, indices, indptr), shape=(len(rows), self.shape[1]))
+
+    def __matmul__(self, vector) -> np.ndarray:
+        # scipy.sparse has no float16; int8 is upcast by scipy itself
+        data = self.data if self.scale is not None else self.data.astype(np.float64)
+        out = csr_matrix((data, self.indices, self.indptr), shape=self.shape, copy=False) @ vector
+        if self.scale is not None:
+            out *= self.scale
+        return out
+
+
+def quantize(matrix, precision: str):
+    """``matrix`` stored at ``precision``; float64 leaves it a scipy CSR matrix."""
+    if precision == "float64":
+        return matrix.tocsr()
+    return QuantizedCSR.from_csr(matrix, precision)
+
+
+def matrix_nbytes(matrix) -> int:
+    if isinstance(matrix, QuantizedCSR):
+        return matrix.nbytes
+    return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+
+def save_matrix(path, matrix, precision: str = "float64"):
+    """Write ``matrix`` at ``precision``; float64 is a plain scipy .npz."""
+    matrix = quantize(matrix, precision)
+    if not isinstance(matrix, QuantizedCSR):
+        save_npz(str(path), matrix)
+        return
+    arrays = {"data": matrix.data, "indices": matrix.indices, "indptr": matrix.indptr}
+    if matrix.scale is not None:
+        arrays["scale"] = matrix.scale
+    with open(path, "wb") as f:
+        np.savez(f, precision=np.array(matrix.precision), shape=np.array(matrix.shape), **arrays)
+
+
+def load_matrix(path):
+    with np.load(str(path)) as npz:
+        if "precision" not in npz.files:
+            return load_npz(str(path)).tocsr()
+        return QuantizedCSR(
+            npz["data"], npz["indices"], npz["indptr"], npz["shape"],
+            str(npz["precision"]), npz["scale"] if "scale" in npz.files else None,
+        )
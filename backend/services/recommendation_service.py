@@ -1,14 +1,219 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from scipy.sparse import load_npz
-from config import FEATURE_MATRIX_PATH, MOVIE_IDS_PATH
+from scipy.sparse import csr_matrix, vstack
+from config import (
+    CF_BLEND_WEIGHT, CF_MIN_HISTORY, CF_MODEL_DIR, FEATURE_MATRIX_PATH, FEATURE_PRECISION, FEATURE_SHARDS_DIR,
+    FEATURE_VOCAB_PATH, MOVIE_IDS_PATH, RECOMMENDATION_DIVERSITY_POOL, RECOMMENDATION_SHARD_WORKERS,
+)
+from services.collaborative import CollaborativeModel, has_model
+from services.features import has_shards, load_feature_matrix, load_featurizer, load_shards, upsert_rows
+from services.quantization import QuantizedCSR, matrix_nbytes, quantize
+
+
+class _Catalog(NamedTuple):
+    shards: list          # CSR or QuantizedCSR row shards, in movie_ids order
+    offsets: np.ndarray   # first global row of each shard, plus the total
+    block_sq_norms: list  # per shard: (rows, blocks) squared L2 norm of each block
+                          # (float32 for quantized shards, whose values are coarser anyway)
+    movie_ids: np.ndarray
+    id_to_idx: dict
+    cf_items: np.ndarray | None  # per row: its item in the CF model, -1 if unknown
+
+
+def _build_catalog(shards, movie_ids, block_indicator, id_to_idx=None, cf=None) -> _Catalog:
+    if id_to_idx is None:
+        id_to_idx = {int(mid): i for i, mid in enumerate(movie_ids)}
+    return _Catalog(
+        shards=shards,
+        offsets=np.cumsum([0] + [shard.shape[0] for shard in shards]),
+        block_sq_norms=[_block_sq_norms(shard, block_indicator) for shard in shards],
+        movie_ids=movie_ids,
+        id_to_idx=id_to_idx,
+        cf_items=cf.item_index(movie_ids) if cf is not None else None,
+    )
+
+
+def _block_sq_norms(shard, block_indicator):
+    rows = shard.tocsr()
+    norms = (rows.multiply(rows) @ block_indicator).toarray()
+    return norms if _precision(shard) == "float64" else norms.astype(np.float32)
+
+
+def _check_deadline(deadline):
+    if deadline is not None and time.monotonic() >= deadline:
+        raise TimeoutError("recommendation deadline passed")
+
+
+def _precision(shard) -> str:
+    return shard.precision if isinstance(shard, QuantizedCSR) else "float64"
+
+
+def _block_layout(n_features):
+    """Block names, column counts, default weights and stored scale.
+
+    Current artifacts store blocks unweighted (scale 1); older ones have the
+    default weights baked in, which is undone at query time. Without a
+    matching feature_vocab.json the matrix is treated as a single block.
+    """
+    if FEATURE_VOCAB_PATH.exists():
+        featurizer = load_featurizer(FEATURE_VOCAB_PATH)
+        columns = featurizer.block_columns
+        if sum(n for _, n, _ in columns) == n_features:
+            weights = np.array([w for _, _, w in columns], dtype=np.float64)
+            scale = weights if featurizer.weights_applied else np.ones(len(columns))
+            return [name for name, _, _ in columns], [n for _, n, _ in columns], weights, scale
+    return ["all"], [n_features], np.ones(1), np.ones(1)
 
 
 class RecommendationEngine:
     def __init__(self):
-        self.feature_matrix = load_npz(str(FEATURE_MATRIX_PATH))
-        self.movie_ids = np.load(str(MOVIE_IDS_PATH))
-        self.id_to_idx = {int(mid): i for i, mid in enumerate(self.movie_ids)}
+        # A sharded layout (03_build_features.py --shard-rows) is scored shard
+        # by shard so per-request memory is bounded by the shard size.
+        if has_shards(FEATURE_SHARDS_DIR):
+            shards, movie_ids = load_shards(FEATURE_SHARDS_DIR)
+        else:
+            matrix, movie_ids = load_feature_matrix(FEATURE_MATRIX_PATH, MOVIE_IDS_PATH)
+            shards = [matrix]
+        # FEATURE_PRECISION quantizes full-precision artifacts in memory;
+        # shards written quantized are used as stored
+        if _precision(shards[0]) == "float64":
+            shards = [quantize(s, FEATURE_PRECISION) for s in shards]
+        # Hybrid mode when a collaborative-filtering model has been trained
+        cf = CollaborativeModel.load(CF_MODEL_DIR) if has_model(CF_MODEL_DIR) else None
+        self._setup(shards, movie_ids, _block_layout(shards[0].shape[1]), RECOMMENDATION_SHARD_WORKERS, cf)
+
+    @classmethod
+    def from_arrays(cls, shards, movie_ids, block_columns=None, shard_workers=1, precision="float64", cf=None):
+        """Build an engine from in-memory arrays instead of the data directory.
+
+        ``shards`` is a sparse matrix or a list of row shards; ``block_columns``
+        lists (name, column count, default weight) for unweighted blocks and
+        defaults to a single block of weight 1. Shards are stored at
+        ``precision``; ``cf`` is an optional CollaborativeModel. Used by
+        benchmarks.
+        """
+        if not isinstance(shards, list):
+            shards = [shards]
+        shards = [quantize(shard, precision) for shard in shards]
+        if block_columns is None:
+            block_columns = [("all", shards[0].shape[1], 1.0)]
+        layout = (
+            [name for name, _, _ in block_columns],
+            [n for _, n, _ in block_columns],
+            np.array([w for _, _, w in block_columns], dtype=np.float64),
+            np.ones(len(block_columns)),
+        )
+        engine = cls.__new__(cls)
+        engine._setup(shards, np.asarray(movie_ids), layout, shard_workers, cf)
+        return engine
+
+    def _setup(self, shards, movie_ids, layout, shard_workers, cf=None):
+        # Block weights are applied at query time: a block's weight squared
+        # is folded into the query vector and combined with per-block squared
+        # row norms, so cosine scores match a matrix built with those weights.
+        names, counts, weights, scale = layout
+        self.block_names = names
+        self.default_weights = dict(zip(names, weights.tolist()))
+        self._block_scale = scale
+        self._column_block = np.repeat(np.arange(len(names)), counts)
+        self._block_indicator = csr_matrix(
+            (np.ones(len(self._column_block)), (np.arange(len(self._column_block)), self._column_block)),
+            shape=(len(self._column_block), len(names)),
+        )
+
+        self.cf = cf
+        # swapped as one tuple so readers never see shards and an id mapping
+        # from different versions
+        self._catalog = _build_catalog(shards, movie_ids, self._block_indicator, cf=cf)
+        self._write_lock = threading.Lock()
+        # scipy's sparse mat-vec (which QuantizedCSR also runs) releases the
+        # GIL, so shards score in parallel
+        self._pool = None
+        if len(shards) > 1 and shard_workers > 1:
+            self._pool = ThreadPoolExecutor(max_workers=shard_workers, thread_name_prefix="shard-scoring")
+
+    @property
+    def feature_matrix(self):
+        """The whole catalog as one float64 CSR matrix (dequantized if quantized)."""
+        shards = self._catalog.shards
+        return shards[0].tocsr() if len(shards) == 1 else vstack([s.tocsr() for s in shards]).tocsr()
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return int(self._catalog.offsets[-1]), self._catalog.shards[0].shape[1]
+
+    @property
+    def n_shards(self) -> int:
+        return len(self._catalog.shards)
+
+    @property
+    def precision(self) -> str:
+        return _precision(self._catalog.shards[0])
+
+    @property
+    def nbytes(self) -> int:
+        """Array memory held by the catalog (shards, norms and ids; not the id dict)."""
+        catalog = self._catalog
+        matrices = sum(matrix_nbytes(s) for s in catalog.shards)
+        return matrices + sum(n.nbytes for n in catalog.block_sq_norms) + catalog.movie_ids.nbytes
+
+    @property
+    def movie_ids(self):
+        return self._catalog.movie_ids
+
+    @property
+    def id_to_idx(self):
+        return self._catalog.id_to_idx
+
+    def add_or_update(self, movie_ids, rows):
+        """Upsert feature rows for new or changed movies without a reload.
+
+        Changed movies are replaced inside their shard; new ones are appended
+        to the last shard. New movies get no CF score until the model is
+        retrained.
+        """
+        movie_ids = np.asarray(movie_ids)
+        with self._write_lock:
+            catalog = self._catalog
+            positions = np.array([catalog.id_to_idx.get(int(mid), -1) for mid in movie_ids])
+            owner = np.searchsorted(catalog.offsets, positions, side="right") - 1
+            owner[positions < 0] = len(catalog.shards) - 1
+
+            shards = list(catalog.shards)
+            shard_ids = []
+            for s, shard in enumerate(shards):
+                ids = catalog.movie_ids[catalog.offsets[s]:catalog.offsets[s + 1]]
+                mine = np.flatnonzero(owner == s)
+                if len(mine):
+                    updated, ids = upsert_rows(shard.tocsr(), ids, movie_ids[mine], rows[mine])
+                    shards[s] = quantize(updated, _precision(shard))
+                shard_ids.append(ids)
+
+            all_ids = np.concatenate(shard_ids)
+            id_to_idx = dict(catalog.id_to_idx)
+            for i in range(len(id_to_idx), len(all_ids)):
+                id_to_idx[int(all_ids[i])] = i
+            self._catalog = _build_catalog(shards, all_ids, self._block_indicator, id_to_idx, self.cf)
+
+    def block_factors(self, block_weights: dict[str, float] | None = None) -> np.ndarray:
+        """Per-block multipliers for the stored matrix, from default + override weights.
+
+        Raises ValueError for unknown blocks, negative weights or all zeros.
+        """
+        merged = dict(self.default_weights)
+        for name, weight in (block_weights or {}).items():
+            if name not in merged:
+                raise ValueError(f"Unknown feature block: {name}")
+            if weight < 0:
+                raise ValueError(f"Weight for {name} must be non-negative")
+            merged[name] = float(weight)
+        factors = np.array([merged[name] for name in self.block_names]) / self._block_scale
+        if not factors.any():
+            raise ValueError("At least one block weight must be positive")
+        return factors
 
     def recommend(
         self,
@@ -16,16 +221,38 @@ class RecommendationEngine:
         watched_ratings: list[int],
         exclude_ids: set[int],
         limit: int = 20,
+        block_weights: dict[str, float] | None = None,
+        diversity: float = 0.0,
+        deadline: float | None = None,
     ) -> list[dict]:
+        """Top ``limit`` movies by cosine similarity to the rating-weighted profile.
+
+        With a CF model and at least CF_MIN_HISTORY watched movies it knows,
+        each score is ``(1 - CF_BLEND_WEIGHT) * cosine + CF_BLEND_WEIGHT * cf``,
+        where ``cf`` is the model's predicted preference clipped to [0, 1].
+        Movies the model has not seen (added after training) keep their
+        cosine score.
+        With ``diversity`` > 0 the top RECOMMENDATION_DIVERSITY_POOL candidates
+        are re-ranked by maximal marginal relevance (see ``_diversify``);
+        reported scores stay the relevance scores.
+
+        ``deadline`` (a time.monotonic() value) is checked before each shard
+        and before re-ranking; past it, TimeoutError is raised so a caller
+        that has given up does not leave the scoring running.
+        """
         if not watched_movie_ids:
             return []
+        factors = self.block_factors(block_weights)
+
+        catalog = self._catalog
+        id_to_idx = catalog.id_to_idx
 
         # row indices for watched movies
         indices = []
         ratings = []
         for mid, rating in zip(watched_movie_ids, watched_ratings):
-            if mid in self.id_to_idx:
-                indices.append(self.id_to_idx[mid])
+            if mid in id_to_idx:
+                indices.append(id_to_idx[mid])
                 ratings.append(rating)
 
         if not indices:
@@ -37,32 +264,129 @@ class RecommendationEngine:
             weights = np.ones(len(weights))
 
         # weighted user profile vector
-        watched_vectors = self.feature_matrix[indices]
+        watched_vectors = self._rows(catalog, np.array(indices))
         user_vector = (watched_vectors.T @ weights) / weights.sum()
 
-        # cosine similarity against all movies
-        scores = cosine_similarity(
-            user_vector.reshape(1, -1), self.feature_matrix
-        ).flatten()
+        # cosine(u_w, m_w) with u_w = f*u, m_w = f*m: fold f^2 into the query
+        # and divide by the weighted row norms, sqrt(sum_b f_b^2 |m_b|^2)
+        column_factors = factors[self._column_block]
+        user_norm = np.linalg.norm(user_vector * column_factors)
+        if user_norm == 0:
+            return []
+        query = user_vector * column_factors ** 2 / user_norm
+        sq_factors = factors ** 2
 
-        # zero out watched and excluded movies
-        for mid in exclude_ids:
-            if mid in self.id_to_idx:
-                scores[self.id_to_idx[mid]] = 0
+        excluded = np.sort([id_to_idx[mid] for mid in exclude_ids if mid in id_to_idx]).astype(np.int64)
+        k = max(limit, RECOMMENDATION_DIVERSITY_POOL) if diversity > 0 else limit
+        cf_scores = self._cf_scores(catalog, np.array(indices), ratings)
 
-        # top N
-        top_indices = np.argsort(scores)[::-1][:limit]
+        # per-shard top-k, then merge
+        def score(s):
+            _check_deadline(deadline)
+            return self._score_shard(catalog, s, query, sq_factors, excluded, k, cf_scores)
 
-        results = []
-        for idx in top_indices:
-            if scores[idx] <= 0:
-                break
-            results.append({
-                "movie_id": int(self.movie_ids[idx]),
-                "score": round(float(scores[idx]), 4),
-            })
+        if self._pool is not None:
+            parts = list(self._pool.map(score, range(len(catalog.shards))))
+        else:
+            parts = [score(s) for s in range(len(catalog.shards))]
+        scores = np.concatenate([p[0] for p in parts])
+        rows = np.concatenate([p[1] for p in parts])
+        top = np.argsort(-scores, kind="stable")[:k]
+        if diversity > 0 and len(top) > limit:
+            _check_deadline(deadline)
+            top = top[self._diversify(catalog, rows[top], scores[top], column_factors, diversity, limit)]
 
-        return results
+        return [
+            {
+                "movie_id": int(catalog.movie_ids[rows[i]]),
+                "score": round(float(scores[i]), 4),
+            }
+            for i in top
+        ]
+
+    @staticmethod
+    def _rows(catalog, indices):
+        """Gather global rows from their shards (returned in ``indices`` order)."""
+        if len(catalog.shards) == 1:
+            return catalog.shards[0][indices]
+        owner = np.searchsorted(catalog.offsets, indices, side="right") - 1
+        order = np.argsort(owner, kind="stable")
+        parts = [
+            catalog.shards[s][indices[order][owner[order] == s] - catalog.offsets[s]]
+            for s in np.unique(owner)
+        ]
+        return vstack(parts).tocsr()[np.argsort(order)]
+
+    def _diversify(self, catalog, rows, relevance, column_factors, diversity, limit):
+        """Greedy maximal marginal relevance over candidates sorted by relevance.
+
+        Each step picks the candidate maximizing
+        ``(1 - diversity) * relevance - diversity * (max cosine to those picked)``.
+        Cosines are taken in the block-weighted space used for scoring. Only
+        the picked rows of the candidate-candidate similarity matrix are
+        needed, so each of the ``limit`` steps is one sparse mat-vec of the
+        pool against the row just picked plus a few array operations.
+        Returns candidate positions in pick order.
+        """
+        vectors = self._rows(catalog, rows).copy()
+        vectors.data *= column_factors[vectors.indices]
+        norms = np.sqrt(np.bincount(np.repeat(np.arange(len(rows)), np.diff(vectors.indptr)),
+                                    weights=vectors.data ** 2, minlength=len(rows)))
+        vectors.data /= np.repeat(np.where(norms > 0, norms, 1), np.diff(vectors.indptr))
+
+        gain = (1 - diversity) * relevance
+        penalty = np.zeros(len(rows))  # max similarity to any pick so far
+        picked = np.empty(limit, dtype=np.int64)
+        available = np.ones(len(rows), dtype=bool)
+        dense = np.zeros(vectors.shape[1])
+        for i in range(limit):
+            mmr = np.where(available, gain - diversity * penalty, -np.inf)
+            j = int(np.argmax(mmr))
+            picked[i] = j
+            available[j] = False
+            cols = vectors.indices[vectors.indptr[j]:vectors.indptr[j + 1]]
+            dense[cols] = vectors.data[vectors.indptr[j]:vectors.indptr[j + 1]]
+            np.maximum(penalty, vectors @ dense, out=penalty)
+            dense[cols] = 0
+        return picked
+
+    def _cf_scores(self, catalog, rows, ratings):
+        """Clipped CF preference of every model item for this history, or None.
+
+        None without a model or with fewer than CF_MIN_HISTORY known movies.
+        """
+        if catalog.cf_items is None:
+            return None
+        items = catalog.cf_items[rows]
+        known = items >= 0
+        if known.sum() < CF_MIN_HISTORY:
+            return None
+        scores = self.cf.scores(items[known], np.asarray(ratings)[known])
+        return np.clip(scores, 0, 1)
+
+    @staticmethod
+    def _score_shard(catalog, s, query, sq_factors, excluded, k, cf_scores=None):
+        """Cosine (or hybrid) top-k of one shard: (scores, global rows), positive scores only."""
+        start, end = catalog.offsets[s], catalog.offsets[s + 1]
+        norms = np.sqrt(catalog.block_sq_norms[s] @ sq_factors)
+        dots = catalog.shards[s] @ query
+        sims = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+        if cf_scores is not None:
+            # rows the model does not know (cf_items == -1) keep the cosine score
+            items = catalog.cf_items[start:end]
+            known = items >= 0
+            sims[known] = (1 - CF_BLEND_WEIGHT) * sims[known] + CF_BLEND_WEIGHT * cf_scores[items[known]]
+
+        # zero out watched and excluded movies
+        lo, hi = np.searchsorted(excluded, [start, end])
+        sims[excluded[lo:hi] - start] = 0
+
+        if k < len(sims):
+            top = np.argpartition(-sims, k - 1)[:k]
+        else:
+            top = np.arange(len(sims))
+        top = top[sims[top] > 0]
+        return sims[top], top + start
 
     def explain(
         self,
@@ -117,3 +441,70 @@ class RecommendationEngine:
             reasons.append("Based on your overall taste profile")
 
         return reasons
+
+
+POPULARITY_FALLBACK_SQL = "SELECT id, genres FROM movies ORDER BY popularity DESC"
+
+
+class PopularityFallback:
+    """Cheap, precomputed recommendations: the most popular movies per genre.
+
+    Served instead of full scoring when the recommender is saturated or the
+    request's latency budget runs out.
+    """
+
+    def __init__(self, rows, per_genre: int = 200, overall: int = 500):
+        # rows: (movie_id, genres) ordered by popularity descending
+        self.by_genre: dict[str, list[int]] = {}
+        self.overall: list[int] = []
+        self.movie_genres: dict[int, set[str]] = {}
+        for movie_id, genres in rows:
+            genre_set = {g.strip() for g in (genres or "").split(",") if g.strip()}
+            kept = False
+            for g in genre_set:
+                bucket = self.by_genre.setdefault(g, [])
+                if len(bucket) < per_genre:
+                    bucket.append(movie_id)
+                    kept = True
+            if len(self.overall) < overall:
+                self.overall.append(movie_id)
+                kept = True
+            if kept:
+                self.movie_genres[movie_id] = genre_set
+
+    def recommend(
+        self,
+        user_top_genres: list[str],
+        exclude_ids: set[int],
+        limit: int = 20,
+    ) -> list[dict]:
+        top = user_top_genres[:3]
+        top_set = set(top)
+        genre_lists = [self.by_genre.get(g, []) for g in top]
+
+        # Interleave the per-genre popularity lists, then pad with overall.
+        seen = set(exclude_ids)
+        picked = []
+        depth = max((len(l) for l in genre_lists), default=0)
+        for rank in range(depth):
+            if len(picked) >= limit:
+                break
+            for candidates in genre_lists:
+                if rank < len(candidates) and candidates[rank] not in seen:
+                    seen.add(candidates[rank])
+                    picked.append(candidates[rank])
+        for movie_id in self.overall:
+            if len(picked) >= limit:
+                break
+            if movie_id not in seen:
+                seen.add(movie_id)
+                picked.append(movie_id)
+
+        results = []
+        for movie_id in picked[:limit]:
+            overlap = len(self.movie_genres.get(movie_id, set()) & top_set)
+            results.append({
+                "movie_id": movie_id,
+                "score": round(overlap / len(top_set), 4) if top_set else 0.0,
+            })
+        return results
@@ -0,0 +1,118 @@
+"""In-memory typeahead index over movie titles.
+
+Titles and original titles are folded (accents stripped, case-folded,
+punctuation turned into spaces) and indexed at every word start, so "knig"
+finds "The Dark Knight" and "amelie" finds "Amélie". Each entry is the folded
+suffix from that word on, truncated to KEY_BYTES of UTF-8, in one sorted
+numpy bytes array; a query is a binary search for its prefix range.
+
+Movies are numbered in popularity order, so ranking the matches is a
+partial sort of small integers instead of a lookup and sort by popularity.
+"""
+
+import re
+import unicodedata
+import numpy as np
+
+KEY_BYTES = 32
+MAX_WORDS = 8  # word starts indexed per title
+# A movie appears at most this often in one prefix range
+MAX_ENTRIES_PER_MOVIE = 2 * MAX_WORDS
+
+TITLE_INDEX_SQL = """SELECT id, title, original_title, release_date, poster_path
+    FROM movies ORDER BY popularity DESC, id"""
+
+_APOSTROPHES = re.compile(r"['’]")
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def fold(text: str) -> str:
+    """Accent- and case-insensitive form of ``text`` with single spaces between words."""
+    text = unicodedata.normalize("NFKD", _APOSTROPHES.sub("", text))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(_NON_WORD.sub(" ", text.casefold()).split())
+
+
+def _word_starts(folded: str) -> list[str]:
+    starts = [0] + [i + 1 for i, c in enumerate(folded) if c == " "]
+    return [folded[i:] for i in starts[:MAX_WORDS]]
+
+
+class TitleIndex:
+    def __init__(self, rows):
+        """``rows`` are (id, title, original_title, release_date, poster_path) by popularity."""
+        self.movie_ids = []
+        self.titles = []
+        self.original_titles = []
+        self.release_dates = []
+        self.poster_paths = []
+        keys = []
+        entry_movies = []
+        for i, (movie_id, title, original_title, release_date, poster_path) in enumerate(rows):
+            self.movie_ids.append(movie_id)
+            self.titles.append(title)
+            self.original_titles.append(original_title)
+            self.release_dates.append(release_date)
+            self.poster_paths.append(poster_path)
+            suffixes = set(_word_starts(fold(title or "")))
+            if original_title:
+                suffixes.update(_word_starts(fold(original_title)))
+            for suffix in suffixes:
+                if suffix:
+                    keys.append(suffix.encode("utf-8"))
+                    entry_movies.append(i)
+
+        # S dtype truncates keys to KEY_BYTES; longer queries are verified below
+        keys = np.array(keys, dtype=f"S{KEY_BYTES}")
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.entry_movies = np.array(entry_movies, dtype=np.int32)[order]
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def suggest(self, query: str, limit: int = 10) -> list[int]:
+        """Indices of the most popular movies with a title word starting with ``query``."""
+        prefix = fold(query).encode("utf-8")
+        if not prefix:
+            return []
+        key = prefix[:KEY_BYTES]
+        lo = np.searchsorted(self.keys, key, side="left")
+        # 0xff never occurs in UTF-8, so key + 0xff sorts after every key it prefixes
+        hi = np.searchsorted(self.keys, key + b"\xff", side="left")
+        candidates = self.entry_movies[lo:hi]
+        if len(prefix) > KEY_BYTES:
+            return self._verified(candidates, fold(query), limit)
+
+        # The limit smallest movie numbers (most popular) are among the
+        # limit * MAX_ENTRIES_PER_MOVIE smallest entries, duplicates included
+        k = limit * MAX_ENTRIES_PER_MOVIE
+        if len(candidates) > k:
+            candidates = np.partition(candidates, k - 1)[:k]
+        return np.unique(candidates)[:limit].tolist()
+
+    def _verified(self, candidates, folded_query, limit):
+        matches = []
+        for i in np.unique(candidates).tolist():
+            titles = [self.titles[i], self.original_titles[i]]
+            if any(_starts_word(fold(t), folded_query) for t in titles if t):
+                matches.append(i)
+                if len(matches) == limit:
+                    break
+        return matches
+
+    def suggestions(self, query: str, limit: int = 10) -> list[dict]:
+        return [
+            {
+                "id": self.movie_ids[i],
+                "title": self.titles[i],
+                "original_title": self.original_titles[i],
+                "release_date": self.release_dates[i],
+                "poster_path": self.poster_paths[i],
+            }
+            for i in self.suggest(query, limit)
+        ]
+
+
+def _starts_word(folded_title: str, folded_query: str) -> bool:
+    return any(suffix.startswith(folded_query) for suffix in _word_starts(folded_title))
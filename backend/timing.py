@@ -0,0 +1,235 @@
+"""Per-request phase timing, reported in a Server-Timing header and as histograms.
+
+When REQUEST_TIMING_ENABLED is set, TimingMiddleware gives every request a
+RequestTimings collector in a context variable. Code marks phases with
+``with timed("recommend"):``; get_db wraps the connection in TimedConnection
+so each SQL statement (execute plus fetches) is added to the "sql" phase, and
+TimedRoute records how long FastAPI spends validating and serializing the
+endpoint's return value. At response start the phases go out as a
+Server-Timing header and into the request_phase_seconds histogram.
+
+When disabled, the middleware and route class are pass-throughs and
+``timed()`` returns a shared no-op context manager.
+"""
+
+import asyncio
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from functools import wraps
+from fastapi.routing import APIRoute
+from config import REQUEST_TIMING_ENABLED
+from metrics import observe
+
+_current: ContextVar["RequestTimings | None"] = ContextVar("request_timings", default=None)
+_NOOP = nullcontext()
+
+
+class RequestTimings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        # phase -> [seconds, count], in first-seen order
+        self.phases: dict[str, list] = {}
+        self.endpoint_done = None
+
+    def add(self, phase: str, seconds: float) -> None:
+        entry = self.phases.get(phase)
+        if entry is None:
+            self.phases[phase] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def header(self) -> str:
+        parts = []
+        for phase, (seconds, count) in self.phases.items():
+            part = f"{phase};dur={seconds * 1000:.2f}"
+            if count > 1:
+                part += f';desc="{count} calls"'
+            parts.append(part)
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.2f}")
+        return ", ".join(parts)
+
+
+class _Phase:
+    __slots__ = ("timings", "phase", "start")
+
+    def __init__(self, timings, phase):
+        self.timings = timings
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timings.add(self.phase, time.perf_counter() - self.start)
+
+
+def timed(phase: str):
+    """Context manager adding the enclosed block's duration to ``phase``."""
+    timings = _current.get()
+    if timings is None:
+        return _NOOP
+    return _Phase(timings, phase)
+
+
+def _statement_kind(sql: str) -> str:
+    return sql.lstrip().split(None, 1)[0].lower() if sql.strip() else "unknown"
+
+
+class _TimedExecute:
+    """Awaitable and async context manager, like aiosqlite's execute() result."""
+
+    def __init__(self, coro, timings, kind):
+        self.coro = coro
+        self.timings = timings
+        self.kind = kind
+        self.cursor = None
+
+    async def _run(self):
+        start = time.perf_counter()
+        try:
+            cursor = await self.coro
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings.add("sql", elapsed)
+            observe("sql_statement_seconds", elapsed, statement=self.kind)
+        return TimedCursor(cursor, self.timings)
+
+    def __await__(self):
+        return self._run().__await__()
+
+    async def __aenter__(self):
+        self.cursor = await self._run()
+        return self.cursor
+
+    async def __aexit__(self, *exc):
+        await self.cursor.close()
+
+
+class TimedCursor:
+    def __init__(self, cursor, timings):
+        self._cursor = cursor
+        self._timings = timings
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def _fetch(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return await fetch(*args)
+        finally:
+            self._timings.add("sql", time.perf_counter() - start)
+
+    async def fetchone(self):
+        return await self._fetch(self._cursor.fetchone)
+
+    async def fetchmany(self, size=None):
+        return await self._fetch(self._cursor.fetchmany, *(() if size is None else (size,)))
+
+    async def fetchall(self):
+        return await self._fetch(self._cursor.fetchall)
+
+    def __aiter__(self):
+        return self._cursor.__aiter__()
+
+
+class TimedConnection:
+    """aiosqlite connection proxy that times statements into the current request."""
+
+    def __init__(self, db, timings):
+        self._db = db
+        self._timings = timings
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def execute(self, sql, parameters=None):
+        return _TimedExecute(self._db.execute(sql, parameters), self._timings, _statement_kind(sql))
+
+    def executemany(self, sql, parameters):
+        return _TimedExecute(self._db.executemany(sql, parameters), self._timings, _statement_kind(sql))
+
+    async def commit(self):
+        with _Phase(self._timings, "sql"):
+            await self._db.commit()
+
+
+def wrap_connection(db):
+    timings = _current.get()
+    return db if timings is None else TimedConnection(db, timings)
+
+
+class TimedRoute(APIRoute):
+    """Records when the endpoint returned, so the rest of the handler counts as serialization."""
+
+    def get_route_handler(self):
+        if not REQUEST_TIMING_ENABLED:
+            return super().get_route_handler()
+
+        call = self.dependant.call
+        if asyncio.iscoroutinefunction(call):
+            @wraps(call)
+            async def endpoint(*args, **kwargs):
+                try:
+                    return await call(*args, **kwargs)
+                finally:
+                    _mark_endpoint_done()
+        else:
+            @wraps(call)
+            def endpoint(*args, **kwargs):
+                try:
+                    return call(*args, **kwargs)
+                finally:
+                    _mark_endpoint_done()
+        self.dependant.call = endpoint
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            response = await handler(request)
+            timings = _current.get()
+            if timings is not None and timings.endpoint_done is not None:
+                timings.add("serialize", time.perf_counter() - timings.endpoint_done)
+            return response
+
+        return timed_handler
+
+
+def _mark_endpoint_done():
+    timings = _current.get()
+    if timings is not None:
+        timings.endpoint_done = time.perf_counter()
+
+
+class TimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not REQUEST_TIMING_ENABLED or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = (b"server-timing", timings.header().encode("latin-1"))
+                message["headers"] = [*message.get("headers", []), header]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            observe("http_request_duration_seconds", time.perf_counter() - timings.start,
+                    method=scope["method"], route=path, status=str(status))
+            for phase, (seconds, _) in timings.phases.items():
+                observe("request_phase_seconds", seconds, phase=phase)
@@ -4,7 +4,7 @@ import { useState, useEffect } from "react";
 import { useRouter } from "next/navigation";
 import { BarChart3 } from "lucide-react";
 import api from "@/lib/api";
-import { GenreData, TimelineData, RevenueData, RatingData } from "@/lib/types";
+import { AnalyticsSummary, GenreData, TimelineData, RevenueData, RatingData } from "@/lib/types";
 import { useAuth } from "@/lib/auth";
 import {
   BarChart,
@@ -40,16 +40,11 @@ export default function AnalyticsPage() {
 
   const fetchAnalytics = async () => {
     try {
-      const [genreRes, timeRes, revRes, ratingRes] = await Promise.all([
-        api.get("/api/analytics/genres"),
-        api.get("/api/analytics/timeline"),
-        api.get("/api/analytics/revenue"),
-        api.get("/api/analytics/ratings"),
-      ]);
-      setGenres(genreRes.data.data);
-      setTimeline(timeRes.data.data);
-      setRevenue(revRes.data.data);
-      setRatings(ratingRes.data.data);
+      const res = await api.get<AnalyticsSummary>("/api/analytics/summary");
+      setGenres(res.data.genres);
+      setTimeline(res.data.timeline);
+      setRevenue(res.data.revenue);
+      setRatings(res.data.ratings);
     } catch {}
     setLoading(false);
   };
@@ -84,3 +84,10 @@ export interface RatingData {
   rating: number;
   count: number;
 }
+
+export interface AnalyticsSummary {
+  genres: GenreData[];
+  timeline: TimelineData[];
+  revenue: RevenueData[];
+  ratings: RatingData[];
+}